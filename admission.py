@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Admission control for conversions
+Each upload is weighed by its sheet's row count, read from the worksheet metadata before
+anything is loaded (sheet_columns.sheet_extent), and converted only while the rows being
+converted by all gunicorn workers stay within a budget: a weighted semaphore kept in
+<state_dir>/tickets.json under flock. Uploads that do not fit wait in a queue of bounded
+length; when it is full (or a wait times out) they are rejected with a Retry-After hint
+estimated from the measured conversion speed.
+
+Large conversions are admitted in arrival order. Small ones (up to small_cost rows) skip
+the queue whenever they fit; while a large one waits, they only use a reserve of
+small_slots * small_cost rows, which large conversions never count on, so neither kind
+can starve the other.
+"""
+
+import contextlib
+import fcntl
+import json
+import math
+import os
+import tempfile
+import time
+import uuid
+
+from sheet_columns import sheet_extent
+
+DEFAULT_BUDGET_ROWS = 200000
+DEFAULT_SMALL_ROWS = 2000
+DEFAULT_SMALL_SLOTS = 4
+DEFAULT_MAX_QUEUE = 16
+# .xls workbooks are weighed by size (bytes per row)
+XLS_BYTES_PER_ROW = 150
+# Conversion speed assumed for Retry-After until one has been measured
+DEFAULT_SECONDS_PER_ROW = 0.0001
+RETRY_AFTER_MAX = 300
+POLL_INTERVAL = 0.2
+
+STATE_FILE = 'tickets.json'
+LOCK_FILE = 'tickets.lock'
+
+
+class AdmissionRejected(Exception):
+    """No capacity for a conversion: the queue is full or the wait timed out"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_cost(stream, filename):
+    """Estimated rows of an uploaded workbook, without loading it; the stream is left at its start"""
+    try:
+        if filename.lower().endswith('.xlsx'):
+            rows, _ = sheet_extent(stream)
+            return rows
+    except Exception:
+        # Unreadable here: the conversion reports the error, weigh it by size meanwhile
+        pass
+    finally:
+        stream.seek(0)
+    stream.seek(0, os.SEEK_END)
+    rows = max(1, stream.tell() // XLS_BYTES_PER_ROW)
+    stream.seek(0)
+    return rows
+
+
+def process_started(pid):
+    """Start time of a running process (clock ticks since boot, from /proc/<pid>/stat), so a
+    pid reused after a restart is not taken for the process that held a ticket. '' where /proc
+    is unavailable but the process exists, None if it is not running."""
+    try:
+        with open(f'/proc/{pid}/stat', encoding='ascii', errors='replace') as f:
+            # Fields after the command name, which may itself contain ')': starttime is field 22
+            return f.read().rsplit(')', 1)[1].split()[19]
+    except FileNotFoundError:
+        if os.path.isdir('/proc/self'):
+            return None
+    except (OSError, IndexError):
+        pass
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    except PermissionError:
+        pass
+    return ''
+
+
+def _alive(ticket):
+    started = process_started(ticket['pid'])
+    return started is not None and started == ticket.get('started')
+
+
+class Ticket:
+    """A conversion's place in the budget: waiting until wait() returns, then running until release()"""
+
+    def __init__(self, controller, ticket_id, cost, small, admitted):
+        self.controller = controller
+        self.id = ticket_id
+        self.cost = cost
+        self.small = small
+        self.admitted = admitted
+        self.waited = 0.0
+        self._started = time.monotonic()
+        self._released = False
+
+    def wait(self, timeout=None):
+        """Block until admitted. Raises AdmissionRejected (and leaves the queue) after timeout seconds."""
+        while not self.admitted:
+            if timeout is not None and time.monotonic() - self._started > timeout:
+                retry_after = self.controller._leave(self)
+                raise AdmissionRejected('Server busy, please retry later', retry_after)
+            time.sleep(POLL_INTERVAL)
+            self.admitted = self.controller._poll(self)
+            if self.admitted:
+                self.waited = time.monotonic() - self._started
+                self._started = time.monotonic()
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.controller._leave(self, time.monotonic() - self._started if self.admitted else None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    """Weighted semaphore over converted rows, shared by every process using state_dir"""
+
+    def __init__(self, state_dir, budget=DEFAULT_BUDGET_ROWS, small_cost=DEFAULT_SMALL_ROWS,
+                 small_slots=DEFAULT_SMALL_SLOTS, max_queue=DEFAULT_MAX_QUEUE):
+        self.state_dir = state_dir
+        self.budget = budget
+        self.small_cost = small_cost
+        self.small_reserve = min(small_slots * small_cost, budget // 2)
+        self.max_queue = max_queue
+        os.makedirs(state_dir, exist_ok=True)
+
+    @contextlib.contextmanager
+    def _state(self):
+        """The shared state, locked; changes are written back on exit"""
+        with open(os.path.join(self.state_dir, LOCK_FILE), 'a+') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(os.path.join(self.state_dir, STATE_FILE), encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = {}
+            # Tickets of exited processes (a killed worker, or any before a restart, even if
+            # its pid is in use again) no longer hold capacity
+            state['tickets'] = [t for t in state.get('tickets', []) if _alive(t)]
+            yield state
+            fd, staging = tempfile.mkstemp(prefix='.staging-', dir=self.state_dir)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(staging, os.path.join(self.state_dir, STATE_FILE))
+
+    def _fits(self, tickets, ticket):
+        running = [t for t in tickets if t['state'] == 'running']
+        used = sum(t['cost'] for t in running)
+        if running and used + ticket['cost'] > self.budget:
+            return False
+        waiting_large = [t for t in tickets if t['state'] == 'waiting' and not t['small'] and t['id'] != ticket['id']]
+        if ticket['small']:
+            # Ahead of large ones, within the reserve while one waits
+            return not waiting_large or sum(t['cost'] for t in running if t['small']) + ticket['cost'] <= self.small_reserve
+        # Large ones never take the reserve (enqueue caps a single one to fit), and go in arrival order
+        large_used = sum(t['cost'] for t in running if not t['small'])
+        if large_used + ticket['cost'] > self.budget - self.small_reserve:
+            return False
+        return all(t['since'] > ticket['since'] for t in waiting_large)
+
+    def _retry_after(self, state):
+        pending = sum(t['cost'] for t in state['tickets'])
+        seconds = state.get('seconds_per_row', DEFAULT_SECONDS_PER_ROW) * pending
+        return max(1, min(RETRY_AFTER_MAX, math.ceil(seconds)))
+
+    def enqueue(self, cost):
+        """A Ticket for a conversion of cost rows, admitted at once if it fits, else queued
+        (call wait()). Raises AdmissionRejected when the queue is full."""
+        small = cost <= self.small_cost
+        # A sheet above the budget runs alone (large ones never count on the small reserve)
+        cost = min(cost, self.budget - (0 if small else self.small_reserve))
+        ticket = {'id': uuid.uuid4().hex, 'pid': os.getpid(), 'started': process_started(os.getpid()),
+                  'cost': cost, 'small': small, 'state': 'waiting', 'since': time.time()}
+        with self._state() as state:
+            tickets = state['tickets']
+            admitted = self._fits(tickets, ticket)
+            if admitted:
+                ticket['state'] = 'running'
+            elif sum(1 for t in tickets if t['state'] == 'waiting') >= self.max_queue:
+                raise AdmissionRejected('Server busy, please retry later', self._retry_after(state))
+            tickets.append(ticket)
+        return Ticket(self, ticket['id'], cost, small, admitted)
+
+    def _poll(self, ticket):
+        with self._state() as state:
+            mine = next((t for t in state['tickets'] if t['id'] == ticket.id), None)
+            if mine is None:
+                # Dropped as if the process had exited (should not happen): queue again at the end
+                mine = {'id': ticket.id, 'pid': os.getpid(), 'started': process_started(os.getpid()),
+                        'cost': ticket.cost, 'small': ticket.small,
+                        'state': 'waiting', 'since': time.time()}
+                state['tickets'].append(mine)
+            if self._fits(state['tickets'], mine):
+                mine['state'] = 'running'
+                return True
+            return False
+
+    def _leave(self, ticket, seconds=None):
+        """Remove a ticket; seconds of a finished conversion update the measured speed. Returns Retry-After."""
+        with self._state() as state:
+            state['tickets'] = [t for t in state['tickets'] if t['id'] != ticket.id]
+            if seconds is not None and ticket.cost >= self.small_cost:
+                speed = seconds / ticket.cost
+                previous = state.get('seconds_per_row')
+                state['seconds_per_row'] = speed if previous is None else 0.8 * previous + 0.2 * speed
+            return self._retry_after(state)
+
+    def stats(self):
+        """Queue depth and capacity in use, for /admission"""
+        now = time.time()
+        with self._state() as state:
+            tickets = state['tickets']
+            running = [t for t in tickets if t['state'] == 'running']
+            waiting = [t for t in tickets if t['state'] == 'waiting']
+            return {
+                'budget_rows': self.budget,
+                'small_rows': self.small_cost,
+                'small_reserve_rows': self.small_reserve,
+                'running': len(running),
+                'running_rows': sum(t['cost'] for t in running),
+                'waiting': len(waiting),
+                'waiting_small': sum(1 for t in waiting if t['small']),
+                'waiting_rows': sum(t['cost'] for t in waiting),
+                'max_queue': self.max_queue,
+                'oldest_wait_seconds': round(max((now - t['since'] for t in waiting), default=0.0), 3),
+                'seconds_per_row': state.get('seconds_per_row', DEFAULT_SECONDS_PER_ROW),
+                'retry_after': self._retry_after(state)
+            }
@@ -4,28 +4,202 @@ Flask Web Application for PRD QC Table Transformation
 Upload Excel file and display results in a table for copy-paste
 """
 
-from flask import Flask, request, render_template, jsonify, send_file
-import pandas as pd
+from flask import (Flask, Request, request, render_template, jsonify, send_file, Response, stream_with_context,
+                   g)
+import numpy as np
 import os
+import io
+import csv
 import json
+import shutil
+import time
+import zipfile
+from urllib.parse import quote
 from werkzeug.utils import secure_filename
-from transform_prd_to_template import PRDTableTransformer
+from transform_prd_to_template import PRDTableTransformer, TRANSFORMER_VERSION
 import tempfile
 from datetime import datetime
-from utils_validate import validate_image_jpg, validate_question_intent_pattern
+from utils_validate import OutputRowValidator, TEXT_OBJECT_COLUMNS, lint_workbook
+from output_writers import (OUTPUT_COLUMNS, is_missing, write_excel_stream, collect_output_stats, iter_json_bundle,
+                            iter_ndjson)
+from conversion_cache import (ConversionCache, ArtifactIndex, stream_sha256, DEFAULT_MAX_BYTES, DEFAULT_MAX_AGE,
+                              DEFAULT_REAP_INTERVAL)
+from turn_index import TurnIndexStore, convert_incremental
+from job_queue import Job, JobQueue, BATCH_STAGES
+from batch_convert import archive_members, convert_archive
+from admission import (AdmissionController, AdmissionRejected, estimate_cost, DEFAULT_BUDGET_ROWS, DEFAULT_SMALL_ROWS,
+                       DEFAULT_MAX_QUEUE)
+from metrics import Metrics
+from text_objects import JSON_PROFILES, DEFAULT_JSON_PROFILE
+
+class SpooledUploadRequest(Request):
+    """Uploaded files stay in memory up to UPLOAD_SPOOL_MAX_BYTES and spill to a temp file above it"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=app.config['UPLOAD_SPOOL_MAX_BYTES'], mode='rb+')
 
 app = Flask(__name__)
+app.request_class = SpooledUploadRequest
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-app.config['UPLOAD_FOLDER'] = 'uploads'
+# Absolute, so every store below stays put whatever the working directory is later
+app.config['UPLOAD_FOLDER'] = os.path.abspath('uploads')
+# Uploads up to this size are converted straight from memory (default: the whole 16MB limit)
+app.config['UPLOAD_SPOOL_MAX_BYTES'] = int(os.environ.get('UPLOAD_SPOOL_MAX_BYTES', 16 * 1024 * 1024))
+
+app.config['CACHE_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], '.cache')
+app.config['CACHE_MAX_BYTES'] = int(os.environ.get('CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+app.config['CACHE_MAX_AGE'] = int(os.environ.get('CACHE_MAX_AGE', DEFAULT_MAX_AGE))
+# Conversions that failed validation are only kept this long (seconds)
+app.config['CACHE_FAILED_TTL'] = int(os.environ.get('CACHE_FAILED_TTL', 3600))
+# Seconds between background evictions of expired entries (0 = only when storing)
+app.config['CACHE_REAP_INTERVAL'] = int(os.environ.get('CACHE_REAP_INTERVAL', DEFAULT_REAP_INTERVAL))
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+# /upload-batch: zip size limit (only that route), workbooks per zip, batches at a time, processes per batch
+app.config['BATCH_MAX_CONTENT_LENGTH'] = int(os.environ.get('BATCH_MAX_CONTENT_LENGTH', 512 * 1024 * 1024))
+app.config['BATCH_MAX_FILES'] = int(os.environ.get('BATCH_MAX_FILES', 500))
+app.config['BATCH_JOBS'] = int(os.environ.get('BATCH_JOBS', 1))
+app.config['BATCH_WORKERS'] = int(os.environ.get('BATCH_WORKERS', 2))
+app.config['BATCH_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], '.batches')
+# Admission control: sheet rows converted at once (all workers), rows up to which an upload is
+# small (skips the queue), uploads waiting at most, seconds a ?sync=1 upload waits before 429
+app.config['ADMISSION_BUDGET_ROWS'] = int(os.environ.get('ADMISSION_BUDGET_ROWS', DEFAULT_BUDGET_ROWS))
+app.config['ADMISSION_SMALL_ROWS'] = int(os.environ.get('ADMISSION_SMALL_ROWS', DEFAULT_SMALL_ROWS))
+app.config['ADMISSION_MAX_QUEUE'] = int(os.environ.get('ADMISSION_MAX_QUEUE', DEFAULT_MAX_QUEUE))
+app.config['ADMISSION_MAX_WAIT'] = int(os.environ.get('ADMISSION_MAX_WAIT', 60))
+# Behind nginx: /download answers with X-Accel-Redirect to this internal location (aliased to
+# UPLOAD_FOLDER) and nginx sends the file; empty = Flask sends it
+app.config['DOWNLOAD_ACCEL_PREFIX'] = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '')
+# Behind Apache/lighttpd: X-Sendfile with the file's path instead of the body
+app.config['USE_X_SENDFILE'] = os.environ.get('DOWNLOAD_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
 
 # Create uploads directory if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+def record_eviction(reason, size):
+    metrics.inc('prd_storage_evictions_total', reason=reason)
+    metrics.inc('prd_storage_evicted_bytes_total', size, reason=reason)
+
+# Conversions of previously seen workbooks, keyed by content hash; also where every converted
+# artifact lives (rows, table pages, rendered Excel), with TTL and size-budget eviction
+conversion_cache = ConversionCache(
+    app.config['CACHE_FOLDER'],
+    max_bytes=app.config['CACHE_MAX_BYTES'],
+    max_age=app.config['CACHE_MAX_AGE'],
+    on_evict=record_eviction
+)
+# Download names handed out by /upload -> cache entries, for /download/<filename>
+artifact_index = ArtifactIndex(os.path.join(app.config['UPLOAD_FOLDER'], '.artifacts'),
+                               retention=app.config['CACHE_MAX_AGE'])
+# Per-document turn fingerprints for incremental re-conversion
+turn_index = TurnIndexStore(os.path.join(app.config['CACHE_FOLDER'], 'turns'),
+                            retention=app.config['CACHE_MAX_AGE'])
+# Background conversions for /upload (state shared on disk so any gunicorn worker can answer polls)
+job_queue = JobQueue(
+    max_workers=app.config['JOB_WORKERS'],
+    state_dir=os.path.join(app.config['UPLOAD_FOLDER'], '.jobs')
+)
+# Small uploads get their own threads, so they never wait behind large jobs queued for admission
+small_job_queue = JobQueue(
+    max_workers=app.config['JOB_WORKERS'],
+    state_dir=os.path.join(app.config['UPLOAD_FOLDER'], '.jobs')
+)
+# Budget of sheet rows converted at once, shared by all gunicorn workers
+admission = AdmissionController(
+    os.path.join(app.config['UPLOAD_FOLDER'], '.admission'),
+    budget=app.config['ADMISSION_BUDGET_ROWS'],
+    small_cost=app.config['ADMISSION_SMALL_ROWS'],
+    max_queue=app.config['ADMISSION_MAX_QUEUE']
+)
+# /upload-batch jobs, apart from single uploads so a long batch does not hold up /upload
+# (same state_dir, so /jobs/<id> answers for both)
+batch_queue = JobQueue(
+    max_workers=app.config['BATCH_JOBS'],
+    state_dir=os.path.join(app.config['UPLOAD_FOLDER'], '.jobs')
+)
+# Stage timings and counters for /metrics (summed over gunicorn workers)
+metrics = Metrics(state_dir=os.path.join(app.config['UPLOAD_FOLDER'], '.metrics'))
+
 ALLOWED_EXTENSIONS = {'xlsx', 'xls'}
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Output rows per chunk of a streamed /export response
+EXPORT_ROWS_PER_CHUNK = 500
+# Table rows in the /upload response (first page) and per /results page
+RESULTS_PAGE_SIZE = 100
+RESULTS_MAX_LIMIT = 1000
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def is_float_column(values):
+    """Numeric column that a DataFrame would hold as float64 (ints mixed with floats or missing values)"""
+    present = [v for v in values if not is_missing(v)]
+    if not present or len(present) == len(values) and not any(isinstance(v, (float, np.floating)) for v in present):
+        return False
+    return all(isinstance(v, (int, float, np.number)) and not isinstance(v, bool) for v in present)
+
+def build_table_data(output_rows, columns=OUTPUT_COLUMNS, json_profile=DEFAULT_JSON_PROFILE):
+    """Convert output rows to HTML table data without an intermediate DataFrame"""
+    float_columns = {col for col in columns if is_float_column([row.get(col) for row in output_rows])}
+    table_data = {
+        'columns': list(columns),
+        'rows': [],
+        # compact-view: the UI pretty-prints JSON cells on demand
+        'json_profile': json_profile
+    }
+    
+    for row in output_rows:
+        row_data = []
+        for col in columns:
+            value = row.get(col)
+            if is_missing(value):
+                row_data.append('')
+            elif col in TEXT_OBJECT_COLUMNS:
+                # Already serialized by the transformer in the requested JSON profile
+                row_data.append(str(value))
+            elif isinstance(value, str) and (value.startswith('[') or value.startswith('{')):
+                # Pretty format JSON
+                try:
+                    json_obj = json.loads(value)
+                    formatted_json = json.dumps(json_obj, ensure_ascii=False, indent=2)
+                    row_data.append(formatted_json)
+                except:
+                    row_data.append(str(value))
+            elif col in float_columns:
+                row_data.append(str(float(value)))
+            else:
+                row_data.append(str(value))
+        table_data['rows'].append(row_data)
+    
+    return table_data
+
+@app.before_request
+def start_cache_reaper():
+    # Per process: gunicorn workers are forked after the app is imported
+    conversion_cache.start_reaper(app.config['CACHE_REAP_INTERVAL'])
+
+@app.after_request
+def release_leases_on_close(response):
+    """Cache entries leased by the request are released once the response has been sent
+    (teardown runs before a streamed body is, so it cannot hold them)"""
+    leases = g.pop('leases', [])
+    if not leases:
+        return response
+    if response.direct_passthrough:
+        # send_file: the WSGI file wrapper closes only the file, so call_on_close callbacks
+        # would never run. The file is already open and stays readable if evicted now.
+        for entry in leases:
+            entry.release()
+    else:
+        response.call_on_close(lambda: [entry.release() for entry in leases])
+    return response
+
+@app.teardown_request
+def release_leases(exc=None):
+    # The request failed before a response held its leases
+    for entry in g.pop('leases', []):
+        entry.release()
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -40,77 +214,63 @@ def upload_file():
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
         
+        json_profile = request.form.get('json_profile') or request.args.get('json_profile') or DEFAULT_JSON_PROFILE
+        if json_profile not in JSON_PROFILES:
+            return jsonify({'error': f"Invalid json_profile, expected one of: {', '.join(JSON_PROFILES)}"}), 400
+        
         if file and allowed_file(file.filename):
-            # Save uploaded file
             filename = secure_filename(file.filename)
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            unique_filename = f"{timestamp}_{filename}"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(filepath)
+            output_filename = f"transformed_{timestamp}_{os.path.splitext(filename)[0]}.xlsx"
             
-            # Transform the file
-            transformer = PRDTableTransformer(filepath)
-            output_rows = transformer.transform()
-            
-            # Validate: Image link must end with .jpg
-            image_errors = validate_image_jpg(output_rows)
-            if image_errors:
-                return jsonify({'error': 'Validation failed', 'details': image_errors}), 400
-            
-            # Validate: Question-Intent pattern (mỗi nhóm sau Question phải có đủ fallback và silence)
-            pattern_result = validate_question_intent_pattern(output_rows)
-            if pattern_result and pattern_result.get('errors'):
-                return jsonify({'error': 'Validation failed', 'details': pattern_result['errors'], 'pattern_result': pattern_result}), 400
+            # Same bytes + same transformer version + same JSON profile -> reuse the stored conversion
+            cache_key = conversion_cache.key_for(stream_sha256(file.stream), json_profile)
+            metrics.inc('prd_upload_bytes_total', file.stream.tell())
+            file.stream.seek(0)
+            cached = conversion_cache.get(cache_key)
+            if cached:
+                metrics.inc('prd_conversions_total', result='cached')
+                metrics.flush()
+                job = Job()
+                job.artifacts.update(cache_key=cache_key, source=filename)
+                job = job_queue.add(job)
+                payload, status = upload_response(cached.validation, cached.result, output_filename, cached=True,
+                                                  job_id=job.id)
+                if status == 200:
+                    artifact_index.add(output_filename, cache_key, job.id)
+                job.finish(payload, status)
+                if wants_sync_response():
+                    return jsonify(payload), status
+                return job_accepted(job)
             
-            if not output_rows:
-                return jsonify({'error': 'No data to transform'}), 400
+            # Weighed by the sheet's row count from its metadata, before anything is loaded
+            cost = estimate_cost(file.stream, filename)
+            try:
+                ticket = admission.enqueue(cost)
+            except AdmissionRejected as e:
+                return admission_rejected(e, 'small' if cost <= admission.small_cost else 'large')
             
-            # Convert to DataFrame for easier handling
-            df = pd.DataFrame(output_rows)
+            # Convert from the spooled upload itself (no copy under uploads/)
+            upload = detach_upload_stream(file)
             
-            # Convert DataFrame to HTML table data
-            table_data = {
-                'columns': df.columns.tolist(),
-                'rows': []
-            }
+            if wants_sync_response():
+                try:
+                    wait_for_admission(ticket, app.config['ADMISSION_MAX_WAIT'])
+                except AdmissionRejected as e:
+                    upload.close()
+                    return admission_rejected(e, lane_of(ticket))
+                # Tracked as a job too, so /export/<job_id>.json works for sync uploads
+                with ticket:
+                    job = job_queue.run(convert_upload, upload, filename, output_filename, cache_key, json_profile)
+                if job.status == 'failed':
+                    return jsonify({'error': job.error}), 500
+                payload, status = job.result
+                return jsonify(payload), status
             
-            for _, row in df.iterrows():
-                row_data = []
-                for col in df.columns:
-                    value = row[col]
-                    if pd.isna(value):
-                        row_data.append('')
-                    elif isinstance(value, str) and (value.startswith('[') or value.startswith('{')):
-                        # Pretty format JSON
-                        try:
-                            json_obj = json.loads(value)
-                            formatted_json = json.dumps(json_obj, ensure_ascii=False, indent=2)
-                            row_data.append(formatted_json)
-                        except:
-                            row_data.append(str(value))
-                    else:
-                        row_data.append(str(value))
-                table_data['rows'].append(row_data)
-            
-            # Save output file for download
-            output_filename = f"transformed_{timestamp}_{filename}"
-            output_filepath = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
-            df.to_excel(output_filepath, index=False)
-            
-            # Clean up input file
-            os.remove(filepath)
-            
-            return jsonify({
-                'success': True,
-                'table_data': table_data,
-                'download_url': f'/download/{output_filename}',
-                'stats': {
-                    'total_rows': len(df),
-                    'question_rows': len(df[df['QUESTION'].notna()]),
-                    'intent_rows': len(df[df['INTENT_NAME'].notna()])
-                },
-                'pattern_result': pattern_result
-            })
+            # Convert in the background once admitted; the client polls /jobs/<id>
+            queue = small_job_queue if ticket.small else job_queue
+            job = queue.submit(convert_upload, upload, filename, output_filename, cache_key, json_profile, ticket=ticket)
+            return job_accepted(job)
         
         else:
             return jsonify({'error': 'Invalid file type. Please upload .xlsx or .xls files only.'}), 400
@@ -118,30 +278,553 @@ def upload_file():
     except Exception as e:
         return jsonify({'error': f'Error processing file: {str(e)}'}), 500
 
-@app.route('/download/<filename>')
-def download_file(filename):
+@app.route('/validate', methods=['POST'])
+def validate_file():
+    """Lint an uploaded workbook without converting it: reads only the columns the image and
+    fallback/silence checks need, writes no output. 200 with the report, valid or not."""
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({'error': 'No file selected'}), 400
+    file = request.files['file']
+    # Read with openpyxl (read-only), like the streaming engine: .xlsx only
+    if not file.filename.lower().endswith('.xlsx'):
+        return jsonify({'error': 'Invalid file type. Please upload .xlsx files only.'}), 400
+    
     try:
-        return send_file(
-            os.path.join(app.config['UPLOAD_FOLDER'], filename),
-            as_attachment=True,
-            download_name=filename
-        )
+        with metrics.timer('lint'):
+            report = lint_workbook(file.stream)
     except Exception as e:
-        return jsonify({'error': f'File not found: {str(e)}'}), 404
+        return jsonify({'error': f'Error reading file: {str(e)}'}), 400
+    metrics.inc('prd_lint_total', result='valid' if report['valid'] else 'invalid')
+    metrics.flush()
+    report['source'] = secure_filename(file.filename)
+    return jsonify(report)
+
+@app.route('/upload-batch', methods=['POST'])
+def upload_batch():
+    """Convert every workbook in an uploaded zip on a process pool. Streams the job's progress
+    as NDJSON (one job status per line, the last one with the result); ?sync=1 waits and
+    returns the result. The result zip holds the outputs and manifest.json."""
+    # Only this route takes archives above MAX_CONTENT_LENGTH; above UPLOAD_SPOOL_MAX_BYTES they spool to disk
+    request.max_content_length = app.config['BATCH_MAX_CONTENT_LENGTH']
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({'error': 'No file selected'}), 400
+    file = request.files['file']
+    if not file.filename.lower().endswith('.zip'):
+        return jsonify({'error': 'Invalid file type. Please upload a .zip of .xlsx or .xls files.'}), 400
+    json_profile = request.form.get('json_profile') or request.args.get('json_profile') or DEFAULT_JSON_PROFILE
+    if json_profile not in JSON_PROFILES:
+        return jsonify({'error': f"Invalid json_profile, expected one of: {', '.join(JSON_PROFILES)}"}), 400
+    
+    # Rejected from the zip directory alone, before anything is queued or extracted
+    archive = detach_upload_stream(file)
+    try:
+        with zipfile.ZipFile(archive) as listing:
+            members = archive_members(listing, app.config['BATCH_MAX_FILES'], app.config['MAX_CONTENT_LENGTH'])
+    except (zipfile.BadZipFile, ValueError) as e:
+        archive.close()
+        return jsonify({'error': f'Invalid archive: {str(e)}'}), 400
+    if not members:
+        archive.close()
+        return jsonify({'error': 'No .xlsx or .xls files in the archive'}), 400
+    metrics.inc('prd_upload_bytes_total', archive.seek(0, os.SEEK_END))
+    archive.seek(0)
+    
+    filename = secure_filename(file.filename)
+    if wants_sync_response():
+        job = batch_queue.run(convert_batch, archive, filename, json_profile, stages=BATCH_STAGES)
+        if job.status == 'failed':
+            return jsonify({'error': job.error}), 500
+        payload, status = job.result
+        return jsonify(payload), status
+    job = batch_queue.submit(convert_batch, archive, filename, json_profile, stages=BATCH_STAGES)
+    return Response(stream_with_context(iter_job_progress(job)), mimetype='application/x-ndjson')
+
+def iter_job_progress(job, interval=0.5):
+    """NDJSON lines of a job's status each time it changes, the last one with its result.
+    The job keeps running if the client disconnects (poll /jobs/<id> then)."""
+    last = None
+    while True:
+        status = job.to_dict()
+        status['status_url'] = f'/jobs/{job.id}'
+        finished = status['status'] in ('done', 'failed')
+        if finished and job.result:
+            status['result'] = job.result[0]
+        if status != last:
+            yield json.dumps(status, ensure_ascii=False) + '\n'
+            last = status
+        if finished:
+            return
+        time.sleep(interval)
+
+def convert_batch(job, archive, filename, json_profile=DEFAULT_JSON_PROFILE):
+    """Convert an uploaded zip (closed afterwards) in <BATCH_FOLDER>/<job id>/ and store the result
+    zip in the conversion cache (quota, TTL and leases like single conversions). Returns (payload, http_status)."""
+    prune_batches()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_filename = f"transformed_{timestamp}_{os.path.splitext(filename)[0]}.zip"
+    batch_dir = os.path.join(app.config['BATCH_FOLDER'], job.id)
+    os.makedirs(batch_dir, exist_ok=True)
+    job.artifacts.update(source=filename)
+    job.start_stage('convert_files')
+    try:
+        with metrics.timer('batch'):
+            output_zip = os.path.join(batch_dir, output_filename)
+            manifest = convert_archive(
+                archive, output_zip, batch_dir,
+                workers=app.config['BATCH_WORKERS'],
+                json_profile=json_profile,
+                max_files=app.config['BATCH_MAX_FILES'],
+                max_member_bytes=app.config['MAX_CONTENT_LENGTH'],
+                progress=lambda done, total, result: job.set_items(done, total)
+            )
+        for result in manifest['files']:
+            metrics.inc('prd_batch_files_total',
+                        result='error' if not result['success'] else 'valid' if result['valid'] else 'invalid')
+        archive_key = conversion_cache.key_for(job.id, 'batch')
+        conversion_cache.put_archive(archive_key, output_zip, manifest['summary'])
+    finally:
+        metrics.flush()
+        archive.close()
+        shutil.rmtree(batch_dir, ignore_errors=True)
+    
+    job.artifacts.update(batch_output=output_filename, archive_key=archive_key)
+    # Indexed like single conversions, so the link outlives the job record
+    artifact_index.add(output_filename, archive_key, job.id)
+    payload = dict(manifest, success=True, output_file=output_filename,
+                   download_url=f'/download/{job.id}/{output_filename}')
+    return payload, 200
+
+def prune_batches():
+    """Remove work dirs older than CACHE_MAX_AGE, left by batches that did not finish (e.g. a killed worker)"""
+    batch_root = app.config['BATCH_FOLDER']
+    if not os.path.isdir(batch_root):
+        return
+    now = time.time()
+    for name in os.listdir(batch_root):
+        path = os.path.join(batch_root, name)
+        try:
+            if now - os.path.getmtime(path) > app.config['CACHE_MAX_AGE']:
+                shutil.rmtree(path)
+        except OSError:
+            continue
+
+def lane_of(ticket):
+    return 'small' if ticket.small else 'large'
+
+def wait_for_admission(ticket, timeout=None):
+    """Block until the ticket fits in the conversion budget, recording the wait"""
+    ticket.wait(timeout)
+    metrics.inc('prd_admission_total', result='admitted', lane=lane_of(ticket))
+    metrics.observe('prd_admission_wait_seconds', ticket.waited, lane=lane_of(ticket))
+
+def admission_rejected(error, lane):
+    """429 with Retry-After and the queue depth"""
+    metrics.inc('prd_admission_total', result='rejected', lane=lane)
+    metrics.flush()
+    stats = admission.stats()
+    response = jsonify({
+        'error': str(error),
+        'retry_after': error.retry_after,
+        'waiting': stats['waiting'],
+        'running': stats['running']
+    })
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
+def wants_sync_response():
+    """?sync=1 keeps the old blocking behaviour (scripts, tests)"""
+    return request.args.get('sync', '').lower() in ('1', 'true', 'yes')
+
+def job_accepted(job):
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/jobs/{job.id}',
+        'result_url': f'/jobs/{job.id}/result'
+    }), 202
+
+def detach_upload_stream(file):
+    """Take over an uploaded file's stream so it outlives the request (Request.close() closes file streams)"""
+    stream = file.stream
+    file.stream = io.BytesIO()
+    return stream
+
+def convert_upload(job, upload, filename, output_filename, cache_key, json_profile=DEFAULT_JSON_PROFILE, ticket=None):
+    """Convert an uploaded stream (closed afterwards), reporting stages on job. Returns (payload, http_status).
+    ticket: admission ticket to wait for first (released afterwards)."""
+    try:
+        if ticket is not None:
+            job.start_stage('admission')
+            wait_for_admission(ticket)
+        # /export reads the output rows back from the conversion cache
+        job.artifacts.update(cache_key=cache_key, source=filename)
+        job.start_stage('read')
+        transformer = PRDTableTransformer(upload, json_profile=json_profile, source_name=filename)
+        # Image and Question-Intent checks run on the text objects while rows are built
+        validator = OutputRowValidator()
+        transformer.row_hooks.append(validator)
+        
+        job.start_stage('group')
+        transformer.analyze_data()
+        
+        # Transform the file, recomputing only turns changed since the last upload of this document
+        job.start_stage('build_json')
+        with metrics.timer('build_json'):
+            output_rows, turns, turn_diff = convert_incremental(transformer, turn_index.load(filename, json_profile))
+            turn_index.save(filename, turns, json_profile)
+        
+        # Validate: Image link must end with .jpg
+        job.start_stage('validate')
+        validation = {'image_errors': validator.image_errors, 'pattern_result': None}
+        if not validation['image_errors']:
+            # Validate: Question-Intent pattern (mỗi nhóm sau Question phải có đủ fallback và silence)
+            validation['pattern_result'] = validator.pattern_result()
+        
+        result = None
+        if not upload_validation_failed(validation) and output_rows:
+            # The Excel file is only rendered when downloaded; its cell stats are known from the rows
+            job.start_stage('build_table')
+            output_stats = collect_output_stats(output_rows)
+            
+            # Convert rows to HTML table data
+            with metrics.timer('build_table'):
+                table_data = build_table_data(output_rows, json_profile=json_profile)
+            table_rows = table_data['rows']
+            # Only the first page goes into the response; /results/<job_id> serves pages from the cache
+            table_data.update(rows=table_rows[:RESULTS_PAGE_SIZE], total_rows=len(table_rows))
+            result = {'table_data': table_data, 'stats': output_stats.to_dict()}
+        
+        conversion_cache.put(cache_key, output_rows, validation, result, table_rows=table_rows if result else None,
+                             ttl=None if result else app.config['CACHE_FAILED_TTL'])
+        record_conversion_metrics(transformer, validator, output_rows, validation, result)
+    except Exception:
+        metrics.inc('prd_conversions_total', result='error')
+        raise
+    finally:
+        metrics.flush()
+        upload.close()
+        if ticket is not None:
+            ticket.release()
+    
+    payload, status = upload_response(validation, result, output_filename, turn_diff=turn_diff, job_id=job.id)
+    if status == 200:
+        artifact_index.add(output_filename, cache_key, job.id)
+    return payload, status
+
+def record_conversion_metrics(transformer, validator, output_rows, validation, result):
+    """Stage timings and row counters of one finished conversion"""
+    metrics.observe_stages(transformer.stage_seconds)
+    metrics.observe_stages(validator.seconds)
+    
+    if upload_validation_failed(validation):
+        outcome = 'validation_failed'
+    elif result is None:
+        outcome = 'no_data'
+    else:
+        outcome = 'success'
+    metrics.inc('prd_conversions_total', result=outcome)
+    
+    question_rows = sum(1 for row in output_rows if not is_missing(row.get('QUESTION')))
+    metrics.inc('prd_input_rows_total', len(transformer.df))
+    metrics.inc('prd_question_groups_total', len(transformer.question_groups))
+    metrics.inc('prd_output_rows_total', question_rows, kind='question')
+    metrics.inc('prd_output_rows_total', len(output_rows) - question_rows, kind='intent')
+
+def upload_validation_failed(validation):
+    pattern_result = validation['pattern_result']
+    return bool(validation['image_errors'] or (pattern_result and pattern_result.get('errors')))
+
+def upload_response(validation, result, output_filename, cached=False, turn_diff=None, job_id=None):
+    """Build the /upload payload and status from validation results and the converted result"""
+    image_errors = validation['image_errors']
+    if image_errors:
+        return {'error': 'Validation failed', 'details': image_errors}, 400
+    
+    pattern_result = validation['pattern_result']
+    if pattern_result and pattern_result.get('errors'):
+        return {'error': 'Validation failed', 'details': pattern_result['errors'], 'pattern_result': pattern_result}, 400
+    
+    if result is None:
+        return {'error': 'No data to transform'}, 400
+    
+    return {
+        'success': True,
+        'table_data': result['table_data'],
+        'download_url': f'/download/{job_id}/{output_filename}' if job_id else f'/download/{output_filename}',
+        'export_url': f'/export/{job_id}.json' if job_id else None,
+        'results_url': f'/results/{job_id}' if job_id else None,
+        'tsv_url': f'/results/{job_id}.tsv' if job_id else None,
+        'stats': result['stats'],
+        'pattern_result': pattern_result,
+        'cached': cached,
+        'turn_diff': turn_diff
+    }, 200
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Per-stage progress of an upload job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """Result of a finished upload job (same body as the old synchronous /upload)"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status == 'failed':
+        return jsonify({'error': job.error}), 500
+    if job.status != 'done':
+        return jsonify(job.to_dict()), 202
+    payload, status = job.result
+    return jsonify(payload), status
+
+def finished_job_entry(job_id):
+    """(job, cache entry, None) for a successful finished job, else (job, None, error response)"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return None, None, (jsonify({'error': 'Job not found'}), 404)
+    if job.status == 'failed':
+        return job, None, (jsonify({'error': job.error}), 500)
+    if job.status != 'done':
+        return job, None, (jsonify(job.to_dict()), 202)
+    payload, status = job.result
+    if status != 200:
+        return job, None, (jsonify({'error': 'No results for an unsuccessful conversion', 'details': payload.get('error')}), 409)
+    
+    entry = leased_entry(job.artifacts.get('cache_key'))
+    if entry is None:
+        return job, None, (jsonify({'error': 'Results are no longer available, please upload the file again'}), 410)
+    return job, entry, None
+
+def leased_entry(cache_key):
+    """The cache entry of a key, leased until the request ends so eviction cannot delete files
+    the response still reads (None if missing or evicted)"""
+    entry = conversion_cache.acquire(cache_key) if cache_key else None
+    if entry is not None:
+        g.setdefault('leases', []).append(entry)
+    return entry
+
+def selected_columns(columns):
+    """Positions and names of ?columns=A,B (all columns by default). Raises ValueError for unknown names."""
+    requested = request.args.get('columns')
+    if not requested:
+        return list(range(len(columns))), list(columns)
+    names = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    return [columns.index(name) for name in names], names
+
+@app.route('/results/<job_id>')
+def job_results(job_id):
+    """One page of a finished job's table rows: ?offset=0&limit=100&columns=QUESTION,RESPONSE_1"""
+    job, entry, error = finished_job_entry(job_id)
+    if error:
+        return error
+    try:
+        offset = request.args.get('offset', '0')
+        limit = request.args.get('limit', str(RESULTS_PAGE_SIZE))
+        if not (offset.isdigit() and limit.isdigit() and 0 < int(limit) <= RESULTS_MAX_LIMIT):
+            raise ValueError(f"offset must be an integer >= 0 and limit an integer between 1 and {RESULTS_MAX_LIMIT}")
+        offset, limit = int(offset), int(limit)
+        positions, names = selected_columns(entry.result['table_data']['columns'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    rows = entry.read_table_rows(offset, limit)
+    return jsonify({
+        'job_id': job_id,
+        'columns': names,
+        'offset': offset,
+        'limit': limit,
+        'total_rows': entry.table_row_count,
+        'rows': [[row[i] for i in positions] for row in rows]
+    })
+
+@app.route('/results/<job_id>.tsv')
+def job_results_tsv(job_id):
+    """All table rows as tab-separated values with a header row, streamed (the UI's "Copy All")"""
+    job, entry, error = finished_job_entry(job_id)
+    if error:
+        return error
+    try:
+        positions, names = selected_columns(entry.result['table_data']['columns'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def generate():
+        # Cells with tabs, newlines or quotes are quoted, which is how Excel pastes multi-line cells
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter='\t', lineterminator='\n')
+        writer.writerow(names)
+        for number, row in enumerate(entry.iter_table_rows(), 1):
+            writer.writerow([row[i] for i in positions])
+            if number % EXPORT_ROWS_PER_CHUNK == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    return Response(stream_with_context(generate()), mimetype='text/tab-separated-values')
+
+@app.route('/export/<job_id>.<any(json, ndjson):export_format>')
+def export_job(job_id, export_format):
+    """Stream a finished job's output rows as a JSON bundle or NDJSON (chunked, no Excel involved)"""
+    job, entry, error = finished_job_entry(job_id)
+    if error:
+        return error
+    output_rows = entry.load_output_rows()
+    
+    source = job.artifacts.get('source', '')
+    download_name = f"transformed_{os.path.splitext(source)[0] or job_id}.{export_format}"
+    if export_format == 'ndjson':
+        chunks = iter_ndjson(output_rows, rows_per_chunk=EXPORT_ROWS_PER_CHUNK)
+        mimetype = 'application/x-ndjson'
+    else:
+        meta = {'source': source, 'transformer_version': TRANSFORMER_VERSION, 'job_id': job_id}
+        chunks = iter_json_bundle(output_rows, meta, rows_per_chunk=EXPORT_ROWS_PER_CHUNK)
+        mimetype = 'application/json'
+    # No Content-Length: sent with chunked transfer encoding
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{download_name}"'}
+    )
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Stage timings and counters in Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/storage')
+def storage_stats():
+    """Disk usage of converted artifacts (entries, bytes vs. budget, leases, evictions, free volume space)"""
+    return jsonify(conversion_cache.stats())
+
+@app.route('/admission')
+def admission_status():
+    """Conversion queue depth, rows being converted and the oldest wait, across all workers"""
+    return jsonify(admission.stats())
+
+@app.route('/healthz')
+def healthz():
+    """Cheap liveness check (no template rendering)"""
+    if not os.access(app.config['UPLOAD_FOLDER'], os.W_OK):
+        return jsonify({'status': 'error', 'error': 'Upload folder is not writable'}), 503
+    return jsonify({'status': 'ok'})
+
+@app.route('/download/<job_id>/<filename>')
+def download_job_output(job_id, filename):
+    """A finished job's Excel file, rendered from the cached output rows on the first download"""
+    job = job_queue.get(job_id)
+    if job is None:
+        # Job records are pruned before their artifacts expire: find the file by its name instead
+        record = artifact_index.resolve(filename)
+        if record is None or record.get('job_id') != job_id:
+            return jsonify({'error': 'Job not found'}), 404
+        return send_indexed_artifact(record)
+    if job.artifacts.get('batch_output'):
+        return download_batch_output(job)
+    job, entry, error = finished_job_entry(job_id)
+    if error:
+        return error
+    return send_output(entry, secure_filename(filename))
+
+def download_batch_output(job):
+    """The result zip of a finished /upload-batch job"""
+    if job.status == 'failed':
+        return jsonify({'error': job.error}), 500
+    if job.status != 'done':
+        return jsonify(job.to_dict()), 202
+    entry = leased_entry(job.artifacts.get('archive_key'))
+    if entry is None or entry.archive_path is None:
+        return jsonify({'error': 'Results are no longer available, please upload the archive again'}), 410
+    return send_stored_file(entry.archive_path, job.artifacts['batch_output'], 'application/zip')
+
+@app.route('/download/<filename>')
+def download_file(filename):
+    """A converted file by the name /upload returned, looked up in the artifact index (never a path)"""
+    record = artifact_index.resolve(filename)
+    if record is None:
+        return jsonify({'error': 'File not found'}), 404
+    return send_indexed_artifact(record)
+
+def send_indexed_artifact(record):
+    """The file an artifact index record names: a cached conversion, or a batch's result zip"""
+    entry = leased_entry(record['cache_key'])
+    if entry is None:
+        return jsonify({'error': 'Results are no longer available, please upload the file again'}), 410
+    if entry.archive_path is not None:
+        return send_stored_file(entry.archive_path, record['name'], 'application/zip')
+    return send_output(entry, secure_filename(record['name']))
+
+def send_output(entry, download_name):
+    """An entry's Excel file. Rendered from the output rows and stored on the first download; then
+    sent from disk with ETag/Last-Modified revalidation (304) and Range requests (206), or handed
+    to the front server with X-Accel-Redirect / X-Sendfile."""
+    output_path = entry.output_path
+    if output_path is None:
+        buffer = io.BytesIO()
+        with metrics.timer('write_xlsx'):
+            write_excel_stream(entry.load_output_rows(), buffer)
+        metrics.inc('prd_output_bytes_total', buffer.tell())
+        metrics.flush()
+        entry.store_output(buffer.getvalue())
+        output_path = entry.output_path
+        if output_path is None:
+            # Could not be stored (e.g. disk full): send the rendered bytes
+            buffer.seek(0)
+            return send_file(buffer, as_attachment=True, download_name=download_name, mimetype=XLSX_MIMETYPE)
+    return send_stored_file(output_path, download_name, XLSX_MIMETYPE)
+
+def send_stored_file(path, download_name, mimetype):
+    """A file under UPLOAD_FOLDER, with conditional and Range requests, or via X-Accel-Redirect / X-Sendfile"""
+    accel_prefix = app.config['DOWNLOAD_ACCEL_PREFIX']
+    if accel_prefix:
+        # nginx sends the file (and answers conditional and Range requests itself)
+        relative = os.path.relpath(path, app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(relative)
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+        return response
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=download_name,
+                     mimetype=mimetype, conditional=True)
 
 @app.route('/clear')
 def clear_files():
-    """Clean up old files"""
+    """Clean up converted files, except those still being downloaded"""
     try:
         upload_dir = app.config['UPLOAD_FOLDER']
         for filename in os.listdir(upload_dir):
             file_path = os.path.join(upload_dir, filename)
             if os.path.isfile(file_path):
                 os.remove(file_path)
-        return jsonify({'success': True, 'message': 'All files cleared'})
+        deleted, in_use = conversion_cache.clear()
+        deleted += clear_batches()
+        turn_index.clear()
+        metrics.flush()
+        message = 'All files cleared' if not in_use else f'Files cleared, {in_use} in use kept'
+        return jsonify({'success': True, 'message': message, 'deleted': deleted, 'in_use': in_use})
     except Exception as e:
         return jsonify({'error': f'Error clearing files: {str(e)}'}), 500
 
+def clear_batches():
+    """Remove the work dirs of batches that are not running (their results are cache entries). Returns how many were removed."""
+    batch_root = app.config['BATCH_FOLDER']
+    if not os.path.isdir(batch_root):
+        return 0
+    deleted = 0
+    for name in os.listdir(batch_root):
+        job = job_queue.get(name)
+        if job is not None and job.status in ('queued', 'running'):
+            continue
+        shutil.rmtree(os.path.join(batch_root, name), ignore_errors=True)
+        deleted += 1
+    return deleted
+
 def find_free_port():
     """Find a free port to run the server"""
     import socket
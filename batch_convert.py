@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Batch PRD QC Table Transformer
+Converts a directory (or glob) of PRD QC tables in parallel on a process pool.
+Each worker process imports pandas/openpyxl/the transformer once and reuses them for many files.
+
+Usage: python3 batch_convert.py INPUT_DIR_OR_GLOB [--output-dir DIR] [--workers N] [--format xlsx|json|ndjson]
+
+Exit code is non-zero only if at least one file failed to convert
+(validation errors are reported in the summary but do not fail the batch).
+
+convert_archive does the same for the workbooks inside a zip (the web app's /upload-batch):
+members are extracted only as workers free up to convert them, and the outputs are
+written to a result zip with a per-file validation manifest.
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import posixpath
+import shutil
+import sys
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
+from transform_prd_to_template import PRDTableTransformer, ENGINES, DEFAULT_ENGINE, silenced_output
+from text_objects import JSON_PROFILES, DEFAULT_JSON_PROFILE
+from output_writers import write_output_stream
+from utils_validate import OutputRowValidator
+
+INPUT_EXTENSIONS = ('.xlsx', '.xls')
+OUTPUT_FORMATS = {'xlsx': '.xlsx', 'json': '.json', 'ndjson': '.ndjson'}
+MANIFEST_NAME = 'manifest.json'
+
+
+def collect_input_files(source):
+    """Resolve a directory or glob pattern to a sorted list of workbook paths"""
+    if os.path.isdir(source):
+        pattern = os.path.join(source, '*')
+    else:
+        pattern = source
+    return sorted(
+        path for path in glob.glob(pattern)
+        if os.path.isfile(path)
+        and path.lower().endswith(INPUT_EXTENSIONS)
+        and not os.path.basename(path).startswith(('~$', 'transformed_'))
+    )
+
+
+def output_path_for(input_file, output_dir, output_format='xlsx'):
+    """transformed_<name>.<ext> inside output_dir"""
+    name = os.path.splitext(os.path.basename(input_file))[0]
+    return os.path.join(output_dir, f"transformed_{name}{OUTPUT_FORMATS[output_format]}")
+
+
+def convert_file(input_file, output_file, engine=DEFAULT_ENGINE, json_profile=DEFAULT_JSON_PROFILE):
+    """Convert one workbook and validate it. Runs inside a worker process; never raises."""
+    result = {
+        'input': input_file,
+        'output': output_file,
+        'success': False,
+        'error': None,
+        'total_rows': 0,
+        'question_rows': 0,
+        'intent_rows': 0,
+        'long_cells': [],
+        'validation_errors': [],
+        'seconds': 0.0
+    }
+    started = time.perf_counter()
+    try:
+        with silenced_output():
+            transformer = PRDTableTransformer(input_file, engine=engine, json_profile=json_profile)
+            validator = OutputRowValidator()
+            transformer.row_hooks.append(validator)
+            stats = write_output_stream(transformer.transform_iter(), output_file, meta=transformer.export_meta())
+            pattern_result = validator.pattern_result()
+
+        result.update(stats.to_dict())
+        result['validation_errors'] = validator.image_errors + pattern_result['errors']
+        result['success'] = True
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def run_batch(input_files, output_dir, workers=None, engine=DEFAULT_ENGINE, output_format='xlsx', progress=print,
+              json_profile=DEFAULT_JSON_PROFILE):
+    """Convert files on a process pool. Returns per-file results in input order."""
+    os.makedirs(output_dir, exist_ok=True)
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(convert_file, path, output_path_for(path, output_dir, output_format), engine, json_profile): path
+            for path in input_files
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results[futures[future]] = result
+            if progress:
+                status = "✓" if result['success'] else "✗"
+                detail = f"{result['total_rows']} rows" if result['success'] else result['error']
+                progress(f"[{done}/{len(input_files)}] {status} {result['input']} ({detail}, {result['seconds']}s)")
+    return [results[path] for path in input_files]
+
+
+def archive_members(archive, max_files=None, max_member_bytes=None):
+    """Workbook members of a zip, in archive order. Raises ValueError above the limits
+    (checked on the central directory, before anything is extracted)."""
+    members = [
+        info for info in archive.infolist()
+        if not info.is_dir()
+        and info.filename.lower().endswith(INPUT_EXTENSIONS)
+        and not info.filename.startswith('__MACOSX/')
+        and not posixpath.basename(info.filename).startswith(('~$', '._', 'transformed_'))
+    ]
+    if max_files and len(members) > max_files:
+        raise ValueError(f"Archive has {len(members)} workbooks, the limit is {max_files}")
+    for info in members:
+        if max_member_bytes and info.file_size > max_member_bytes:
+            raise ValueError(f"{info.filename} is {info.file_size} bytes uncompressed, the limit is {max_member_bytes}")
+    return members
+
+
+def archive_output_names(members):
+    """transformed_<name>.xlsx for each member, unique even for equal names in different folders"""
+    names = []
+    seen = set()
+    for info in members:
+        stem = posixpath.splitext(posixpath.basename(info.filename))[0]
+        name = f"transformed_{stem}.xlsx"
+        suffix = 2
+        while name in seen:
+            name = f"transformed_{stem}_{suffix}.xlsx"
+            suffix += 1
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def convert_archive(archive_file, output_zip, work_dir, workers=None, json_profile=DEFAULT_JSON_PROFILE,
+                    max_files=None, max_member_bytes=None, progress=None):
+    """Convert every workbook in a zip (path or seekable binary file) on a process pool and write
+    output_zip: transformed_<name>.xlsx for each file that converted and passed validation, plus
+    manifest.json with per-file results and the summary. Members are extracted to work_dir only
+    as workers free up (at most workers + 1 on disk at once), and outputs are added to the zip
+    as they finish, so neither archive is ever held in memory or unpacked whole.
+    progress(done, total, result) is called after each file. Returns the manifest."""
+    started = time.perf_counter()
+    inputs_dir = os.path.join(work_dir, 'inputs')
+    outputs_dir = os.path.join(work_dir, 'outputs')
+    os.makedirs(inputs_dir, exist_ok=True)
+    os.makedirs(outputs_dir, exist_ok=True)
+    results = {}
+    try:
+        with zipfile.ZipFile(archive_file) as archive:
+            members = archive_members(archive, max_files, max_member_bytes)
+            names = archive_output_names(members)
+            # forkserver: the web app has other threads running, which a forked child must not inherit
+            context = (multiprocessing.get_context('forkserver')
+                       if 'forkserver' in multiprocessing.get_all_start_methods() else None)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor, \
+                    zipfile.ZipFile(output_zip, 'w', zipfile.ZIP_DEFLATED) as output:
+                def collect(future):
+                    position = pending.pop(future)
+                    result = future.result()
+                    os.remove(result['input'])
+                    output_file = result['output']
+                    result.update(input=members[position].filename, output=None,
+                                  valid=result['success'] and not result['validation_errors'])
+                    if result['valid']:
+                        # Already compressed: stored as is
+                        output.write(output_file, names[position], compress_type=zipfile.ZIP_STORED)
+                        result['output'] = names[position]
+                    if os.path.exists(output_file):
+                        os.remove(output_file)
+                    results[position] = result
+                    if progress:
+                        progress(len(results), len(members), result)
+
+                # One member per worker on disk, plus one ready for the next free worker
+                in_flight = (workers or os.cpu_count() or 1) + 1
+                pending = {}
+                for position, info in enumerate(members):
+                    while len(pending) >= in_flight:
+                        for future in wait(pending, return_when=FIRST_COMPLETED).done:
+                            collect(future)
+                    # Files on disk are named by position, never by the member's own path
+                    input_file = os.path.join(inputs_dir, f"{position}{posixpath.splitext(info.filename)[1].lower()}")
+                    with archive.open(info) as source, open(input_file, 'wb') as target:
+                        shutil.copyfileobj(source, target)
+                    output_file = os.path.join(outputs_dir, f"{position}.xlsx")
+                    future = executor.submit(convert_file, input_file, output_file, json_profile=json_profile)
+                    pending[future] = position
+                for future in as_completed(list(pending)):
+                    collect(future)
+
+                files = [results[position] for position in range(len(members))]
+                summary = summarize(files)
+                summary['valid'] = sum(1 for r in files if r['valid'])
+                summary['seconds'] = round(time.perf_counter() - started, 3)
+                manifest = {'summary': summary, 'files': files}
+                output.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=2))
+    finally:
+        shutil.rmtree(inputs_dir, ignore_errors=True)
+        shutil.rmtree(outputs_dir, ignore_errors=True)
+    return manifest
+
+
+def summarize(results):
+    """Combined counts over all per-file results"""
+    converted = [r for r in results if r['success']]
+    return {
+        'files': len(results),
+        'succeeded': len(converted),
+        'failed': len(results) - len(converted),
+        'total_rows': sum(r['total_rows'] for r in converted),
+        'question_rows': sum(r['question_rows'] for r in converted),
+        'intent_rows': sum(r['intent_rows'] for r in converted),
+        'files_with_validation_errors': sum(1 for r in converted if r['validation_errors']),
+        'validation_errors': sum(len(r['validation_errors']) for r in converted)
+    }
+
+
+def print_summary(results, summary):
+    """Print failures, validation errors and the combined counts"""
+    failed = [r for r in results if not r['success']]
+    if failed:
+        print("\n=== FAILED FILES ===")
+        for r in failed:
+            print(f"✗ {r['input']}: {r['error']}")
+
+    invalid = [r for r in results if r['success'] and r['validation_errors']]
+    if invalid:
+        print("\n=== VALIDATION ERRORS ===")
+        for r in invalid:
+            print(f"{r['input']}: {len(r['validation_errors'])} error(s)")
+            for error in r['validation_errors']:
+                print(f"  - {error}")
+
+    print("\n=== BATCH SUMMARY ===")
+    print(f"Files: {summary['files']} (succeeded: {summary['succeeded']}, failed: {summary['failed']})")
+    print(f"Question rows: {summary['question_rows']}")
+    print(f"Intent rows: {summary['intent_rows']}")
+    print(f"Total rows: {summary['total_rows']}")
+    print(f"Validation errors: {summary['validation_errors']} in {summary['files_with_validation_errors']} file(s)")
+
+
+def main():
+    """Main function for command line usage"""
+    parser = argparse.ArgumentParser(description="Convert a directory or glob of PRD QC tables in parallel")
+    parser.add_argument('source', help="Directory of .xlsx files or a glob such as 'lessons/*.xlsx'")
+    parser.add_argument('--output-dir', default='transformed', help="Directory for converted files (default: transformed)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--engine', choices=ENGINES, default=DEFAULT_ENGINE,
+                        help=f"Grouping engine (default: {DEFAULT_ENGINE})")
+    parser.add_argument('--format', dest='output_format', choices=sorted(OUTPUT_FORMATS), default='xlsx',
+                        help="Output format (default: xlsx)")
+    parser.add_argument('--json-profile', choices=JSON_PROFILES,
+                        help=f"Layout of QUESTION/RESPONSE_1 JSON (default: {DEFAULT_JSON_PROFILE} for xlsx, compact for json/ndjson)")
+    parser.add_argument('--summary-json', help="Also write per-file results and the summary to this JSON file")
+    args = parser.parse_args()
+
+    input_files = collect_input_files(args.source)
+    if not input_files:
+        print(f"No input files found for: {args.source}")
+        sys.exit(1)
+
+    print(f"=== PRD QC TABLE BATCH TRANSFORMER ===")
+    print(f"Files: {len(input_files)}")
+    print(f"Output dir: {args.output_dir}")
+    print(f"Workers: {args.workers or os.cpu_count()}")
+
+    started = time.perf_counter()
+    results = run_batch(input_files, args.output_dir, args.workers, args.engine, args.output_format,
+                        json_profile=args.json_profile or ('compact' if args.output_format != 'xlsx' else DEFAULT_JSON_PROFILE))
+    summary = summarize(results)
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    print_summary(results, summary)
+    print(f"Elapsed: {summary['seconds']}s")
+
+    if args.summary_json:
+        with open(args.summary_json, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'files': results}, f, ensure_ascii=False, indent=2)
+
+    sys.exit(1 if summary['failed'] else 0)
+
+
+if __name__ == "__main__":
+    main()
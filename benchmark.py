@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the PRD QC table transformer
+Generates seeded synthetic workbooks (generate_prd_table.py) and times each stage at
+several sizes: reading, analyze_data, transform, save_output, both validators and the
+full /upload path through Flask's test client (first upload and cached re-upload).
+
+Usage:
+    python3 benchmark.py [--sizes 1k,10k,100k,1m] [--output benchmark_results.json]
+    python3 benchmark.py --sizes 1k,10k --baseline benchmark_baseline.json
+
+With --baseline, stages slower than the baseline by more than --tolerance are reported
+as regressions and the exit code is 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from conversion_cache import ConversionCache
+from generate_prd_table import generate_workbook
+from transform_prd_to_template import PRDTableTransformer, ENGINES, DEFAULT_ENGINE, TRANSFORMER_VERSION, silenced_output
+from turn_index import TurnIndexStore
+from utils_validate import validate_image_jpg, validate_question_intent_pattern
+
+SIZES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+DEFAULT_SIZES = '1k,10k,100k,1m'
+
+# Stage timings below this many seconds are too noisy to call a regression
+MIN_REGRESSION_SECONDS = 0.05
+
+
+def parse_sizes(value):
+    """'1k,10k' -> [('1k', 1000), ('10k', 10000)]; plain integers are accepted too"""
+    sizes = []
+    for name in value.split(','):
+        name = name.strip().lower()
+        if name:
+            sizes.append((name, SIZES[name] if name in SIZES else int(name)))
+    return sizes
+
+
+def timed(timings, stage, fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) with transformer output silenced, recording the elapsed seconds under stage"""
+    with silenced_output():
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        timings[stage] = time.perf_counter() - started
+    return result
+
+
+def bench_transformer(input_file, work_dir, engine=DEFAULT_ENGINE):
+    """One pass over the transformer stages. Returns (timings, input_row_count, output_row_count)."""
+    timings = {}
+    transformer = timed(timings, 'read', PRDTableTransformer, input_file, engine)
+    if engine != 'streaming':
+        timed(timings, 'analyze_data', transformer.analyze_data)
+    output_rows = timed(timings, 'transform', transformer.transform)
+    timed(timings, 'save_output', transformer.save_output, os.path.join(work_dir, 'benchmark_output.xlsx'))
+    timed(timings, 'validate_image_jpg', validate_image_jpg, output_rows)
+    timed(timings, 'validate_question_intent_pattern', validate_question_intent_pattern, output_rows)
+    input_rows = len(transformer.df) if transformer.df is not None else None
+    return timings, input_rows, len(output_rows)
+
+
+def bench_upload(client, input_file, upload_name):
+    """POST the workbook to /upload twice: a fresh conversion, then a cache hit"""
+    timings = {}
+    for stage in ('upload', 'upload_cached'):
+        with open(input_file, 'rb') as f:
+            data = {'file': (f, upload_name)}
+            response = timed(timings, stage, client.post, '/upload?sync=1', data=data,
+                             content_type='multipart/form-data')
+        if response.status_code != 200:
+            raise RuntimeError(f"/upload returned {response.status_code}: {response.get_json()}")
+    return timings
+
+
+def load_web_app(work_dir):
+    """Import the Flask app with its uploads/ (cache, jobs, metrics, admission...) and turn index inside work_dir"""
+    previous = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        import app as web_app
+    finally:
+        os.chdir(previous)
+    # Large sizes exceed the production request limit; the benchmark measures the conversion path
+    web_app.app.config['MAX_CONTENT_LENGTH'] = None
+    if web_app.app.config['UPLOAD_FOLDER'] != os.path.abspath(os.path.join(work_dir, 'uploads')):
+        raise RuntimeError(f"app was already imported with uploads in {web_app.app.config['UPLOAD_FOLDER']}")
+    web_app.turn_index = TurnIndexStore(os.path.join(work_dir, 'turns'), retention=web_app.app.config['CACHE_MAX_AGE'])
+    return web_app
+
+
+def reset_upload_cache(web_app, work_dir):
+    """Point the app at an empty conversion cache so the next upload converts from scratch"""
+    cache_dir = tempfile.mkdtemp(prefix='cache_', dir=work_dir)
+    web_app.conversion_cache = ConversionCache(cache_dir)
+
+
+def run_benchmarks(sizes, work_dir, engine=DEFAULT_ENGINE, repeat=1, seed=42, upload=True, progress=print):
+    """Benchmark every size; each stage keeps its best time over `repeat` runs"""
+    web_app = load_web_app(work_dir) if upload else None
+    client = web_app.app.test_client() if upload else None
+    results = {}
+    for name, rows in sizes:
+        input_file = os.path.join(work_dir, f"synthetic_{name}_seed{seed}.xlsx")
+        if not os.path.exists(input_file):
+            progress(f"Generating {name} ({rows} rows)...")
+            generate_workbook(input_file, rows=rows, seed=seed)
+
+        best = {}
+        for run in range(repeat):
+            timings, input_rows, output_rows = bench_transformer(input_file, work_dir, engine)
+            if client:
+                # Empty cache and a new document name (no turn index), so the first upload is a full conversion
+                reset_upload_cache(web_app, work_dir)
+                timings.update(bench_upload(client, input_file, f"run{run}_{os.path.basename(input_file)}"))
+            for stage, seconds in timings.items():
+                best[stage] = min(seconds, best.get(stage, seconds))
+
+        results[name] = {
+            'rows': input_rows,
+            'output_rows': output_rows,
+            'timings': {stage: round(seconds, 4) for stage, seconds in best.items()}
+        }
+        progress(f"{name}: " + ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in best.items()))
+    return results
+
+
+def compare(results, baseline, tolerance=0.2, min_seconds=MIN_REGRESSION_SECONDS):
+    """Stages slower than baseline by more than tolerance (and min_seconds). Returns a list of dicts."""
+    regressions = []
+    for size, result in results.items():
+        base_timings = baseline.get('results', {}).get(size, {}).get('timings', {})
+        for stage, seconds in result['timings'].items():
+            base = base_timings.get(stage)
+            if base is None:
+                continue
+            if seconds > base * (1 + tolerance) and seconds - base > min_seconds:
+                regressions.append({
+                    'size': size,
+                    'stage': stage,
+                    'baseline': base,
+                    'current': seconds,
+                    'ratio': round(seconds / base, 2) if base else None
+                })
+    return regressions
+
+
+def print_comparison(results, baseline):
+    """Print current vs baseline seconds for every stage"""
+    print("\n=== BASELINE COMPARISON ===")
+    for size, result in results.items():
+        base_timings = baseline.get('results', {}).get(size, {}).get('timings', {})
+        for stage, seconds in result['timings'].items():
+            base = base_timings.get(stage)
+            if base is None:
+                print(f"{size:>5} {stage:<34} {seconds:>9.3f}s  (no baseline)")
+            else:
+                ratio = seconds / base if base else float('inf')
+                print(f"{size:>5} {stage:<34} {seconds:>9.3f}s  baseline {base:.3f}s  x{ratio:.2f}")
+
+
+def main():
+    """Main function for command line usage"""
+    parser = argparse.ArgumentParser(description="Benchmark the PRD QC table transformer on synthetic workbooks")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f"Comma-separated sizes: {', '.join(SIZES)} or row counts (default: {DEFAULT_SIZES})")
+    parser.add_argument('--engine', choices=ENGINES, default=DEFAULT_ENGINE,
+                        help=f"Grouping engine (default: {DEFAULT_ENGINE})")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per size; the best time per stage is kept (default: 1)")
+    parser.add_argument('--seed', type=int, default=42, help="Generator seed (default: 42)")
+    parser.add_argument('--no-upload', action='store_true', help="Skip the /upload benchmarks")
+    parser.add_argument('--work-dir', help="Directory for generated workbooks and outputs (default: a temp dir)")
+    parser.add_argument('--output', default='benchmark_results.json', help="Results JSON file (default: benchmark_results.json)")
+    parser.add_argument('--baseline', help="Compare against this results JSON and fail on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed slowdown vs baseline before failing, as a fraction (default: 0.2)")
+    args = parser.parse_args()
+
+    sizes = parse_sizes(args.sizes)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='prd_benchmark_')
+    os.makedirs(work_dir, exist_ok=True)
+
+    print(f"=== PRD QC TABLE BENCHMARK ===")
+    print(f"Sizes: {', '.join(name for name, _ in sizes)}")
+    print(f"Engine: {args.engine}")
+    print(f"Work dir: {work_dir}")
+
+    results = run_benchmarks(sizes, work_dir, args.engine, args.repeat, args.seed, upload=not args.no_upload)
+    report = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'transformer_version': TRANSFORMER_VERSION,
+            'engine': args.engine,
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print_comparison(results, baseline)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) (tolerance {args.tolerance:.0%}):")
+            for r in regressions:
+                print(f"  - {r['size']} {r['stage']}: {r['baseline']:.3f}s -> {r['current']:.3f}s (x{r['ratio']})")
+            sys.exit(1)
+        print("\n✓ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
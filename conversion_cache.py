@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Content-addressed conversion cache
+Stores the result of converting an uploaded workbook under the SHA-256 of its bytes
+plus the transformer version, so re-uploading the same file skips parsing entirely.
+
+Each entry is a directory <cache_dir>/<key>/ holding:
+- entry.json        validation results, HTML table data and stats
+- output_rows.json  serialized output rows
+- output.xlsx       generated workbook (written on the first download of a successful conversion)
+- output.zip        result zip of an /upload-batch job (put_archive; such entries hold no output rows)
+- table_rows.ndjson HTML table rows, one JSON array per line (only for successful conversions)
+- table_rows.idx    byte offset of every line (uint64), so a page of rows is one seek + read
+- ttl               the entry's own time to live in seconds (only when it differs from max_age)
+- entry.lock        flock()ed shared by readers holding a lease, exclusively by eviction
+
+ArtifactIndex maps the download names handed out by /upload to their entries.
+
+Entries are evicted when unused for longer than their TTL and, above the size budget,
+least recently used first, by put() and by a background reaper thread (start_reaper).
+Entries leased by a reader (e.g. a /download still streaming) in any process are
+skipped, so they are never deleted from under it.
+"""
+
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from array import array
+
+from output_writers import json_default
+from transform_prd_to_template import TRANSFORMER_VERSION
+
+ENTRY_FILE = 'entry.json'
+ROWS_FILE = 'output_rows.json'
+OUTPUT_FILE = 'output.xlsx'
+ARCHIVE_FILE = 'output.zip'
+TABLE_FILE = 'table_rows.ndjson'
+TABLE_INDEX_FILE = 'table_rows.idx'
+TTL_FILE = 'ttl'
+LOCK_FILE = 'entry.lock'
+
+# Bump when the entry layout changes (part of the key, so older entries are never read)
+ENTRY_FORMAT = 2
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 512MB
+DEFAULT_MAX_AGE = 7 * 24 * 3600  # 7 days
+DEFAULT_REAP_INTERVAL = 300  # 5 minutes
+# Seconds between prunes of expired download names (on ArtifactIndex.add)
+INDEX_PRUNE_INTERVAL = 3600
+# Entry directory names (key_for digests)
+ENTRY_KEY_PATTERN = re.compile(r'[0-9a-f]{64}')
+# Staging dirs and half-deleted entries older than this are left over from crashed processes
+STALE_SECONDS = 3600
+
+
+def stream_sha256(stream, chunk_size=1024 * 1024):
+    """SHA-256 hex digest of a binary stream, read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Lease:
+    """Shared flock() on an entry's LOCK_FILE: while held, no process evicts the entry"""
+
+    def __init__(self, path, on_release=None):
+        self.path = path
+        self._fd = os.open(os.path.join(path, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        self._on_release = on_release
+        fcntl.flock(self._fd, fcntl.LOCK_SH)
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def release(self):
+        if self._fd is None:
+            return
+        os.close(self._fd)
+        self._fd = None
+        if self._on_release:
+            self._on_release(self.path)
+
+
+class CacheEntry:
+    """A cached conversion loaded from disk"""
+
+    def __init__(self, path, data, lease=None):
+        self.path = path
+        self.validation = data['validation']
+        self.result = data.get('result')
+        self.lease = lease
+
+    def release(self):
+        """Release the entry's lease (ConversionCache.acquire), if any"""
+        if self.lease:
+            self.lease.release()
+
+    @property
+    def output_path(self):
+        path = os.path.join(self.path, OUTPUT_FILE)
+        return path if os.path.exists(path) else None
+
+    @property
+    def archive_path(self):
+        path = os.path.join(self.path, ARCHIVE_FILE)
+        return path if os.path.exists(path) else None
+
+    def load_output_rows(self):
+        with open(os.path.join(self.path, ROWS_FILE), encoding='utf-8') as f:
+            return json.load(f)
+
+    @property
+    def table_row_count(self):
+        try:
+            return os.path.getsize(os.path.join(self.path, TABLE_INDEX_FILE)) // 8 - 1
+        except OSError:
+            return 0
+
+    def read_table_rows(self, offset=0, limit=None):
+        """Table rows [offset, offset + limit) without reading the others"""
+        count = self.table_row_count
+        end = count if limit is None else min(count, offset + limit)
+        if offset >= end:
+            return []
+        bounds = array('Q')
+        with open(os.path.join(self.path, TABLE_INDEX_FILE), 'rb') as f:
+            f.seek(offset * bounds.itemsize)
+            bounds.frombytes(f.read((end - offset + 1) * bounds.itemsize))
+        with open(os.path.join(self.path, TABLE_FILE), 'rb') as f:
+            f.seek(bounds[0])
+            data = f.read(bounds[-1] - bounds[0])
+        return [json.loads(line) for line in data.splitlines()]
+
+    def iter_table_rows(self):
+        """Every table row in order, read line by line"""
+        with open(os.path.join(self.path, TABLE_FILE), encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def store_output(self, data):
+        """Keep a rendered workbook next to the rows, so later downloads are served from disk"""
+        try:
+            fd, staging = tempfile.mkstemp(prefix='.staging-', dir=self.path)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(staging, os.path.join(self.path, OUTPUT_FILE))
+        except OSError:
+            # Entry evicted meanwhile; the download itself is already rendered
+            pass
+
+
+def write_table_rows(directory, table_rows):
+    """Write TABLE_FILE (one JSON array per line) and its TABLE_INDEX_FILE of line offsets"""
+    offsets = array('Q', [0])
+    with open(os.path.join(directory, TABLE_FILE), 'wb') as f:
+        for row in table_rows:
+            # json escapes \n and \r inside strings, so every record is one line
+            line = json.dumps(row, ensure_ascii=False, default=json_default).encode('utf-8') + b'\n'
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+    with open(os.path.join(directory, TABLE_INDEX_FILE), 'wb') as f:
+        offsets.tofile(f)
+
+
+class ConversionCache:
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE, version=TRANSFORMER_VERSION,
+                 on_evict=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # Default TTL: entries unused for longer are evicted
+        self.max_age = max_age
+        self.version = version
+        # Called as on_evict(reason, size_bytes) for each evicted entry, reason 'ttl', 'quota' or 'clear'
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+        # Leases held by this process: entry path -> count
+        self._leases = {}
+        self._leases_lock = threading.Lock()
+        self._evicted = {'entries': 0, 'bytes': 0}
+        self._reaper = None
+        self._reaper_pid = None
+        self._stop_reaper = threading.Event()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key_for(self, content_digest, *variant):
+        """Cache key from the content digest, transformer version and any output options"""
+        parts = [content_digest, self.version, f"entry{ENTRY_FORMAT}"] + [str(v) for v in variant]
+        return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the CacheEntry for key, or None. A hit refreshes the entry's LRU position."""
+        path = os.path.join(self.cache_dir, key)
+        entry_file = os.path.join(path, ENTRY_FILE)
+        try:
+            with open(entry_file, encoding='utf-8') as f:
+                data = json.load(f)
+            os.utime(entry_file)
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(path, data)
+
+    def acquire(self, key):
+        """Like get(), with the entry leased until entry.release(): it is not evicted (or cleared)
+        meanwhile, by this or any other process. None if there is no such entry."""
+        path = os.path.join(self.cache_dir, key)
+        try:
+            lease = Lease(path, on_release=self._released)
+        except OSError:
+            return None
+        with self._leases_lock:
+            self._leases[path] = self._leases.get(path, 0) + 1
+        # Evicted before the lease was taken: the lock file belongs to a deleted entry
+        entry = self.get(key)
+        if entry is None:
+            lease.release()
+            return None
+        entry.lease = lease
+        return entry
+
+    def _released(self, path):
+        with self._leases_lock:
+            count = self._leases.get(path, 0) - 1
+            if count > 0:
+                self._leases[path] = count
+            else:
+                self._leases.pop(path, None)
+
+    def put(self, key, output_rows, validation, result=None, output_file=None, table_rows=None, ttl=None):
+        """Store a conversion. Written to a temp dir and renamed, so readers never see partial entries.
+        ttl: seconds the entry may stay unused (default: max_age)."""
+        def write_files(staging):
+            with open(os.path.join(staging, ROWS_FILE), 'w', encoding='utf-8') as f:
+                json.dump(output_rows, f, ensure_ascii=False, default=json_default)
+            if output_file:
+                shutil.copyfile(output_file, os.path.join(staging, OUTPUT_FILE))
+            if table_rows is not None:
+                write_table_rows(staging, table_rows)
+
+        self._store(key, write_files, validation, result, ttl)
+
+    def put_archive(self, key, archive_file, result=None, ttl=None):
+        """Store a batch result zip, moved (not copied) into the entry; result is kept as entry.result.
+        Counted in the size budget, evicted and leased like a conversion."""
+        self._store(key, lambda staging: shutil.move(archive_file, os.path.join(staging, ARCHIVE_FILE)),
+                    None, result, ttl)
+
+    def _store(self, key, write_files, validation, result, ttl):
+        final_path = os.path.join(self.cache_dir, key)
+        if os.path.exists(final_path):
+            return
+        staging = tempfile.mkdtemp(prefix='.staging-', dir=self.cache_dir)
+        try:
+            write_files(staging)
+            if ttl is not None and ttl != self.max_age:
+                with open(os.path.join(staging, TTL_FILE), 'w') as f:
+                    f.write(str(ttl))
+            with open(os.path.join(staging, ENTRY_FILE), 'w', encoding='utf-8') as f:
+                json.dump({
+                    'key': key,
+                    'version': self.version,
+                    'created': time.time(),
+                    'validation': validation,
+                    'result': result
+                }, f, ensure_ascii=False, default=json_default)
+            os.rename(staging, final_path)
+        except OSError:
+            # Another request stored the same key first
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        """(path, size_bytes, last_used, ttl) for every complete entry"""
+        found = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            entry_file = os.path.join(path, ENTRY_FILE)
+            if name.startswith('.') or not os.path.isfile(entry_file):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+                found.append((path, size, os.path.getmtime(entry_file), self._entry_ttl(path)))
+            except OSError:
+                continue
+        return found
+
+    def _entry_ttl(self, path):
+        try:
+            with open(os.path.join(path, TTL_FILE)) as f:
+                return float(f.read())
+        except (OSError, ValueError):
+            return self.max_age
+
+    def _remove(self, path, size, reason):
+        """Delete an entry unless it is leased. Returns True if it was deleted."""
+        try:
+            fd = os.open(os.path.join(path, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError:
+            return False
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EACCES):
+                    return False
+                raise
+            # Hide the entry first, so acquire() after this point finds nothing
+            try:
+                os.remove(os.path.join(path, ENTRY_FILE))
+            except FileNotFoundError:
+                return False
+            shutil.rmtree(path, ignore_errors=True)
+        finally:
+            os.close(fd)
+        self._evicted['entries'] += 1
+        self._evicted['bytes'] += size
+        if self.on_evict:
+            self.on_evict(reason, size)
+        return True
+
+    def _remove_stale(self, now):
+        """Staging dirs and entries without ENTRY_FILE left behind by crashed or racing processes
+        (other directories, e.g. the turn index, are not the cache's)"""
+        for name in os.listdir(self.cache_dir):
+            if not (name.startswith('.staging-') or ENTRY_KEY_PATTERN.fullmatch(name)):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if (os.path.isdir(path) and not os.path.isfile(os.path.join(path, ENTRY_FILE))
+                        and now - os.path.getmtime(path) > STALE_SECONDS):
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue
+
+    def evict(self):
+        """Drop entries unused for longer than their TTL, then least recently used ones until
+        under max_bytes. Leased entries are kept. Returns the number of entries deleted."""
+        with self._lock:
+            now = time.time()
+            entries = sorted(self.entries(), key=lambda e: e[2])
+            total = sum(size for _, size, _, _ in entries)
+            removed = 0
+            for path, size, last_used, ttl in entries:
+                if now - last_used > ttl:
+                    reason = 'ttl'
+                elif total > self.max_bytes:
+                    reason = 'quota'
+                else:
+                    continue
+                if self._remove(path, size, reason):
+                    total -= size
+                    removed += 1
+            self._remove_stale(now)
+            return removed
+
+    def clear(self):
+        """Delete every entry that is not leased. Returns (deleted, kept_in_use)."""
+        with self._lock:
+            deleted = kept = 0
+            for path, size, _, _ in self.entries():
+                if self._remove(path, size, 'clear'):
+                    deleted += 1
+                else:
+                    kept += 1
+            return deleted, kept
+
+    def start_reaper(self, interval=DEFAULT_REAP_INTERVAL):
+        """Run evict() every interval seconds on a daemon thread (once per process, so it is
+        safe to call on every request: a forked worker starts its own)"""
+        if self._reaper_pid == os.getpid() or interval <= 0:
+            return
+        with self._lock:
+            if self._reaper_pid == os.getpid():
+                return
+            self._reaper_pid = os.getpid()
+            self._stop_reaper.clear()
+            self._reaper = threading.Thread(target=self._reap, args=(interval,), name='cache-reaper', daemon=True)
+            self._reaper.start()
+
+    def stop_reaper(self):
+        self._stop_reaper.set()
+
+    def _reap(self, interval):
+        while not self._stop_reaper.wait(interval):
+            try:
+                self.evict()
+            except OSError:
+                # Volume briefly unavailable; try again next round
+                continue
+
+    def stats(self):
+        """Disk usage of the cache, for sizing the volume"""
+        entries = self.entries()
+        now = time.time()
+        used = sum(size for _, size, _, _ in entries)
+        with self._leases_lock:
+            leased = sum(self._leases.values())
+        stats = {
+            'entries': len(entries),
+            'bytes': used,
+            'max_bytes': self.max_bytes,
+            'usage': round(used / self.max_bytes, 4) if self.max_bytes else None,
+            'max_age': self.max_age,
+            'oldest_unused_seconds': round(now - min(e[2] for e in entries), 1) if entries else None,
+            'leases': leased,
+            'evicted': dict(self._evicted),
+            'reaper': self._reaper_pid == os.getpid() and self._reaper is not None and self._reaper.is_alive()
+        }
+        try:
+            disk = shutil.disk_usage(self.cache_dir)
+            stats['volume'] = {'total_bytes': disk.total, 'free_bytes': disk.free}
+        except OSError:
+            pass
+        return stats
+
+
+class ArtifactIndex:
+    """Download names of converted artifacts -> cache key (and job id), shared on disk by all
+    processes as <index_dir>/<sha256(name)>.json. Names from a URL are looked up here and
+    never used as a filesystem path."""
+
+    def __init__(self, index_dir, retention=DEFAULT_MAX_AGE):
+        self.index_dir = index_dir
+        self.retention = retention
+        self._pruned = 0.0
+        os.makedirs(index_dir, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.index_dir, hashlib.sha256(name.encode('utf-8')).hexdigest() + '.json')
+
+    def add(self, name, cache_key, job_id=None):
+        fd, staging = tempfile.mkstemp(prefix='.staging-', dir=self.index_dir)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'name': name, 'cache_key': cache_key, 'job_id': job_id, 'created': time.time()}, f)
+        os.replace(staging, self._path(name))
+        if time.time() - self._pruned > INDEX_PRUNE_INTERVAL:
+            self.prune()
+
+    def resolve(self, name):
+        """{'name', 'cache_key', 'job_id', 'created'} of a download name, or None"""
+        try:
+            with open(self._path(name), encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record.get('name') != name or time.time() - record.get('created', 0) > self.retention:
+            return None
+        return record
+
+    def prune(self):
+        """Drop names older than retention (their cache entries are evicted by then)"""
+        now = self._pruned = time.time()
+        for name in os.listdir(self.index_dir):
+            path = os.path.join(self.index_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.retention:
+                    os.remove(path)
+            except OSError:
+                continue
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Synthetic PRD QC table generator
+Writes seeded, prd_qc_table-shaped workbooks of any size for benchmarks and load tests.
+
+Each turn is a question group followed by its intents (the last two are always Fallback
+and Silence, so the Question-Intent pattern is valid), each intent having several loops
+of one or more rows.
+
+Usage: python3 generate_prd_table.py OUTPUT.xlsx [--rows N | --question-groups N] [--seed N] ...
+"""
+
+import argparse
+import random
+
+from openpyxl import Workbook
+
+COLUMNS = [
+    'Section', 'Intent', 'User_Examples', 'Button', 'Loop', 'Seq', 'Text_Vietnamese', 'Text_English',
+    'Mood', 'Image', 'Audio', 'Voice_Speed', 'Servo_Name', 'Servo_Duration', 'Image_Listening',
+    'Audio_Listening', 'Intent_Description'
+]
+
+TEXTS = [
+    ("Xin chào cậu! Hôm nay chúng ta cùng khám phá sở thú nhé!", "Hello! Let's explore the zoo today!"),
+    ("Cậu có nhìn thấy con vật nào đang trốn không?", "Can you see any animal hiding?"),
+    ("Tuyệt vời! Cậu thật dũng cảm!", "Wonderful! You are so brave!"),
+    ("Không sao cả, chúng ta thử lại nhé.", "That's okay, let's try again."),
+    ("Con gấu nâu đang ngủ say trong hang.", "The brown bear is sleeping deeply in the cave."),
+    ("Cậu đếm được bao nhiêu con chim?", "How many birds can you count?"),
+    ("Tớ sẽ chờ cậu nhé!", "I'll wait for you!"),
+    ("Hmm... Cậu đang suy nghĩ à?", "Hmm... Are you thinking?"),
+]
+MOODS = ['Happy', 'Worry', 'Thinking_talk', 'Encouraging_talk', 'Excited_talk', 'Lovely', 'Confused']
+SERVOS = ['PLANNING', 'RAISE_BOTH_HOLD', 'RAISE_RIGHT_ARM', 'THINKING', 'CUTE', 'ADMIRING', 'TEASING']
+EXAMPLES = ['"Yes!", "Có!", "Đồng ý!"', '"Maybe...", "Có lẽ..."', '"No!", "Không!"', '"What animals?", "Con vật nào?"']
+
+
+def generate_rows(question_groups=100, intents_per_turn=6, loops_per_intent=2, rows_per_loop=1,
+                  question_rows=3, image_share=0.1, audio_share=0.1, mood_share=0.8, seed=42):
+    """Yield sheet rows (lists in COLUMNS order) for the given shape, reproducibly for a seed"""
+    rng = random.Random(seed)
+    intent_names = [f"Intent_{k}" for k in range(1, max(intents_per_turn - 2, 0) + 1)]
+    intent_names += ['Fallback', 'Silence'][:intents_per_turn]
+    media_no = 0
+
+    def row(section, intent, loop, seq, examples=None):
+        nonlocal media_no
+        media_no += 1
+        text_vi, text_en = rng.choice(TEXTS)
+        has_mood = rng.random() < mood_share
+        return [
+            section,
+            intent,
+            examples,
+            None,
+            loop,
+            seq,
+            text_vi,
+            text_en,
+            rng.choice(MOODS) if has_mood else None,
+            f"image_{media_no}.jpg" if rng.random() < image_share else None,
+            f"audio_{media_no}.mp3" if rng.random() < audio_share else None,
+            rng.choice([0.8, 0.9, 1.0]),
+            rng.choice(SERVOS) if has_mood else None,
+            rng.choice([1500, 2000, 2500, 3000]) if has_mood else None,
+            None,
+            None,
+            examples
+        ]
+
+    for group in range(1, question_groups + 1):
+        question_name = f"Question_{group}"
+        for seq in range(1, question_rows + 1):
+            yield row('Question', question_name, 1, seq)
+        for intent in intent_names:
+            examples = '[No response detected]' if intent == 'Silence' else rng.choice(EXAMPLES)
+            for loop in range(1, loops_per_intent + 1):
+                for seq in range(1, rows_per_loop + 1):
+                    yield row('Intent_Response', intent, loop, seq, examples)
+
+
+def rows_per_turn(intents_per_turn=6, loops_per_intent=2, rows_per_loop=1, question_rows=3):
+    return question_rows + intents_per_turn * loops_per_intent * rows_per_loop
+
+
+def question_groups_for(rows, **shape):
+    """Number of question groups giving about `rows` sheet rows"""
+    return max(1, round(rows / rows_per_turn(**shape)))
+
+
+def write_workbook(output_file, rows):
+    """Write sheet rows with a header to an .xlsx file (write-only, constant memory). Returns the row count."""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+    sheet.append(COLUMNS)
+    count = 0
+    for row in rows:
+        sheet.append(row)
+        count += 1
+    workbook.save(output_file)
+    return count
+
+
+def generate_workbook(output_file, rows=None, question_groups=None, **options):
+    """Generate a synthetic workbook of about `rows` rows (or exactly `question_groups` turns)"""
+    shape = {key: options[key] for key in ('intents_per_turn', 'loops_per_intent', 'rows_per_loop', 'question_rows')
+             if key in options}
+    if question_groups is None:
+        question_groups = question_groups_for(rows or 1000, **shape)
+    return write_workbook(output_file, generate_rows(question_groups=question_groups, **options))
+
+
+def main():
+    """Main function for command line usage"""
+    parser = argparse.ArgumentParser(description="Generate a synthetic prd_qc_table-shaped workbook")
+    parser.add_argument('output_file', help="Output .xlsx file")
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument('--rows', type=int, help="Approximate number of sheet rows (default: 1000)")
+    size.add_argument('--question-groups', type=int, help="Exact number of question groups (turns)")
+    parser.add_argument('--intents-per-turn', type=int, default=6, help="Intents per turn, incl. Fallback and Silence (default: 6)")
+    parser.add_argument('--loops-per-intent', type=int, default=2, help="Loops per intent (default: 2)")
+    parser.add_argument('--rows-per-loop', type=int, default=1, help="Rows per loop (default: 1)")
+    parser.add_argument('--question-rows', type=int, default=3, help="Rows per question group (default: 3)")
+    parser.add_argument('--image-share', type=float, default=0.1, help="Share of rows with an Image (default: 0.1)")
+    parser.add_argument('--audio-share', type=float, default=0.1, help="Share of rows with an Audio (default: 0.1)")
+    parser.add_argument('--mood-share', type=float, default=0.8, help="Share of rows with a Mood/servo (default: 0.8)")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed (default: 42)")
+    args = parser.parse_args()
+
+    count = generate_workbook(
+        args.output_file,
+        rows=args.rows,
+        question_groups=args.question_groups,
+        intents_per_turn=args.intents_per_turn,
+        loops_per_intent=args.loops_per_intent,
+        rows_per_loop=args.rows_per_loop,
+        question_rows=args.question_rows,
+        image_share=args.image_share,
+        audio_share=args.audio_share,
+        mood_share=args.mood_share,
+        seed=args.seed
+    )
+    print(f"✓ Wrote {count} rows to {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
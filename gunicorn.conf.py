@@ -0,0 +1,36 @@
+"""
+Gunicorn configuration for production serving
+Usage: gunicorn -c gunicorn.conf.py app:app
+
+The app (pandas, openpyxl, transformer) is imported once in the master with preload_app
+and shared copy-on-write by the forked workers. Every setting can be overridden through
+environment variables.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Conversions are CPU bound: a few processes, each with threads for polling/downloads
+workers = int(os.environ.get('GUNICORN_WORKERS', min(multiprocessing.cpu_count(), 4)))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Import pandas/openpyxl/transformer once in the master process
+preload_app = True
+
+# Large workbooks can take a while (sync uploads block the request)
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 300))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 60))
+keepalive = 5
+
+# Recycle workers after N requests (with jitter so they don't all restart together) to cap memory growth.
+# Jobs run on the worker's own threads and a recycle loses them, so N is far above the status
+# polls a long conversion makes
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
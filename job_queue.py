@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Local background job queue for conversions
+Runs conversion jobs on a thread pool (no external broker) and tracks per-stage
+progress so the web UI can poll instead of blocking on one long request.
+
+With a state_dir, job state is also written to <state_dir>/<job_id>.json so that
+any process (e.g. another gunicorn worker) can answer status polls. The state records
+the process running the job: a queued or running job whose process has exited (a
+recycled or killed worker) is reported as failed instead of running forever.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from admission import process_started
+from output_writers import json_default
+
+# Conversion stages, in order
+STAGES = ['admission', 'read', 'group', 'build_json', 'validate', 'build_table']
+# Stages of a /upload-batch job (its files are counted in Job.items)
+BATCH_STAGES = ['convert_files']
+
+ORPHANED_ERROR = 'The server process running this job exited, please upload the file again'
+
+STAGE_LABELS = {
+    'admission': 'Waiting for a free conversion slot',
+    'read': 'Reading workbook',
+    'group': 'Grouping questions and intents',
+    'build_json': 'Building JSON',
+    'validate': 'Validating',
+    'build_table': 'Preparing results table',
+    'convert_files': 'Converting files'
+}
+
+
+class Job:
+    """State of one queued conversion"""
+
+    def __init__(self, stages=STAGES, on_change=None):
+        self.id = uuid.uuid4().hex
+        self.status = 'queued'  # queued -> running -> done | failed
+        self.stage = None
+        self.stages = {name: {'status': 'pending', 'seconds': None} for name in stages}
+        self.created = time.time()
+        self.finished = None
+        self.error = None
+        self.result = None  # (payload, http_status)
+        # {'done', 'total'} of a job working through several files
+        self.items = None
+        # Internal references to the job's outputs (e.g. conversion cache key), not shown by to_dict
+        self.artifacts = {}
+        self._stage_started = None
+        self._lock = threading.RLock()
+        self.on_change = on_change
+
+    def _changed(self):
+        # Called with the lock held, so the saved state is never behind what this process reports
+        if self.on_change:
+            self.on_change(self)
+
+    def start_stage(self, name):
+        """Mark the previous stage done and the given stage running"""
+        with self._lock:
+            self._close_stage()
+            self.stage = name
+            self.stages[name]['status'] = 'running'
+            self._stage_started = time.perf_counter()
+            self._changed()
+
+    def _close_stage(self):
+        if self.stage and self.stages[self.stage]['status'] == 'running':
+            self.stages[self.stage]['status'] = 'done'
+            self.stages[self.stage]['seconds'] = round(time.perf_counter() - self._stage_started, 3)
+
+    def set_items(self, done, total):
+        with self._lock:
+            self.items = {'done': done, 'total': total}
+            self._changed()
+
+    def finish(self, payload, http_status=200):
+        with self._lock:
+            self._close_stage()
+            # Stages not reached (cache hit, early validation failure) are skipped
+            for info in self.stages.values():
+                if info['status'] == 'pending':
+                    info['status'] = 'skipped'
+            self.result = (payload, http_status)
+            self.status = 'done'
+            self.finished = time.time()
+            self._changed()
+
+    def fail(self, error):
+        with self._lock:
+            if self.stage:
+                self.stages[self.stage]['status'] = 'failed'
+            self.error = error
+            self.status = 'failed'
+            self.finished = time.time()
+            self._changed()
+
+    @property
+    def progress(self):
+        """Percent of stages completed or skipped"""
+        completed = sum(1 for info in self.stages.values() if info['status'] in ('done', 'skipped'))
+        if self.items and self.items['total'] and self.stage and self.stages[self.stage]['status'] == 'running':
+            # Part of the running stage
+            completed += self.items['done'] / self.items['total']
+        return round(100 * completed / len(self.stages))
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'id': self.id,
+                'status': self.status,
+                'stage': self.stage,
+                'stage_label': STAGE_LABELS.get(self.stage, self.stage),
+                'stages': [dict(name=name, **info) for name, info in self.stages.items()],
+                'progress': self.progress,
+                'items': self.items,
+                'error': self.error,
+                'created': self.created,
+                'finished': self.finished
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a (read-only) job from its saved state"""
+        job = cls(stages=[])
+        job.id = data['id']
+        job.status = data['status']
+        job.stage = data['stage']
+        job.stages = {info.pop('name'): info for info in data['stages']}
+        job.error = data['error']
+        job.created = data['created']
+        job.finished = data['finished']
+        job.result = tuple(data['result']) if data.get('result') else None
+        job.artifacts = data.get('artifacts') or {}
+        job.items = data.get('items')
+        return job
+
+
+def _owner():
+    """{'pid', 'started'} of this process, recorded with the jobs it runs"""
+    pid = os.getpid()
+    return {'pid': pid, 'started': process_started(pid)}
+
+
+def _owner_alive(owner):
+    # State saved without an owner is taken as alive
+    return not owner or process_started(owner['pid']) == owner.get('started')
+
+
+class JobQueue:
+    """Thread-pool backed job queue keeping finished jobs for retention seconds"""
+
+    def __init__(self, max_workers=2, retention=3600, state_dir=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='convert')
+        self.retention = retention
+        self.state_dir = state_dir
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._owner = None
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+
+    def new_job(self, stages=STAGES):
+        return Job(stages=stages, on_change=self._save if self.state_dir else None)
+
+    def submit(self, fn, *args, stages=STAGES, **kwargs):
+        """Queue fn(job, *args, **kwargs). fn returns (payload, http_status)."""
+        job = self.add(self.new_job(stages))
+        self.executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def run(self, fn, *args, stages=STAGES, **kwargs):
+        """Run fn(job, *args, **kwargs) in the calling thread (sync requests), tracked like a queued job"""
+        job = self.add(self.new_job(stages))
+        self._run(job, fn, args, kwargs)
+        return job
+
+    def add(self, job):
+        with self._lock:
+            self._prune()
+            self.jobs[job.id] = job
+        if self.state_dir:
+            job.on_change = self._save
+            self._save(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+        if job is None and self.state_dir:
+            job = self._load(job_id)
+        return job
+
+    def _state_path(self, job_id):
+        return os.path.join(self.state_dir, f"{job_id}.json")
+
+    def _save(self, job):
+        """Atomically write the job state (and result once finished)"""
+        data = job.to_dict()
+        data['result'] = job.result
+        data['artifacts'] = job.artifacts
+        if self._owner is None or self._owner['pid'] != os.getpid():
+            # Once per process (gunicorn forks workers after the queue is created)
+            self._owner = _owner()
+        data['owner'] = self._owner
+        fd, staging = tempfile.mkstemp(prefix='.staging-', dir=self.state_dir)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, default=json_default)
+        os.replace(staging, self._state_path(job.id))
+
+    def _load(self, job_id):
+        if not all(c in '0123456789abcdef' for c in job_id):
+            return None
+        try:
+            with open(self._state_path(job_id), encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        job = Job.from_dict(data)
+        if job.status in ('queued', 'running') and not _owner_alive(data.get('owner')):
+            # Lost with its process: failed for every poller from now on
+            job.fail(ORPHANED_ERROR)
+            self._save(job)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        with job._lock:
+            job.status = 'running'
+            job._changed()
+        try:
+            payload, http_status = fn(job, *args, **kwargs)
+            job.finish(payload, http_status)
+        except Exception as e:
+            job.fail(f'Error processing file: {str(e)}')
+
+    def _prune(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished and now - job.finished > self.retention]
+        for job_id in expired:
+            del self.jobs[job_id]
+        if self.state_dir:
+            # State files of every process, including workers that have since exited
+            for name in os.listdir(self.state_dir):
+                path = os.path.join(self.state_dir, name)
+                try:
+                    if now - os.path.getmtime(path) > self.retention:
+                        os.remove(path)
+                except OSError:
+                    continue
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {status: statuses.count(status) for status in ('queued', 'running', 'done', 'failed')}
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Conversion service metrics in Prometheus text format
+Counters and per-stage histograms kept in memory, without a metrics client dependency.
+
+With a state_dir, each process writes its values to <state_dir>/<pid>-<start>.json on
+flush() and render() sums the files of all processes, so any gunicorn worker can answer
+/metrics. Files of exited processes are folded into exited.json to keep counters monotonic.
+"""
+
+import contextlib
+import fcntl
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+# Histogram buckets (seconds) for conversion stages, from tiny sheets to 1M-row workbooks
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# name -> (type, help)
+METRICS = {
+    'prd_stage_duration_seconds': ('histogram', 'Time spent in each conversion stage'),
+    'prd_conversions_total': ('counter', 'Conversions by result (success, validation_failed, no_data, error, cached)'),
+    'prd_input_rows_total': ('counter', 'Input sheet rows converted'),
+    'prd_question_groups_total': ('counter', 'Question groups (turns) converted'),
+    'prd_output_rows_total': ('counter', 'Output rows built, by kind (question, intent)'),
+    'prd_upload_bytes_total': ('counter', 'Bytes of uploaded workbooks'),
+    'prd_output_bytes_total': ('counter', 'Bytes of generated Excel files'),
+    'prd_lint_total': ('counter', 'Workbooks checked by /validate, by result (valid, invalid)'),
+    'prd_batch_files_total': ('counter', 'Workbooks converted by /upload-batch, by result (valid, invalid, error)'),
+    'prd_admission_total': ('counter', 'Conversions admitted or rejected (429) by admission control, by lane (small, large)'),
+    'prd_admission_wait_seconds': ('histogram', 'Time conversions waited for admission, by lane'),
+    'prd_storage_evictions_total': ('counter', 'Conversion cache entries evicted, by reason (ttl, quota, clear)'),
+    'prd_storage_evicted_bytes_total': ('counter', 'Bytes of evicted conversion cache entries, by reason'),
+}
+
+EXITED_FILE = 'exited.json'
+
+
+def _labels_key(labels):
+    return json.dumps(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key, extra=()):
+    pairs = [tuple(pair) for pair in json.loads(key)] + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metrics:
+    def __init__(self, state_dir=None, buckets=DEFAULT_BUCKETS):
+        self.state_dir = state_dir
+        self.buckets = tuple(buckets)
+        # counters: {name: {labels_key: value}}, histograms: {name: {labels_key: [bucket counts..., sum, count]}}
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_pid = None
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            key = _labels_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            values = series.setdefault(_labels_key(labels), [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """Observe the duration of the with-block as prd_stage_duration_seconds{stage=...}"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('prd_stage_duration_seconds', time.perf_counter() - started, stage=stage)
+
+    def observe_stages(self, stage_seconds):
+        """Record already measured {stage: seconds} (e.g. PRDTableTransformer.stage_seconds)"""
+        for stage, seconds in stage_seconds.items():
+            self.observe('prd_stage_duration_seconds', seconds, stage=stage)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'buckets': list(self.buckets),
+                'counters': {name: dict(series) for name, series in self.counters.items()},
+                'histograms': {name: {k: list(v) for k, v in series.items()} for name, series in self.histograms.items()}
+            }
+
+    def flush(self):
+        """Write this process's values for other processes to collect"""
+        if not self.state_dir:
+            return
+        # New file per process (forked workers inherit the parent's object)
+        if self._file is None or self._file_pid != os.getpid():
+            self._file_pid = os.getpid()
+            self._file = os.path.join(self.state_dir, f"{self._file_pid}-{time.time_ns()}.json")
+        self._write(self._file, self.snapshot())
+
+    def _write(self, path, snapshot):
+        fd, staging = tempfile.mkstemp(prefix='.staging-', dir=self.state_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(staging, path)
+
+    def collect(self):
+        """Snapshot summed over every process sharing state_dir"""
+        if not self.state_dir:
+            return self.snapshot()
+        self.flush()
+        with open(os.path.join(self.state_dir, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._fold_exited()
+            total = None
+            for name in os.listdir(self.state_dir):
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    with open(os.path.join(self.state_dir, name)) as f:
+                        total = _merge(total, json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return total or self.snapshot()
+
+    def _fold_exited(self):
+        """Merge files of processes that no longer exist into exited.json (call with the lock held)"""
+        exited_path = os.path.join(self.state_dir, EXITED_FILE)
+        folded = []
+        merged = None
+        for name in os.listdir(self.state_dir):
+            if not name.endswith('.json') or name == EXITED_FILE:
+                continue
+            try:
+                pid = int(name.split('-', 1)[0])
+                os.kill(pid, 0)
+                continue
+            except ProcessLookupError:
+                pass
+            except (ValueError, PermissionError):
+                continue
+            path = os.path.join(self.state_dir, name)
+            try:
+                with open(path) as f:
+                    merged = _merge(merged, json.load(f))
+                folded.append(path)
+            except (OSError, ValueError):
+                continue
+        if not folded:
+            return
+        try:
+            with open(exited_path) as f:
+                merged = _merge(merged, json.load(f))
+        except (OSError, ValueError):
+            pass
+        self._write(exited_path, merged)
+        for path in folded:
+            os.remove(path)
+
+    def render(self):
+        """All metrics in Prometheus text exposition format"""
+        snapshot = self.collect()
+        buckets = snapshot['buckets']
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'counter':
+                for key, value in sorted(snapshot['counters'].get(name, {}).items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                continue
+            for key, values in sorted(snapshot['histograms'].get(name, {}).items()):
+                for bound, count in zip(list(buckets) + [math.inf], values[:len(buckets)] + [values[-1]]):
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', _format_value(bound))])} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(values[-2])}")
+                lines.append(f"{name}_count{_format_labels(key)} {values[-1]}")
+        return '\n'.join(lines) + '\n'
+
+
+def _merge(total, snapshot):
+    """Sum two snapshots (None counts as empty)"""
+    if total is None:
+        return json.loads(json.dumps(snapshot))
+    for name, series in snapshot.get('counters', {}).items():
+        target = total['counters'].setdefault(name, {})
+        for key, value in series.items():
+            target[key] = target.get(key, 0) + value
+    for name, series in snapshot.get('histograms', {}).items():
+        target = total['histograms'].setdefault(name, {})
+        for key, values in series.items():
+            if key in target:
+                target[key] = [a + b for a, b in zip(target[key], values)]
+            else:
+                target[key] = list(values)
+    return total
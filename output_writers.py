@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Streaming writers for transformer output rows
+Consume an iterable of output rows (e.g. PRDTableTransformer.transform_iter()) and write
+them one by one, so the full result never has to be held in memory.
+
+- Excel: openpyxl write-only workbook (constant memory)
+- NDJSON: one JSON object per line
+- JSON bundle: {"format", "version", ..., "rows": [...], "stats": {...}} written row by row
+
+NDJSON and JSON bundle records hold QUESTION/RESPONSE_1 as JSON arrays of text objects
+(not JSON strings inside JSON), so consumers can skip the Excel template entirely.
+
+Excel cells hold at most 32,767 characters. A longer QUESTION/RESPONSE_1 cell (e.g. a
+long turn with the next question group appended) is re-encoded without whitespace;
+cells still too long are truncated by openpyxl and reported in OutputStats.long_cells.
+"""
+
+import json
+import math
+from collections import Counter
+from json.encoder import encode_basestring
+
+import numpy as np
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+
+from text_objects import compact_json
+from utils_validate import TEXT_OBJECT_COLUMNS
+
+# Column order of the template output (keys of every output row)
+OUTPUT_COLUMNS = [
+    'QUESTION', 'INTENT_NAME', 'INTENT_DESCRIPTION', 'BUTTON', 'TRIGGER', 'LOOP_COUNT',
+    'MAX_LOOP', 'LANGUAGE', 'LLM_ANSWERING', 'SCORE', 'RESPONSE_1', 'IMAGE_LISTENING',
+    'AUDIO_LISTENING', 'PRONUNCIATION_CHECKER_TOOL', 'GRAMMAR_CHECKER_TOOL',
+    'LISTENING_ANIMATIONS', 'REGEX_POSITIVE', 'REGEX_NEGATIVE'
+]
+
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+JSON_EXTENSIONS = ('.json',)
+OUTPUT_FORMATS = ('xlsx', 'json', 'ndjson')
+
+# JSON bundle header
+BUNDLE_FORMAT = 'prd-qc-bundle'
+BUNDLE_VERSION = 1
+
+# Longest text Excel accepts in a cell
+EXCEL_MAX_CELL_CHARS = 32767
+
+
+def is_missing(value):
+    """True for None and NaN cells (written as empty / null)"""
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def json_default(value):
+    """json.dumps fallback for numpy scalars coming from pandas columns"""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class OutputStats:
+    """Counts collected while rows stream through a writer"""
+
+    def __init__(self):
+        self.total_rows = 0
+        self.question_rows = 0
+        self.intent_rows = 0
+        self.descriptions = Counter()
+        # Excel cells over EXCEL_MAX_CELL_CHARS: {row, column, length, written_length, compacted, fits}
+        self.long_cells = []
+
+    def add(self, row):
+        self.total_rows += 1
+        if not is_missing(row.get('QUESTION')):
+            self.question_rows += 1
+        if not is_missing(row.get('INTENT_NAME')):
+            self.intent_rows += 1
+            if not is_missing(row.get('INTENT_DESCRIPTION')):
+                self.descriptions[row['INTENT_DESCRIPTION']] += 1
+
+    @property
+    def oversized_cells(self):
+        """Long cells that still exceed the Excel limit after compaction"""
+        return [cell for cell in self.long_cells if not cell['fits']]
+
+    @property
+    def duplicate_descriptions(self):
+        return {desc for desc, count in self.descriptions.items() if count > 1}
+
+    def to_dict(self):
+        return {
+            'total_rows': self.total_rows,
+            'question_rows': self.question_rows,
+            'intent_rows': self.intent_rows,
+            'long_cells': self.long_cells
+        }
+
+
+def excel_row_values(row, stats, columns=OUTPUT_COLUMNS):
+    """Count the row in stats and return its cell values as written to the sheet"""
+    stats.add(row)
+    values = [None if is_missing(row.get(col)) else row.get(col) for col in columns]
+    for i, value in enumerate(values):
+        if isinstance(value, str) and len(value) > EXCEL_MAX_CELL_CHARS:
+            # Header is sheet row 1
+            values[i] = fit_excel_cell(value, columns[i], stats.total_rows + 1, stats)
+    return values
+
+
+def collect_output_stats(rows, columns=OUTPUT_COLUMNS):
+    """The OutputStats write_excel_stream would return, without writing a workbook"""
+    stats = OutputStats()
+    for row in rows:
+        excel_row_values(row, stats, columns)
+    return stats
+
+
+def write_excel_stream(rows, output_file, columns=OUTPUT_COLUMNS):
+    """Write rows to an .xlsx file (a path or a binary file object) with a write-only workbook.
+    Returns OutputStats.
+
+    The file is only created if there is at least one row.
+    """
+    stats = OutputStats()
+    workbook = None
+
+    for row in rows:
+        if workbook is None:
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet('Sheet1')
+            sheet.append(_excel_header(sheet, columns))
+        sheet.append(excel_row_values(row, stats, columns))
+
+    if workbook is not None:
+        workbook.save(output_file)
+    return stats
+
+
+def fit_excel_cell(value, column, row_number, stats):
+    """Shorten a cell over EXCEL_MAX_CELL_CHARS where possible, recording it in stats.long_cells"""
+    length = len(value)
+    compacted = False
+    if column in TEXT_OBJECT_COLUMNS:
+        try:
+            compact = compact_json(value)
+        except ValueError:
+            compact = value
+        if len(compact) < length:
+            value, compacted = compact, True
+    stats.long_cells.append({
+        'row': row_number,
+        'column': column,
+        'length': length,
+        'written_length': len(value),
+        'compacted': compacted,
+        'fits': len(value) <= EXCEL_MAX_CELL_CHARS
+    })
+    return value
+
+
+def _excel_header(sheet, columns):
+    """Header cells styled like DataFrame.to_excel"""
+    thin = Side(style='thin')
+    header = []
+    for col in columns:
+        cell = WriteOnlyCell(sheet, value=col)
+        cell.font = Font(bold=True)
+        cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+        cell.alignment = Alignment(horizontal='center', vertical='top')
+        header.append(cell)
+    return header
+
+
+_CELL_ENCODER = json.JSONEncoder(ensure_ascii=False, default=json_default)
+_KEYS = {}
+
+
+def _json_cell(value):
+    if is_missing(value):
+        return 'null'
+    if isinstance(value, str):
+        return encode_basestring(value)
+    return _CELL_ENCODER.encode(value)
+
+
+def _json_text_objects(value):
+    """A QUESTION/RESPONSE_1 cell as an embedded JSON array (compact cells are used as they are)"""
+    if '\n' in value:
+        return compact_json(value)
+    return value
+
+
+def record_json(row, columns=OUTPUT_COLUMNS):
+    """One output row as a compact JSON object with QUESTION/RESPONSE_1 as arrays"""
+    parts = []
+    for col in columns:
+        key = _KEYS.get(col)
+        if key is None:
+            key = _KEYS[col] = encode_basestring(col) + ':'
+        value = row.get(col)
+        if col in TEXT_OBJECT_COLUMNS and isinstance(value, str):
+            parts.append(key + _json_text_objects(value))
+        else:
+            parts.append(key + _json_cell(value))
+    return '{' + ','.join(parts) + '}'
+
+
+def iter_ndjson(rows, columns=OUTPUT_COLUMNS, stats=None, rows_per_chunk=1):
+    """Yield NDJSON text chunks of rows_per_chunk lines"""
+    stats = stats if stats is not None else OutputStats()
+    chunk = []
+    for row in rows:
+        stats.add(row)
+        chunk.append(record_json(row, columns) + '\n')
+        if len(chunk) >= rows_per_chunk:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def write_ndjson_stream(rows, output_file, columns=OUTPUT_COLUMNS):
+    """Write rows as newline-delimited JSON objects. Returns OutputStats.
+
+    The file is only created if there is at least one row.
+    """
+    stats = OutputStats()
+    handle = None
+    try:
+        for chunk in iter_ndjson(rows, columns, stats):
+            if handle is None:
+                handle = open(output_file, 'w', encoding='utf-8')
+            handle.write(chunk)
+    finally:
+        if handle is not None:
+            handle.close()
+    return stats
+
+
+def iter_json_bundle(rows, meta=None, columns=OUTPUT_COLUMNS, stats=None, rows_per_chunk=1):
+    """Yield a JSON bundle as text chunks: header, rows_per_chunk rows at a time, then stats.
+
+    meta entries (e.g. source, transformer_version) are added to the header.
+    """
+    stats = stats if stats is not None else OutputStats()
+    header = {'format': BUNDLE_FORMAT, 'version': BUNDLE_VERSION}
+    header.update(meta or {})
+    header['columns'] = list(columns)
+    yield json.dumps(header, ensure_ascii=False, default=json_default)[:-1] + ',"rows":['
+
+    chunk = []
+    for row in rows:
+        stats.add(row)
+        chunk.append(('\n' if stats.total_rows == 1 else ',\n') + record_json(row, columns))
+        if len(chunk) >= rows_per_chunk:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+    yield ('\n' if stats.total_rows else '') + '],"stats":' + json.dumps(stats.to_dict()) + '}\n'
+
+
+def write_json_bundle_stream(rows, output_file, meta=None, columns=OUTPUT_COLUMNS):
+    """Write rows as one JSON bundle. Returns OutputStats.
+
+    The file is only created if there is at least one row.
+    """
+    stats = OutputStats()
+    chunks = iter_json_bundle(rows, meta, columns, stats)
+    header = next(chunks)
+    handle = None
+    try:
+        for chunk in chunks:
+            if handle is None:
+                if not stats.total_rows:
+                    break
+                handle = open(output_file, 'w', encoding='utf-8')
+                handle.write(header)
+            handle.write(chunk)
+    finally:
+        if handle is not None:
+            handle.close()
+    return stats
+
+
+def output_format_for(output_file):
+    """'ndjson' for .ndjson/.jsonl, 'json' for .json, else 'xlsx'"""
+    name = str(output_file).lower()
+    if name.endswith(NDJSON_EXTENSIONS):
+        return 'ndjson'
+    if name.endswith(JSON_EXTENSIONS):
+        return 'json'
+    return 'xlsx'
+
+
+def write_output_stream(rows, output_file, output_format=None, meta=None):
+    """Write rows in output_format (default: from the output file extension)"""
+    output_format = output_format or output_format_for(output_file)
+    if output_format == 'ndjson':
+        return write_ndjson_stream(rows, output_file)
+    if output_format == 'json':
+        return write_json_bundle_stream(rows, output_file, meta)
+    return write_excel_stream(rows, output_file)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Parallel conversion of one large sheet, sharded at question-group boundaries
+A turn only needs its own rows plus the next question group (max-loop intents append
+it to their RESPONSE_1), so the sheet is cut at question-group starts into shards of
+consecutive turns. Each shard also carries the question group that follows it (one-group
+lookahead); its own question row is dropped, since the next shard emits it.
+
+Shards are converted on a process pool (forked workers share the parent's DataFrame
+copy-on-write, so only row ranges are sent) and the output rows are merged in sheet
+order. The result equals PRDTableTransformer.transform().
+
+Usage: python3 transform_prd_to_template.py huge.xlsx --workers 8
+"""
+
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from transform_prd_to_template import PRDTableTransformer, silenced_output
+
+# Below this many sheet rows per shard, process start-up and pickling outweigh the gain
+MIN_SHARD_ROWS = 5000
+# Shards per worker, so a slow shard does not leave the other workers idle
+SHARDS_PER_WORKER = 4
+
+# Sheet rows [start, stop); with lookahead, the last question group only feeds the turn before it
+Shard = namedtuple('Shard', ['start', 'stop', 'lookahead'])
+
+# Set in each worker process by _init_worker
+_worker = {}
+
+
+def plan_shards(question_groups, total_rows, shard_rows):
+    """Cut rows [0, total_rows) at question-group starts into shards of about shard_rows rows"""
+    if not question_groups:
+        return [Shard(0, total_rows, False)]
+    starts = np.array([group['start'] for group in question_groups], dtype=np.int64)
+    shards = []
+    start = 0
+    while start < total_rows:
+        # First question group starting at least shard_rows after this shard's start
+        cut = int(np.searchsorted(starts, start + shard_rows))
+        if cut >= len(question_groups):
+            shards.append(Shard(start, total_rows, False))
+            break
+        next_group = question_groups[cut]
+        shards.append(Shard(start, next_group['end'] + 1, True))
+        start = next_group['start']
+    return shards
+
+
+def _init_worker(df, engine, json_profile):
+    _worker.update(df=df, engine=engine, json_profile=json_profile)
+
+
+def convert_shard(shard):
+    """Output rows of one shard (runs in a worker process)"""
+    rows = _worker['df'].iloc[shard.start:shard.stop].reset_index(drop=True)
+    with silenced_output():
+        transformer = PRDTableTransformer(rows, engine=_worker['engine'], json_profile=_worker['json_profile'])
+        output_rows = transformer.transform()
+    if shard.lookahead:
+        # The lookahead group's own question row is emitted by the next shard
+        output_rows.pop()
+    return output_rows
+
+
+def pool_context():
+    """fork where available, so workers inherit the DataFrame instead of unpickling a copy"""
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+def transform_sharded(transformer, workers=None, shard_rows=None):
+    """transformer.transform() on a process pool. Row hooks run in this process, in output order
+    (without text objects, like rows reused by turn_index). Returns transformer.output_rows."""
+    if transformer.engine == 'streaming':
+        raise ValueError("Sharded conversion needs the sheet in memory: use the legacy or vectorized engine")
+    workers = workers or os.cpu_count() or 1
+    transformer.analyze_data()
+    total_rows = len(transformer.df)
+    if shard_rows is None:
+        shard_rows = max(MIN_SHARD_ROWS, -(-total_rows // (workers * SHARDS_PER_WORKER)))
+    shards = plan_shards(transformer.question_groups, total_rows, shard_rows)
+    if workers <= 1 or len(shards) <= 1:
+        return transformer.transform()
+
+    print(f"Sharded conversion: {len(shards)} shards of ~{shard_rows} rows on {workers} processes")
+    with transformer.timed_stage('transform_shards'):
+        with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context(), initializer=_init_worker,
+                                 initargs=(transformer.df, transformer.engine, transformer.json_profile)) as executor:
+            for output_rows in executor.map(convert_shard, shards):
+                for row in output_rows:
+                    transformer.run_row_hooks(row)
+                transformer.output_rows.extend(output_rows)
+    return transformer.output_rows
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Column-projected reading of an .xlsx sheet
+Reads the first worksheet's XML with a streaming parser and converts only the cells of
+the requested columns, instead of building every cell like openpyxl (even in read-only
+mode) or pd.read_excel do. Used where a few columns are enough, e.g. linting a sheet
+(utils_validate.lint_workbook) before a full conversion.
+
+float_columns finds the columns pd.read_excel would hold as float64, so a streamed read can
+type their values the same way.
+
+sheet_extent reads the first sheet's row count from its <dimension> element (or the size
+of its XML) without reading any row, to weigh an upload before converting it.
+
+Values are normalized like transform_prd_to_template.iter_sheet_rows: empty and NA-like
+strings become NaN, integral numbers become int.
+"""
+
+import functools
+import posixpath
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+ROW_DIGITS = '0123456789'
+# Strings pd.read_excel reads as NaN: the default na_values documented for pandas.read_csv/read_excel
+NA_VALUES = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+])
+# Average worksheet XML per row, for sheets written without a <dimension> (e.g. openpyxl write-only)
+SHEET_XML_BYTES_PER_ROW = 600
+
+
+@functools.lru_cache(maxsize=None)
+def column_index(letters):
+    """0-based column of the letters of a cell reference ('AB' of 'AB12')"""
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def first_sheet_path(archive):
+    """Zip member of the workbook's first worksheet"""
+    rel_id = None
+    for _, element in iterparse(archive.open('xl/workbook.xml')):
+        if element.tag == MAIN_NS + 'sheet':
+            rel_id = element.get(REL_NS + 'id')
+            break
+    if rel_id is None:
+        raise ValueError("Workbook has no sheets")
+    for _, element in iterparse(archive.open('xl/_rels/workbook.xml.rels')):
+        if element.tag == PACKAGE_REL_NS + 'Relationship' and element.get('Id') == rel_id:
+            target = element.get('Target')
+            return target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+    raise ValueError(f"Worksheet {rel_id} not found in the workbook relationships")
+
+
+def sheet_extent(input_file):
+    """(rows, exact) of the first sheet, header included: from <dimension ref="A1:K200"> when the
+    sheet has one before its data, else estimated from the sheet XML size (exact=False).
+    input_file is a path or a seekable binary file-like object."""
+    with zipfile.ZipFile(input_file) as archive:
+        path = first_sheet_path(archive)
+        for event, element in iterparse(archive.open(path), events=('start',)):
+            if element.tag == MAIN_NS + 'dimension':
+                last = element.get('ref', '').split(':')[-1].lstrip('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+                if last.isdigit():
+                    return int(last), True
+                break
+            if element.tag == MAIN_NS + 'sheetData':
+                break
+        return max(1, archive.getinfo(path).file_size // SHEET_XML_BYTES_PER_ROW), False
+
+
+def read_shared_strings(archive):
+    """The shared string table (rich text runs joined)"""
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return []
+    strings = []
+    for _, element in iterparse(archive.open('xl/sharedStrings.xml')):
+        if element.tag == MAIN_NS + 'si':
+            strings.append(''.join(text.text or '' for text in element.iter(MAIN_NS + 't')))
+            element.clear()
+    return strings
+
+
+def cell_value(cell, shared_strings):
+    """Raw value of a <c> element (None if empty)"""
+    kind = cell.get('t', 'n')
+    if kind == 'inlineStr':
+        inline = cell.find(MAIN_NS + 'is')
+        return ''.join(text.text or '' for text in inline.iter(MAIN_NS + 't')) if inline is not None else None
+    value = cell.findtext(MAIN_NS + 'v')
+    if value is None:
+        return None
+    if kind == 's':
+        return shared_strings[int(value)]
+    if kind == 'b':
+        return value == '1'
+    if kind in ('str', 'e', 'd'):
+        return value
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def normalize(value):
+    if value is None or (isinstance(value, str) and value in NA_VALUES):
+        # A fresh NaN per cell, like iter_sheet_rows
+        return float('nan')
+    return value
+
+
+def iter_sheet_columns(input_file, columns):
+    """Yield (sheet row number, {column: value}) for the first sheet's rows after the header,
+    reading only the given header columns. input_file is a path or a binary file-like object.
+    Like pd.read_excel, blank rows (in every column, not just the requested ones) are yielded
+    as all-NaN rows up to the last data row, and the trailing ones are dropped."""
+    with zipfile.ZipFile(input_file) as archive:
+        shared_strings = read_shared_strings(archive)
+        positions = None
+        row_number = 0
+        last_yielded = None
+        for _, element in iterparse(archive.open(first_sheet_path(archive))):
+            if element.tag != MAIN_NS + 'row':
+                continue
+            row_number = int(element.get('r', row_number + 1))
+            cells = {}
+            has_values = False
+            for position, cell in enumerate(element.iter(MAIN_NS + 'c')):
+                reference = cell.get('r')
+                position = column_index(reference.rstrip(ROW_DIGITS)) if reference else position
+                if positions is None or position in positions:
+                    cells[position] = cell_value(cell, shared_strings)
+                    has_values = has_values or cells[position] not in (None, '')
+                elif not has_values:
+                    has_values = cell.find(MAIN_NS + 'v') is not None or cell.find(MAIN_NS + 'is') is not None
+            element.clear()
+
+            if positions is None:
+                # Header row: the first occurrence of each requested column
+                positions = {}
+                for position, name in sorted(cells.items()):
+                    if name in columns and name not in positions.values():
+                        positions[position] = name
+                last_yielded = row_number
+                continue
+            if has_values:
+                # Blank rows since the last data row, including those without a <row> element
+                for blank_number in range(last_yielded + 1, row_number):
+                    yield blank_number, {name: float('nan') for name in positions.values()}
+                yield row_number, {name: normalize(cells.get(position)) for position, name in positions.items()}
+                last_yielded = row_number
+
+
+def float_columns(input_file, columns):
+    """The given columns that pd.read_excel reads as float64: only numbers (no bools or text)
+    and at least one blank cell or non-integral number"""
+    numeric = dict.fromkeys(columns, True)
+    needs_float = dict.fromkeys(columns, False)
+    for _, row in iter_sheet_columns(input_file, columns):
+        for name, value in row.items():
+            if not numeric[name]:
+                continue
+            if isinstance(value, float):
+                # NaN (blank) or a non-integral number
+                needs_float[name] = True
+            elif isinstance(value, bool) or not isinstance(value, int):
+                numeric[name] = False
+    return {name for name in columns if numeric[name] and needs_float[name]}
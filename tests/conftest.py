@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def workbook(tmp_path_factory):
+    """A small generated PRD QC table"""
+    from generate_prd_table import generate_workbook
+    path = str(tmp_path_factory.mktemp('input') / 'lesson.xlsx')
+    generate_workbook(path, rows=300, seed=1)
+    return path
+
+
+@pytest.fixture(scope='session')
+def web_app(tmp_path_factory):
+    """The Flask app module with all its stores in a temp dir"""
+    from benchmark import load_web_app
+    return load_web_app(str(tmp_path_factory.mktemp('web')))
+
+
+@pytest.fixture(scope='session')
+def workbook_missing_silence(tmp_path_factory):
+    """A generated PRD QC table whose second question group has no Silence intent"""
+    from generate_prd_table import generate_rows, write_workbook
+    path = str(tmp_path_factory.mktemp('input') / 'missing_silence.xlsx')
+    rows = []
+    group = 0
+    for row in generate_rows(question_groups=4, seed=1):
+        if row[0] == 'Question' and row[5] == 1:
+            group += 1
+        if not (group == 2 and row[1] == 'Silence'):
+            rows.append(row)
+    write_workbook(path, rows)
+    return path
@@ -0,0 +1,49 @@
+import json
+import os
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, STATE_FILE, process_started
+
+
+def test_tickets_of_a_previous_process_with_the_same_pid_are_dropped(tmp_path):
+    controller = AdmissionController(str(tmp_path), budget=1000, small_cost=10)
+    # Left by a worker before a restart whose pid is now this process's
+    stale = {'id': 'stale', 'pid': os.getpid(), 'started': 'before-restart', 'cost': 990, 'small': False,
+             'state': 'running', 'since': 0}
+    with open(tmp_path / STATE_FILE, 'w') as f:
+        json.dump({'tickets': [stale]}, f)
+
+    ticket = controller.enqueue(500)
+    assert ticket.admitted
+    ticket.release()
+    assert controller.stats()['running'] == 0
+
+
+def test_running_tickets_hold_the_budget(tmp_path):
+    controller = AdmissionController(str(tmp_path), budget=1000, small_cost=10, max_queue=0)
+    assert process_started(os.getpid())
+    running = controller.enqueue(900)
+    assert running.admitted
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.enqueue(600)
+    assert rejected.value.retry_after >= 1
+    running.release()
+    assert controller.enqueue(600).admitted
+
+
+def test_small_tickets_are_admitted_while_large_ones_fill_their_share(tmp_path):
+    controller = AdmissionController(str(tmp_path), budget=1000, small_cost=10, small_slots=4)
+    first = controller.enqueue(500)
+    second = controller.enqueue(499)
+    assert first.admitted
+    # 500 + 499 rows would leave less than the 40-row small reserve
+    assert not second.admitted
+
+    small = controller.enqueue(10)
+    assert small.admitted
+    stats = controller.stats()
+    assert (stats['running'], stats['waiting']) == (2, 1)
+
+    for ticket in (small, second, first):
+        ticket.release()
@@ -0,0 +1,25 @@
+import os
+import zipfile
+
+from batch_convert import convert_archive
+
+
+def test_archive_members_extracted_as_workers_free_up(workbook, tmp_path):
+    archive_file = tmp_path / 'lessons.zip'
+    with zipfile.ZipFile(archive_file, 'w') as archive:
+        for k in range(5):
+            archive.write(workbook, f'lesson_{k}.xlsx')
+    work_dir = tmp_path / 'work'
+    on_disk = []
+
+    def progress(done, total, result):
+        on_disk.append(len(os.listdir(work_dir / 'inputs')))
+
+    manifest = convert_archive(str(archive_file), str(tmp_path / 'out.zip'), str(work_dir), workers=1,
+                               progress=progress)
+
+    assert manifest['summary']['succeeded'] == 5
+    # The finished member is removed before progress: the rest is at most one per worker
+    assert max(on_disk) <= 1
+    with zipfile.ZipFile(tmp_path / 'out.zip') as output:
+        assert sorted(output.namelist())[0] == 'manifest.json'
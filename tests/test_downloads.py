@@ -0,0 +1,78 @@
+import io
+import os
+import zipfile
+
+
+def upload(client, workbook):
+    with open(workbook, 'rb') as f:
+        response = client.post('/upload?sync=1', data={'file': (f, 'lesson.xlsx')})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['download_url']
+
+
+def test_download_releases_lease(web_app, workbook):
+    client = web_app.app.test_client()
+    download_url = upload(client, workbook)
+
+    # First download renders and stores the workbook, the later ones are sent from disk
+    for _ in range(3):
+        response = client.get(download_url)
+        assert response.status_code == 200
+        response.close()
+    ranged = client.get(download_url, headers={'Range': 'bytes=0-99'})
+    assert ranged.status_code == 206
+    ranged.close()
+
+    assert web_app.conversion_cache.stats()['leases'] == 0
+
+
+def test_legacy_download_name_is_not_a_path(web_app, workbook):
+    client = web_app.app.test_client()
+    name = upload(client, workbook).rsplit('/', 1)[1]
+
+    assert client.get('/download/' + name).status_code == 200
+    assert client.get('/download/..%2Fapp.py').status_code == 404
+    assert web_app.conversion_cache.stats()['leases'] == 0
+
+
+def test_download_after_job_record_pruned(web_app, workbook):
+    client = web_app.app.test_client()
+    download_url = upload(client, workbook)
+    job_id = download_url.split('/')[2]
+
+    # Job records have a shorter retention than the cached artifacts they link to
+    for queue in (web_app.job_queue, web_app.small_job_queue):
+        queue.jobs.pop(job_id, None)
+    os.remove(os.path.join(web_app.job_queue.state_dir, job_id + '.json'))
+    assert web_app.job_queue.get(job_id) is None
+
+    response = client.get(download_url)
+    assert response.status_code == 200
+    response.close()
+    assert client.get(f'/download/{"0" * 32}/' + download_url.rsplit('/', 1)[1]).status_code == 404
+    assert web_app.conversion_cache.stats()['leases'] == 0
+
+
+def test_batch_result_is_a_leased_cache_entry(web_app, workbook, tmp_path):
+    archive_file = tmp_path / 'lessons.zip'
+    with zipfile.ZipFile(archive_file, 'w') as archive:
+        archive.write(workbook, 'lesson.xlsx')
+    client = web_app.app.test_client()
+    with open(archive_file, 'rb') as f:
+        response = client.post('/upload-batch?sync=1', data={'file': (f, 'lessons.zip')})
+    assert response.status_code == 200, response.get_json()
+    download_url = response.get_json()['download_url']
+    entries = len(web_app.conversion_cache.entries())
+
+    response = client.get(download_url)
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.get_data())) as output:
+        assert 'manifest.json' in output.namelist()
+    response.close()
+    assert web_app.conversion_cache.stats()['leases'] == 0
+    # Nothing is left in the batch work dir: the zip is in the cache, under its quota and TTL
+    assert os.listdir(web_app.app.config['BATCH_FOLDER']) == []
+
+    assert client.get('/clear').status_code == 200
+    assert len(web_app.conversion_cache.entries()) < entries
+    assert client.get(download_url).status_code == 410
@@ -0,0 +1,54 @@
+import contextlib
+import io
+
+import pytest
+from openpyxl import Workbook
+
+from generate_prd_table import COLUMNS, generate_rows
+from transform_prd_to_template import ENGINES, PRDTableTransformer
+
+
+def typed(value):
+    """(type, value) with numpy scalars as their Python equivalents: 2 and 2.0 differ, np.int64(2) and 2 do not"""
+    if hasattr(value, 'item'):
+        value = value.item()
+    return type(value).__name__, repr(value)
+
+
+def convert(path, engine):
+    with contextlib.redirect_stdout(io.StringIO()):
+        output_rows = PRDTableTransformer(path, engine=engine).transform()
+    return [{key: typed(value) for key, value in row.items()} for row in output_rows]
+
+
+@pytest.fixture(scope='module', params=['complete', 'blank_loops', 'blank_row_in_loop'])
+def sheet(request, tmp_path):
+    """A generated sheet; blank_loops leaves Loop empty on question rows, so read_excel holds it as
+    float64; blank_row_in_loop puts an empty sheet row between the two rows of some loops, which
+    read_excel keeps as an all-NaN row"""
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.append(COLUMNS)
+    loop = COLUMNS.index('Loop')
+    seq = COLUMNS.index('Seq')
+    for number, row in enumerate(generate_rows(question_groups=12, rows_per_loop=2, seed=7)):
+        if request.param == 'blank_loops' and row[0] == 'Question':
+            row[loop] = None
+        if request.param == 'blank_row_in_loop' and row[seq] == 2 and number % 5 == 0:
+            worksheet.append([None] * len(COLUMNS))
+        worksheet.append(row)
+    path = str(tmp_path / f'{request.param}.xlsx')
+    workbook.save(path)
+    return path
+
+
+@pytest.fixture(scope='module')
+def tmp_path(tmp_path_factory):
+    return tmp_path_factory.mktemp('engines')
+
+
+def test_engines_produce_identical_typed_rows(sheet):
+    expected = convert(sheet, 'legacy')
+    assert expected
+    for engine in ENGINES[1:]:
+        assert convert(sheet, engine) == expected, engine
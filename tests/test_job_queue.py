@@ -0,0 +1,22 @@
+import json
+import os
+
+from job_queue import ORPHANED_ERROR, JobQueue
+
+
+def test_jobs_of_an_exited_process_are_failed_when_read(tmp_path):
+    queue = JobQueue(max_workers=1, state_dir=str(tmp_path))
+    live = queue.add(queue.new_job())
+    lost = queue.add(queue.new_job())
+    # As left by a worker recycled before a restart, whose pid is now this process's
+    path = tmp_path / f'{lost.id}.json'
+    state = json.loads(path.read_text())
+    state.update(status='running', owner={'pid': os.getpid(), 'started': 'before-restart'})
+    path.write_text(json.dumps(state))
+
+    # Another worker answering polls
+    other = JobQueue(max_workers=1, state_dir=str(tmp_path))
+    assert other.get(live.id).status == 'queued'
+    job = other.get(lost.id)
+    assert (job.status, job.error) == ('failed', ORPHANED_ERROR)
+    assert json.loads(path.read_text())['status'] == 'failed'
@@ -0,0 +1,67 @@
+import contextlib
+import io
+
+import pytest
+from openpyxl import Workbook
+
+from generate_prd_table import COLUMNS, generate_rows
+from sharded_convert import plan_shards, transform_sharded
+from test_engines import typed
+from transform_prd_to_template import PRDTableTransformer
+
+# A turn is 3 question rows and 6 intents x 2 loops x 2 rows: 27 sheet rows
+QUESTION_ROWS = 3
+TURN_ROWS = QUESTION_ROWS + 6 * 2 * 2
+
+
+@pytest.fixture(scope='module')
+def sheet(tmp_path_factory):
+    """A generated sheet with two rows per loop and some all-blank rows inside loops"""
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.append(COLUMNS)
+    seq = COLUMNS.index('Seq')
+    for number, row in enumerate(generate_rows(question_groups=12, question_rows=QUESTION_ROWS,
+                                               rows_per_loop=2, seed=11)):
+        if row[seq] == 2 and number % 7 == 0:
+            worksheet.append([None] * len(COLUMNS))
+        worksheet.append(row)
+    path = str(tmp_path_factory.mktemp('sharded') / 'sheet.xlsx')
+    workbook.save(path)
+    return path
+
+
+def convert(path, engine, workers=None, shard_rows=None):
+    with contextlib.redirect_stdout(io.StringIO()):
+        transformer = PRDTableTransformer(path, engine=engine)
+        if workers is None:
+            output_rows = transformer.transform()
+        else:
+            output_rows = transform_sharded(transformer, workers=workers, shard_rows=shard_rows)
+    return transformer, [{key: typed(value) for key, value in row.items()} for row in output_rows]
+
+
+@pytest.fixture(scope='module', params=['legacy', 'vectorized'])
+def unsharded(request, sheet):
+    """(engine, output rows of a plain transform())"""
+    return request.param, convert(sheet, request.param)[1]
+
+
+# shard_rows 1 makes every turn a shard; the others aim the cut inside a question group
+# (2), inside a loop (5, 14) or past a whole turn (TURN_ROWS + 4), so it moves to the next group start
+@pytest.mark.parametrize('shard_rows', [1, 2, 5, 14, TURN_ROWS + 4, 4 * TURN_ROWS])
+def test_sharded_output_equals_unsharded(sheet, unsharded, shard_rows):
+    engine, expected = unsharded
+    transformer, output_rows = convert(sheet, engine, workers=3, shard_rows=shard_rows)
+    shards = plan_shards(transformer.question_groups, len(transformer.df), shard_rows)
+    assert len(shards) > 1
+    assert output_rows == expected
+
+
+def test_shards_start_at_question_groups(sheet):
+    transformer, _ = convert(sheet, 'vectorized')
+    group_starts = {group['start'] for group in transformer.question_groups}
+    for shard_rows in range(1, TURN_ROWS + 2):
+        shards = plan_shards(transformer.question_groups, len(transformer.df), shard_rows)
+        assert {shard.start for shard in shards[1:]} <= group_starts
+        assert shards[-1].stop == len(transformer.df)
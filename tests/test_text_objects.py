@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+import pytest
+
+import text_objects
+from text_objects import TextObject, dumps_text_objects
+
+OBJECTS = [
+    TextObject("Xin chào cậu! Hôm nay chúng ta cùng khám phá sở thú nhé!", 'Happy', 'image_1.jpg',
+               ('Happy', 'RAISE_BOTH_HOLD', 2000), 0.9, 'audio_1.mp3'),
+    TextObject('Quotes " and \\ backslash,\nnew line, tab\t, emoji 🐻 and  ', None, None, None, 1, None),
+    TextObject('', float('nan'), '', ('Confused', None, 1500.5), float('nan'), float('-inf')),
+    TextObject('Tiny and huge numbers', 'Worry', None, ('Worry', 'THINKING', 0.00001), 1e16, 12345678901234567890),
+    TextObject('numpy float and bools', True, False, ('Lovely', 'CUTE', np.float64(2.5)), np.float64(0.8), None),
+]
+
+
+def json_dumps(objects, compact):
+    dicts = [obj.to_dict() for obj in objects]
+    if compact:
+        return json.dumps(dicts, ensure_ascii=False, separators=(',', ':'))
+    return json.dumps(dicts, ensure_ascii=False, indent=2)
+
+
+@pytest.fixture(params=['orjson', 'fragments'])
+def serializer(request, monkeypatch):
+    if request.param == 'orjson':
+        if text_objects.orjson is None:
+            pytest.skip('orjson is not installed')
+    else:
+        monkeypatch.setattr(text_objects, 'orjson', None)
+    return request.param
+
+
+@pytest.mark.parametrize('compact', [False, True])
+# One object at a time too: a value orjson cannot take sends the whole list to the fallback
+@pytest.mark.parametrize('objects', [[], OBJECTS] + [[obj] for obj in OBJECTS],
+                         ids=['empty', 'all'] + [f'object_{n}' for n in range(len(OBJECTS))])
+def test_output_is_byte_identical_to_json_dumps(serializer, compact, objects):
+    assert dumps_text_objects(objects, compact) == json_dumps(objects, compact)
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_values_json_cannot_encode_raise_like_json_dumps(serializer, compact):
+    objects = [TextObject('numpy int', None, None, ('Happy', 'CUTE', np.int64(3000)), 1.0, None)]
+    with pytest.raises(TypeError):
+        json_dumps(objects, compact)
+    with pytest.raises(TypeError):
+        dumps_text_objects(objects, compact)
@@ -0,0 +1,25 @@
+import os
+import time
+
+from turn_index import TurnIndexStore
+
+
+def test_prune_drops_indexes_past_retention(tmp_path):
+    store = TurnIndexStore(str(tmp_path), retention=60)
+    store.save('old.xlsx', [{'fingerprint': 'a', 'rows': []}])
+    store.save('new.xlsx', [{'fingerprint': 'b', 'rows': []}])
+    expired = time.time() - 120
+    os.utime(store.path_for('old.xlsx'), (expired, expired))
+
+    assert store.prune() == 1
+    assert store.load('old.xlsx') == []
+    assert store.load('new.xlsx') == [{'fingerprint': 'b', 'rows': []}]
+
+
+def test_clear_keeps_saves_in_progress(tmp_path):
+    store = TurnIndexStore(str(tmp_path))
+    store.save('lesson.xlsx', [])
+    (tmp_path / '.staging-x').write_text('')
+
+    assert store.clear() == 1
+    assert os.listdir(tmp_path) == ['.staging-x']
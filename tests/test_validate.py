@@ -0,0 +1,21 @@
+import pytest
+
+
+def post(client, url, path):
+    with open(path, 'rb') as f:
+        return client.post(url, data={'file': (f, 'lesson.xlsx')})
+
+
+@pytest.mark.parametrize('sheet', ['workbook', 'workbook_missing_silence'])
+def test_validate_and_upload_agree(web_app, sheet, request):
+    path = request.getfixturevalue(sheet)
+    client = web_app.app.test_client()
+
+    report = post(client, '/validate', path).get_json()
+    upload = post(client, '/upload?sync=1', path)
+
+    assert report['valid'] == (upload.status_code == 200), upload.get_json()
+    assert report['valid'] == (sheet == 'workbook')
+    if not report['valid']:
+        assert report['invalid_questions'][0]['missing'] == ['silence']
+        assert upload.get_json()['error'] == 'Validation failed'
@@ -0,0 +1,80 @@
+import contextlib
+import io
+
+import pandas as pd
+
+from transform_prd_to_template import PRDTableTransformer
+from utils_validate import OutputRowValidator, QuestionIntentPatternValidator, validate_question_intent_pattern
+
+
+def row_by_row(output_rows):
+    validator = QuestionIntentPatternValidator()
+    for row in output_rows:
+        validator.add(row)
+    return validator.result()
+
+
+def test_rows_with_different_keys_and_key_orders():
+    output_rows = [
+        {'QUESTION': 'Q1', 'INTENT_NAME': None},
+        # Row kind and intent name are each row's own first two values
+        {'Kind': 'Intent_Response', 'Intent': 'Fallback', 'Text': 'a'},
+        {'Type': 'intent_response', 'Name': 'silence'},
+        {'Text': 'no kind', 'Intent': 'other'},
+        {'QUESTION': 'Q2'},
+        {'kind': 'Response', 'Intent_Name': 'fallback'},
+    ]
+    expected = row_by_row(output_rows)
+    result = validate_question_intent_pattern(output_rows)
+
+    assert result['question_details'][0]['intents'] == ['fallback', 'silence']
+    for key in ('errors', 'question_details', 'total_questions', 'invalid_questions', 'success_rate'):
+        assert result[key] == expected[key], key
+
+
+def hooked_pattern_result(path):
+    validator = OutputRowValidator()
+    with contextlib.redirect_stdout(io.StringIO()):
+        transformer = PRDTableTransformer(path)
+        transformer.row_hooks.append(validator)
+        transformer.transform()
+    return validator.pattern_result()
+
+
+def test_output_row_validator_finds_intents_of_transformer_rows(workbook, workbook_missing_silence):
+    result = hooked_pattern_result(workbook)
+    assert result['errors'] == []
+    assert all({'fallback', 'silence'} <= set(q['intents']) for q in result['question_details'])
+
+    result = hooked_pattern_result(workbook_missing_silence)
+    assert [q['missing'] for q in result['question_details'] if not q['is_valid']] == [['silence']]
+    assert len(result['errors']) == 1
+
+
+def test_blank_cells_are_read_like_the_row_by_row_validator(tmp_path):
+    # A sheet read back with pandas: blank QUESTION and Intent cells are NaN, which the baseline
+    # validator takes as a question 'nan' and an intent 'nan'
+    path = tmp_path / 'blank_questions.xlsx'
+    pd.DataFrame([
+        {'Kind': 'Question', 'Intent': 'Q1', 'QUESTION': 'Hello'},
+        {'Kind': 'Intent_Response', 'Intent': 'fallback', 'QUESTION': None},
+        {'Kind': 'Intent_Response', 'Intent': None, 'QUESTION': '  '},
+        {'Kind': 'Intent_Response', 'Intent': 'silence', 'QUESTION': 'World'},
+        {'Kind': 'Intent_Response', 'Intent': 'other', 'QUESTION': None},
+    ]).to_excel(path, index=False)
+    output_rows = pd.read_excel(path).to_dict('records')
+    # Row dicts where only None is blank: a NaN intent name is kept, a None one falls back to INTENT_KEYS
+    output_rows += [
+        {'QUESTION': 'Q2', 'Section': float('nan')},
+        {'Kind': 'Intent_Response', 'Name': float('nan'), 'INTENT_NAME': 'fallback'},
+        {'Kind': 'Intent_Response', 'Name': None, 'INTENT_NAME': 'silence'},
+        {'Kind': 'Intent_Response', 'Name': '', 'Intent': float('nan')},
+        {'QUESTION': None, 'Section': float('nan')},
+        {'QUESTION': None, 'Section': None, 'Kind': 'Response', 'Intent': 'fast'},
+    ]
+    expected = row_by_row(output_rows)
+    result = validate_question_intent_pattern(output_rows)
+
+    assert expected['total_questions'] > 2
+    for key in ('errors', 'question_details', 'total_questions', 'invalid_questions', 'success_rate'):
+        assert result[key] == expected[key], key
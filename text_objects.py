@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Compact text objects and their JSON serializer
+A TextObject holds the per-row fields of one QUESTION/RESPONSE_1 item in __slots__;
+the constant fields (video, text_viewer, volume, model) live on the class.
+
+dumps_text_objects() writes exactly what
+json.dumps([obj.to_dict() for obj in objects], ensure_ascii=False, indent=2) writes
+(or, compact, with separators=(',', ':') instead of the indent), through orjson when it
+is installed and from pre-encoded fragments otherwise.
+
+JSON profiles for the QUESTION/RESPONSE_1 cells:
+- pretty: indent=2 (the template output format)
+- compact: no whitespace, about half the cell size
+- compact-view: compact cells; the web UI pretty-prints a cell only when it is opened
+"""
+
+import json
+from json.encoder import encode_basestring
+
+try:
+    import orjson
+except ImportError:  # optional, only makes serialization faster
+    orjson = None
+
+JSON_PROFILES = ('pretty', 'compact', 'compact-view')
+DEFAULT_JSON_PROFILE = 'pretty'
+COMPACT_SEPARATORS = (',', ':')
+
+
+class TextObject:
+    """One text object: text, mood, image, moods, voice_speed, audio (+ constant fields)"""
+
+    __slots__ = ('text', 'mood', 'image', 'moods', 'voice_speed', 'audio')
+
+    FIELDS = ('text', 'mood', 'image', 'video', 'moods', 'voice_speed', 'text_viewer', 'volume', 'audio', 'model')
+    video = ""  # Not in input, set default
+    text_viewer = ""  # Not in input, set default
+    volume = 1.0  # Default value
+    model = ""  # Default value
+
+    def __init__(self, text, mood, image, moods, voice_speed, audio):
+        self.text = text
+        self.mood = mood
+        self.image = image
+        # (mood_name, servo_name, duration) or None
+        self.moods = moods
+        self.voice_speed = voice_speed
+        self.audio = audio
+
+    def moods_list(self):
+        if self.moods is None:
+            return []
+        mood_name, servo_name, duration = self.moods
+        return [{"mood_name": mood_name, "servo_name": servo_name, "duration": duration}]
+
+    def get(self, key, default=None):
+        """dict-style access, e.g. obj.get('image', '')"""
+        if key == 'moods':
+            return self.moods_list()
+        if key in self.FIELDS:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return self.get(key)
+
+    def to_dict(self):
+        return {
+            "text": self.text,
+            "mood": self.mood,
+            "image": self.image,
+            "video": self.video,
+            "moods": self.moods_list(),
+            "voice_speed": self.voice_speed,
+            "text_viewer": self.text_viewer,
+            "volume": self.volume,
+            "audio": self.audio,
+            "model": self.model
+        }
+
+    def __eq__(self, other):
+        if isinstance(other, TextObject):
+            return self.to_dict() == other.to_dict()
+        return NotImplemented
+
+    def __repr__(self):
+        return f"TextObject({self.to_dict()!r})"
+
+
+def dumps_text_objects(objects, compact=False):
+    """Serialize a list of TextObject like json.dumps(..., ensure_ascii=False, indent=2)
+    (compact: like json.dumps(..., ensure_ascii=False, separators=(',', ':')))"""
+    if orjson is not None and all(map(_orjson_safe, objects)):
+        try:
+            option = 0 if compact else orjson.OPT_INDENT_2
+            return orjson.dumps(objects, default=_orjson_default, option=option).decode('utf-8')
+        except TypeError:
+            # numpy scalars, ints beyond 64 bits, ...: the json-compatible path below handles them
+            pass
+    try:
+        return _dumps_fragments(objects, COMPACT_LAYOUT if compact else PRETTY_LAYOUT)
+    except TypeError:
+        # Let json raise its own error for values it cannot serialize either
+        dicts = [obj.to_dict() for obj in objects]
+        if compact:
+            return json.dumps(dicts, ensure_ascii=False, separators=COMPACT_SEPARATORS)
+        return json.dumps(dicts, ensure_ascii=False, indent=2)
+
+
+def is_compact_profile(profile):
+    """True if the profile writes QUESTION/RESPONSE_1 without whitespace"""
+    if profile not in JSON_PROFILES:
+        raise ValueError(f"Unknown JSON profile '{profile}', expected one of: {', '.join(JSON_PROFILES)}")
+    return profile != 'pretty'
+
+
+def compact_json(value):
+    """Re-encode a JSON cell without whitespace"""
+    return json.dumps(json.loads(value), ensure_ascii=False, separators=COMPACT_SEPARATORS)
+
+
+def _orjson_default(value):
+    if isinstance(value, TextObject):
+        return value.to_dict()
+    raise TypeError
+
+
+def _orjson_float_safe(value):
+    # orjson writes NaN/Infinity as null and uses different exponent notation
+    # (1e16 vs 1e+16, 0.00001 vs 1e-05); python repr is plain decimal in this range
+    return type(value) is not float or value == 0 or 1e-4 <= abs(value) < 1e16
+
+
+def _orjson_safe(obj):
+    moods = obj.moods or ()
+    return all(map(_orjson_float_safe, (obj.text, obj.mood, obj.image, obj.voice_speed, obj.audio, *moods)))
+
+
+def _encode(value, _str=encode_basestring, _int=int.__repr__, _float=float.__repr__):
+    """A scalar encoded like json.JSONEncoder(ensure_ascii=False); TypeError otherwise"""
+    if isinstance(value, str):
+        return _str(value)
+    if value is None:
+        return 'null'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if isinstance(value, int):
+        return _int(value)
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        if value == float('inf'):
+            return 'Infinity'
+        if value == -float('inf'):
+            return '-Infinity'
+        return _float(value)
+    raise TypeError(type(value).__name__)
+
+
+class _Layout:
+    """Pre-encoded fragments of one json.dumps layout (indent=N or compact), constant fields included"""
+
+    def __init__(self, indent):
+        colon = ': ' if indent else ':'
+
+        def newline(level):
+            # Line break + indentation before an item at nesting level
+            return '\n' + ' ' * indent * level if indent else ''
+
+        def key(name, level, first=False):
+            return ('' if first else ',') + newline(level) + f'"{name}"{colon}'
+
+        self.empty = '[]'
+        self.open = '[' + newline(1)
+        self.separator = ',' + newline(1)
+        self.close = newline(0) + ']'
+        self.text = '{' + key('text', 2, first=True)
+        self.mood = key('mood', 2)
+        self.image = key('image', 2)
+        self.video_moods = key('video', 2) + _encode(TextObject.video) + key('moods', 2)
+        self.voice_speed = key('voice_speed', 2)
+        self.viewer_volume_audio = (key('text_viewer', 2) + _encode(TextObject.text_viewer)
+                                    + key('volume', 2) + _encode(TextObject.volume) + key('audio', 2))
+        self.model_end = key('model', 2) + _encode(TextObject.model) + newline(1) + '}'
+        self.moods_name = '[' + newline(3) + '{' + key('mood_name', 4, first=True)
+        self.moods_servo = key('servo_name', 4)
+        self.moods_duration = key('duration', 4)
+        self.moods_end = newline(3) + '}' + newline(2) + ']'
+
+
+PRETTY_LAYOUT = _Layout(indent=2)
+COMPACT_LAYOUT = _Layout(indent=0)
+
+
+def _dumps_fragments(objects, layout=PRETTY_LAYOUT):
+    if not objects:
+        return layout.empty
+    parts = []
+    for obj in objects:
+        if obj.moods is None:
+            moods = '[]'
+        else:
+            mood_name, servo_name, duration = obj.moods
+            moods = (layout.moods_name + _encode(mood_name) + layout.moods_servo + _encode(servo_name)
+                     + layout.moods_duration + _encode(duration) + layout.moods_end)
+        parts.append(
+            layout.text + _encode(obj.text) + layout.mood + _encode(obj.mood)
+            + layout.image + _encode(obj.image) + layout.video_moods + moods
+            + layout.voice_speed + _encode(obj.voice_speed)
+            + layout.viewer_volume_audio + _encode(obj.audio) + layout.model_end
+        )
+    return layout.open + layout.separator.join(parts) + layout.close
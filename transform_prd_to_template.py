@@ -4,35 +4,212 @@ PRD QC Table to Template Output Transformer
 Transforms input files like 'prd_qc_table.xlsx' to output like 'template_output.xlsx'
 Complete implementation with all missing fields: image, audio, voice_speed, etc.
 
-Usage: python3 transform_prd_to_template.py input_file.xlsx [output_file.xlsx]
+Usage: python3 transform_prd_to_template.py input_file.xlsx [output_file.xlsx] [--engine legacy|vectorized]
+       [--json-profile pretty|compact|compact-view] [--format xlsx|json|ndjson] [--workers N]
+       python3 transform_prd_to_template.py input_file.xlsx --check
 """
 
 import pandas as pd
-import json
+import io
+import hashlib
 import numpy as np
+import os
 import sys
+import argparse
+import contextlib
+import time
 from collections import defaultdict
+from openpyxl import load_workbook
+from output_writers import OUTPUT_COLUMNS, OUTPUT_FORMATS, EXCEL_MAX_CELL_CHARS, output_format_for, write_output_stream
+from text_objects import TextObject, dumps_text_objects, is_compact_profile, JSON_PROFILES, DEFAULT_JSON_PROFILE
+from sheet_columns import NA_VALUES, float_columns
+
+# Bump when output_rows change for the same input (invalidates cached conversions)
+TRANSFORMER_VERSION = '1.1.0'
+
+# Grouping engines: 'legacy' walks the sheet row by row, 'vectorized' labels
+# question groups, turns and intent runs column-wise, 'streaming' reads the workbook
+# in read-only mode and converts turn by turn without building a DataFrame.
+# All engines produce the same output_rows.
+ENGINES = ('legacy', 'vectorized', 'streaming')
+DEFAULT_ENGINE = 'vectorized'
+
+# Input columns read by create_text_object / process_question_group / process_intent_group
+ROW_COLUMNS = [
+    'Section', 'Intent', 'Loop', 'Text_Vietnamese', 'Mood', 'Servo_Name', 'Servo_Duration',
+    'Image', 'Audio', 'Voice_Speed', 'Button', 'Image_Listening', 'Audio_Listening',
+    'Intent_Description'
+]
+
+@contextlib.contextmanager
+def silenced_output():
+    """Discard the transformer's progress prints, e.g. in pool workers where they would interleave"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def iter_sheet_rows(input_file, columns=ROW_COLUMNS, float_columns=()):
+    """Yield the first sheet's rows as {column: value} dicts, keeping only the given columns.
+    input_file is a path or a binary file-like object.
+    
+    Uses openpyxl read-only mode so memory stays flat regardless of sheet size.
+    Rows and cell values are normalized the way pd.read_excel does it: blank rows before
+    the last data row are kept (all NaN), empty and NA-like strings become NaN, numbers
+    in float_columns (the float64 columns of read_excel, see sheet_columns.float_columns)
+    become float and integral floats elsewhere int.
+    """
+    workbook = load_workbook(input_file, read_only=True, data_only=True)
+    try:
+        sheet_rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(sheet_rows, ())
+        positions = {}
+        for position, name in enumerate(header):
+            if name in columns and name not in positions:
+                positions[name] = position
+        
+        blank_rows = 0
+        for values in sheet_rows:
+            if all(value is None or value == '' for value in values):
+                # Kept only if a data row follows (read_excel drops trailing blank rows)
+                blank_rows += 1
+                continue
+            for _ in range(blank_rows):
+                yield {name: float('nan') for name in positions}
+            blank_rows = 0
+            row = {}
+            for name, position in positions.items():
+                value = values[position] if position < len(values) else None
+                if value is None or (isinstance(value, str) and value in NA_VALUES):
+                    # A fresh NaN per cell: like pandas NaNs, they never match as dict keys
+                    value = float('nan')
+                elif name in float_columns and isinstance(value, (int, float)) and not isinstance(value, bool):
+                    value = float(value)
+                elif isinstance(value, float) and value.is_integer():
+                    value = int(value)
+                row[name] = value
+            yield row
+    finally:
+        workbook.close()
+
 
 class PRDTableTransformer:
-    def __init__(self, input_file):
+    def __init__(self, input_file, engine=DEFAULT_ENGINE, json_profile=DEFAULT_JSON_PROFILE, source_name=None):
+        """input_file: a path, the workbook bytes, a binary file-like object (e.g. an upload stream)
+        or an already read sheet as a DataFrame (e.g. one shard of sharded_convert).
+        source_name names in-memory input in messages and exports."""
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of: {', '.join(ENGINES)}")
+        is_dataframe = isinstance(input_file, pd.DataFrame)
+        if is_dataframe and engine == 'streaming':
+            raise ValueError("The streaming engine reads a workbook, not a DataFrame")
+        if isinstance(input_file, (bytes, bytearray, memoryview)):
+            input_file = io.BytesIO(input_file)
         self.input_file = input_file
-        self.df = pd.read_excel(input_file)
+        if source_name is None:
+            if is_dataframe:
+                source_name = '<dataframe>'
+            elif isinstance(input_file, (str, os.PathLike)):
+                source_name = input_file
+            else:
+                source_name = getattr(input_file, 'name', '<memory>')
+        self.source_name = str(source_name)
+        self.engine = engine
+        # QUESTION/RESPONSE_1 layout: pretty (indent=2) or compact (text_objects.JSON_PROFILES)
+        self.json_profile = json_profile
+        self.compact_json = is_compact_profile(json_profile)
+        # Seconds spent per stage (read_excel, scan_groups, max_loops, text_objects), for metrics
+        self.stage_seconds = {}
+        # The streaming engine reads the workbook lazily in transform()
+        self.df = None
+        if is_dataframe:
+            self.df = input_file
+        elif engine != 'streaming':
+            with self.timed_stage('read_excel'):
+                self.df = pd.read_excel(self.input_source())
         self.output_rows = []
         self.intent_descriptions = set()
         self.question_groups = []
         self.intent_max_loops = {}
+        self.turn_intent_max_loops = {}
+        self._rows = None
+        # TextObject per input row, built once: a list (build_text_objects) or, streaming, a dict of held rows
+        self._text_objects = None
+        self._labels = None
+        self._analyzed = False
+        # Dense per-row lookups built by analyze_data (-1 = none)
+        self.row_question_group = None
+        self.row_turn = None
+        self.row_next_question_group = None
+        self.turn_ranges = []
+        # Called as hook(row, text_objects) for every output row when it is built, with the
+        # structured text objects behind its JSON columns (e.g. utils_validate.OutputRowValidator)
+        self.row_hooks = []
         
     def analyze_data(self):
-        """Analyze input data structure"""
-        print(f"Input file: {self.input_file}")
+        """Analyze input data structure (once; later calls are no-ops)"""
+        if self._analyzed:
+            return
+        self._analyzed = True
+        print(f"Input file: {self.source_name}")
         print(f"Total rows: {len(self.df)}")
         print(f"Columns: {list(self.df.columns)}")
         
+        if self.engine == 'vectorized':
+            # Label all rows column-wise, then derive groups and turn max loops from the labels
+            with self.timed_stage('scan_groups'):
+                self.label_rows()
+                self.scan_question_groups_vectorized()
+                self.build_row_index()
+            with self.timed_stage('max_loops'):
+                self.calculate_intent_max_loops_vectorized()
+            return
+        
         # Find question groups positions first
-        self.scan_question_groups()
+        with self.timed_stage('scan_groups'):
+            self.scan_question_groups()
+            self.build_row_index()
         
         # Find max loop for each intent within each question turn
-        self.calculate_intent_max_loops_per_turn()
+        with self.timed_stage('max_loops'):
+            self.calculate_intent_max_loops_per_turn()
+    
+    def input_source(self):
+        """The input to (re)read: the path, or the file object rewound to its start"""
+        if hasattr(self.input_file, 'seek'):
+            self.input_file.seek(0)
+        return self.input_file
+    
+    @contextlib.contextmanager
+    def timed_stage(self, stage):
+        """Add the with-block's duration to stage_seconds[stage]"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + time.perf_counter() - started
+        
+    def build_row_index(self):
+        """Build dense row->question group, row->turn and row->next question group arrays"""
+        n = len(self.df)
+        starts = np.array([g['start'] for g in self.question_groups], dtype=np.int64)
+        ends = np.array([g['end'] for g in self.question_groups], dtype=np.int64)
+        
+        # Number of question groups started at or before each row
+        groups_started = np.cumsum(np.bincount(starts, minlength=n)[:n])
+        # Rows inside a group: +1 at each start, -1 after each end
+        span = np.bincount(starts, minlength=n + 1) - np.bincount(ends + 1, minlength=n + 1)
+        in_group = np.cumsum(span[:n]) > 0
+        
+        self.row_question_group = np.where(in_group, groups_started - 1, -1)
+        # Turn k covers the rows between question group k and question group k+1
+        self.row_turn = np.where(in_group, -1, groups_started - 1)
+        next_group = np.searchsorted(starts, np.arange(n), side='right')
+        self.row_next_question_group = np.where(next_group < len(starts), next_group, -1)
+        
+        self.turn_ranges = [
+            (group['end'] + 1, self.question_groups[i + 1]['start'] - 1 if i + 1 < len(self.question_groups) else n - 1)
+            for i, group in enumerate(self.question_groups)
+        ]
         
     def calculate_intent_max_loops_per_turn(self):
         """Calculate max loop for each intent within question turns"""
@@ -40,9 +217,7 @@ class PRDTableTransformer:
         self.turn_intent_max_loops = {}
         
         # Process each question turn (from one question group to the next)
-        for i in range(len(self.question_groups)):
-            turn_start = self.question_groups[i]['end'] + 1  # Start after current question group
-            turn_end = self.question_groups[i + 1]['start'] - 1 if i + 1 < len(self.question_groups) else len(self.df) - 1
+        for turn_start, turn_end in self.turn_ranges:
             
             # Find max loop for each intent within this turn
             turn_intent_loops = defaultdict(list)
@@ -61,6 +236,10 @@ class PRDTableTransformer:
             # Store turn max loops with turn range info
             self.turn_intent_max_loops[(turn_start, turn_end)] = turn_max_loops
             
+        self.merge_intent_max_loops()
+        
+    def merge_intent_max_loops(self):
+        """Report per-turn max loops and derive the global max loop per intent"""
         print(f"Intent max loops per turn: {self.turn_intent_max_loops}")
         
         # Keep global max loops for backward compatibility (but use turn-specific logic)
@@ -101,33 +280,122 @@ class PRDTableTransformer:
             
         print(f"Found {len(self.question_groups)} question groups: {[(g['start'], g['end']) for g in self.question_groups]}")
     
+    def label_rows(self):
+        """Label rows with question-group, turn and intent-run IDs using column-wise operations"""
+        section = self.df['Section']
+        intent = self.df['Intent']
+        is_question = (section == 'Question').to_numpy()
+        is_intent = (section == 'Intent_Response').to_numpy()
+        
+        if (is_intent & intent.isna().to_numpy()).any():
+            bad_row = int(np.flatnonzero(is_intent & intent.isna().to_numpy())[0])
+            raise ValueError(f"Intent_Response row {bad_row} has no Intent")
+        
+        # Run-length labelling: a group starts where a Question row follows a non-Question row
+        prev_question = np.concatenate(([False], is_question[:-1]))
+        next_question = np.concatenate((is_question[1:], [False]))
+        
+        # An intent run is a block of consecutive Intent_Response rows with the same Intent
+        prev_intent = np.concatenate(([False], is_intent[:-1]))
+        intent_changed = intent.ne(intent.shift()).to_numpy()
+        run_counter = np.cumsum(is_intent & (~prev_intent | intent_changed))
+        
+        self._labels = {
+            'group_starts': np.flatnonzero(is_question & ~prev_question),
+            'group_ends': np.flatnonzero(is_question & ~next_question),
+            'intent_run': np.where(is_intent, run_counter - 1, -1),
+        }
+        return self._labels
+    
+    def scan_question_groups_vectorized(self):
+        """Build question groups from the run-length labels"""
+        labels = self._labels
+        self.question_groups = [
+            {'start': int(start), 'end': int(end), 'indices': list(range(start, end + 1))}
+            for start, end in zip(labels['group_starts'], labels['group_ends'])
+        ]
+        print(f"Found {len(self.question_groups)} question groups: {[(g['start'], g['end']) for g in self.question_groups]}")
+    
+    def calculate_intent_max_loops_vectorized(self):
+        """Calculate max loop for each intent within question turns with one groupby"""
+        turn = self.row_turn
+        intent = self.df['Intent'].to_numpy()
+        loop = self.df['Loop']
+        mask = (turn >= 0) & self.df['Intent'].notna().to_numpy() & loop.notna().to_numpy()
+        
+        max_loops = loop[mask].groupby([turn[mask], intent[mask]], sort=False).max()
+        turn_max_loops = defaultdict(dict)
+        for (turn_no, intent_name), max_loop in zip(max_loops.index, max_loops.to_numpy()):
+            turn_max_loops[turn_no][intent_name] = max_loop
+        
+        self.turn_intent_max_loops = {
+            turn_range: turn_max_loops.get(i, {}) for i, turn_range in enumerate(self.turn_ranges)
+        }
+        
+        self.merge_intent_max_loops()
+    
     def create_text_object(self, row):
         """Create complete text object with all fields including new ones"""
-        # Build moods array
-        moods = []
+        # Build moods (at most one mood object)
+        moods = None
         if pd.notna(row['Mood']) and row['Mood'].strip():
-            mood_obj = {
-                "mood_name": row['Mood'],
-                "servo_name": row['Servo_Name'] if pd.notna(row['Servo_Name']) else "",
-                "duration": float(row['Servo_Duration']) if pd.notna(row['Servo_Duration']) else 2000.0
-            }
-            moods.append(mood_obj)
-        
-        # Create text object with all fields from input
-        text_obj = {
-            "text": row['Text_Vietnamese'] if pd.notna(row['Text_Vietnamese']) else "",
-            "mood": row['Mood'] if pd.notna(row['Mood']) else "",
-            "image": row['Image'] if pd.notna(row['Image']) else "",
-            "video": "",  # Not in input, set default
-            "moods": moods,
-            "voice_speed": float(row['Voice_Speed']) if pd.notna(row['Voice_Speed']) else "",
-            "text_viewer": "",  # Not in input, set default
-            "volume": 1.0,  # Default value
-            "audio": row['Audio'] if pd.notna(row['Audio']) else "",
-            "model": ""  # Default value
-        }
+            moods = (
+                row['Mood'],
+                row['Servo_Name'] if pd.notna(row['Servo_Name']) else "",
+                float(row['Servo_Duration']) if pd.notna(row['Servo_Duration']) else 2000.0
+            )
         
-        return text_obj
+        # Create text object with all fields from input (video, text_viewer, volume, model are constants)
+        return TextObject(
+            text=row['Text_Vietnamese'] if pd.notna(row['Text_Vietnamese']) else "",
+            mood=row['Mood'] if pd.notna(row['Mood']) else "",
+            image=row['Image'] if pd.notna(row['Image']) else "",
+            moods=moods,
+            voice_speed=float(row['Voice_Speed']) if pd.notna(row['Voice_Speed']) else "",
+            audio=row['Audio'] if pd.notna(row['Audio']) else ""
+        )
+    
+    def build_text_objects(self):
+        """Build the TextObject of every input row once, from whole columns: NaN fills, float
+        casts and the Mood check run per column instead of per row (like create_text_object)"""
+        if self._text_objects is not None:
+            return
+        with self.timed_stage('text_objects'):
+            def column(name):
+                values = self.df[name]
+                return values.tolist(), values.notna().tolist()
+            
+            def filled(name, default=""):
+                values, present = column(name)
+                return [value if is_present else default for value, is_present in zip(values, present)]
+            
+            mood, mood_present = column('Mood')
+            servo_name = filled('Servo_Name')
+            servo_duration = [float(value) if is_present else 2000.0 for value, is_present in zip(*column('Servo_Duration'))]
+            voice_speed = [float(value) if is_present else "" for value, is_present in zip(*column('Voice_Speed'))]
+            moods = [
+                (name, servo, duration) if is_present and name.strip() else None
+                for name, is_present, servo, duration in zip(mood, mood_present, servo_name, servo_duration)
+            ]
+            self._text_objects = [
+                TextObject(*fields) for fields in zip(
+                    filled('Text_Vietnamese'), filled('Mood'), filled('Image'), moods, voice_speed, filled('Audio')
+                )
+            ]
+    
+    def text_object_at(self, idx):
+        """TextObject of input row idx, built at most once"""
+        objects = self._text_objects
+        if objects is None:
+            return self.create_text_object(self.row_at(idx))
+        if isinstance(objects, dict):
+            # Streaming: cached while the row is held, so a question group appended to the
+            # previous turn is not rebuilt for its own question row
+            text_obj = objects.get(idx)
+            if text_obj is None:
+                text_obj = objects[idx] = self.create_text_object(self.row_at(idx))
+            return text_obj
+        return objects[idx]
     
     def generate_unique_intent_description(self, intent_name, user_examples, loop_count):
         """Generate unique intent description based on guidelines"""
@@ -150,11 +418,20 @@ class PRDTableTransformer:
     
     def find_next_question_group(self, current_position):
         """Find the next question group after current position"""
+        if 0 <= current_position < len(self.row_next_question_group):
+            group_no = self.row_next_question_group[current_position]
+            return self.question_groups[group_no] if group_no >= 0 else None
+        
         for group in self.question_groups:
             if group['start'] > current_position:
                 return group
         return None
     
+    def turn_range_at(self, position):
+        """Return the (turn_start, turn_end) range containing a row, or None before the first question"""
+        turn_no = self.row_turn[position]
+        return self.turn_ranges[turn_no] if turn_no >= 0 else None
+    
     def process_question_group(self, group_indices):
         """Process a group of consecutive question rows"""
         question_objects = []
@@ -163,9 +440,8 @@ class PRDTableTransformer:
         audio_listening = None
         
         for idx in group_indices:
-            row = self.df.iloc[idx]
-            text_obj = self.create_text_object(row)
-            question_objects.append(text_obj)
+            row = self.row_at(idx)
+            question_objects.append(self.text_object_at(idx))
             
             # Get values from any row in group
             if pd.notna(row['Button']) and button_value is None:
@@ -177,7 +453,7 @@ class PRDTableTransformer:
         
         # Create question output row
         question_row = {
-            'QUESTION': json.dumps(question_objects, ensure_ascii=False, indent=2),
+            'QUESTION': dumps_text_objects(question_objects, self.compact_json),
             'INTENT_NAME': None,
             'INTENT_DESCRIPTION': None,
             'BUTTON': button_value,
@@ -197,15 +473,22 @@ class PRDTableTransformer:
             'REGEX_NEGATIVE': None
         }
         
+        self.run_row_hooks(question_row, {'QUESTION': question_objects})
         return question_row
     
-    def process_intent_group(self, intent_name, intent_rows, next_question_group=None, current_turn_range=None):
-        """Process a group of intent rows with same Intent, grouped by Loop"""
+    def process_intent_group(self, intent_name, intent_indices, next_question_group=None, current_turn_range=None):
+        """Process a group of intent rows (input row indices) with same Intent, grouped by Loop"""
         # Group by Loop
         loop_groups = defaultdict(list)
-        for row in intent_rows:
-            loop_groups[row['Loop']].append(row)
+        for idx in intent_indices:
+            loop_groups[self.row_at(idx)['Loop']].append(idx)
         
+        return self.process_intent_loop_groups(
+            intent_name, loop_groups.items(), next_question_group, current_turn_range
+        )
+    
+    def process_intent_loop_groups(self, intent_name, loop_groups, next_question_group=None, current_turn_range=None):
+        """Build intent output rows from (loop_count, input row indices) pairs of one intent run"""
         intent_output_rows = []
         
         # Get max loop for this intent in current turn
@@ -213,7 +496,7 @@ class PRDTableTransformer:
         if current_turn_range and current_turn_range in self.turn_intent_max_loops:
             turn_max_loop = self.turn_intent_max_loops[current_turn_range].get(intent_name, 0)
         
-        for loop_count, rows in loop_groups.items():
+        for loop_count, indices in loop_groups:
             # Create response objects
             response_objects = []
             button_value = None
@@ -221,9 +504,9 @@ class PRDTableTransformer:
             image_listening = None
             audio_listening = None
             
-            for row in rows:
-                text_obj = self.create_text_object(row)
-                response_objects.append(text_obj)
+            for idx in indices:
+                row = self.row_at(idx)
+                response_objects.append(self.text_object_at(idx))
                 
                 # Get values from any row in loop group
                 if pd.notna(row['Button']) and button_value is None:
@@ -242,9 +525,7 @@ class PRDTableTransformer:
                 print(f"Appending next question group to {intent_name} loop {loop_count} (turn max: {turn_max_loop})")
                 # Add question objects from next group
                 for idx in next_question_group['indices']:
-                    next_row = self.df.iloc[idx]
-                    next_text_obj = self.create_text_object(next_row)
-                    response_objects.append(next_text_obj)
+                    response_objects.append(self.text_object_at(idx))
             
             # Generate unique intent description
             intent_description = self.generate_unique_intent_description(
@@ -263,7 +544,7 @@ class PRDTableTransformer:
                 'LANGUAGE': None,
                 'LLM_ANSWERING': None,
                 'SCORE': None,
-                'RESPONSE_1': json.dumps(response_objects, ensure_ascii=False, indent=2),
+                'RESPONSE_1': dumps_text_objects(response_objects, self.compact_json),
                 'IMAGE_LISTENING': image_listening,
                 'AUDIO_LISTENING': audio_listening,
                 'PRONUNCIATION_CHECKER_TOOL': None,
@@ -273,14 +554,248 @@ class PRDTableTransformer:
                 'REGEX_NEGATIVE': None
             }
             
+            self.run_row_hooks(intent_row, {'RESPONSE_1': response_objects})
             intent_output_rows.append(intent_row)
         
         return intent_output_rows
     
+    def run_row_hooks(self, row, text_objects=None):
+        """Pass a built output row (and the text objects it was serialized from) to row_hooks"""
+        for hook in self.row_hooks:
+            hook(row, text_objects)
+    
+    def row_at(self, idx):
+        """Return input row idx as a Series (legacy) or a column-value dict (vectorized)"""
+        if self._rows is not None:
+            return self._rows[idx]
+        return self.df.iloc[idx]
+    
     def transform(self):
         """Main transformation logic implementing guidelines"""
+        self.output_rows.extend(self.transform_iter())
+        return self.output_rows
+    
+    def transform_iter(self):
+        """Yield output rows in order as each question turn completes.
+        
+        Rows are not collected into self.output_rows, so a consumer such as
+        output_writers.write_output_stream can write them with constant memory.
+        """
+        if self.engine == 'streaming':
+            print(f"Input file: {self.source_name}")
+            print("Streaming mode: reading rows in read-only mode")
+            yield from self.iter_streaming_rows()
+            print(f"Found {self.question_group_count} question groups")
+            return
+        
         self.analyze_data()
+        self.build_text_objects()
         
+        if self.engine == 'vectorized':
+            yield from self.iter_vectorized_rows()
+        else:
+            yield from self.iter_legacy_rows()
+    
+    def iter_streaming_rows(self):
+        """Yield output rows turn by turn while reading the sheet row by row"""
+        for turn in self.iter_streaming_turns():
+            yield from self.process_turn(*turn)
+    
+    def iter_streaming_turns(self):
+        """Yield turns while reading the sheet row by row, releasing each turn's rows once processed.
+        
+        A turn (question group + following rows) can only be emitted once the next
+        question group has been read completely, since max-loop intents append it.
+        """
+        self._rows = {}
+        self._text_objects = {}
+        self.question_group_count = 0
+        current_group = None
+        turn_indices = []
+        reading_group = []
+        last_idx = -1
+        
+        def turn(question_group, indices, next_question_group, turn_end):
+            turn_range = (question_group['end'] + 1, turn_end) if question_group else None
+            return question_group, indices, next_question_group, turn_range
+        
+        def has_rows(question_group, indices):
+            # No leading turn when the sheet starts with a question group
+            return bool(question_group or indices)
+        
+        def release(question_group, indices):
+            if question_group:
+                self.question_group_count += 1
+            for idx in (question_group['indices'] if question_group else []) + indices:
+                del self._rows[idx]
+                self._text_objects.pop(idx, None)
+        
+        # Typed like the DataFrame engines: columns with blanks hold floats (one extra XML pass)
+        with self.timed_stage('scan_types'):
+            numeric_columns = float_columns(self.input_source(), ROW_COLUMNS)
+        for idx, row in enumerate(iter_sheet_rows(self.input_source(), float_columns=numeric_columns)):
+            self._rows[idx] = row
+            last_idx = idx
+            if row.get('Section') == 'Question':
+                reading_group.append(idx)
+                continue
+            
+            if reading_group:
+                next_group = {'start': reading_group[0], 'end': reading_group[-1], 'indices': reading_group}
+                if has_rows(current_group, turn_indices):
+                    yield turn(current_group, turn_indices, next_group, next_group['start'] - 1)
+                release(current_group, turn_indices)
+                current_group = next_group
+                turn_indices = []
+                reading_group = []
+            turn_indices.append(idx)
+        
+        if reading_group:
+            next_group = {'start': reading_group[0], 'end': reading_group[-1], 'indices': reading_group}
+            if has_rows(current_group, turn_indices):
+                yield turn(current_group, turn_indices, next_group, next_group['start'] - 1)
+            release(current_group, turn_indices)
+            current_group = next_group
+            turn_indices = []
+        if has_rows(current_group, turn_indices):
+            yield turn(current_group, turn_indices, None, last_idx)
+        release(current_group, turn_indices)
+        self._rows = None
+        self._text_objects = None
+    
+    def iter_turns(self):
+        """Yield every turn as (question_group, turn_indices, next_question_group, turn_range).
+        
+        Rows before the first question group form a leading turn with question_group None.
+        Rows are read through row_at(), so the turn can be passed to process_turn().
+        """
+        if self.engine == 'streaming':
+            yield from self.iter_streaming_turns()
+            return
+        
+        self.analyze_data()
+        self.materialize_rows()
+        self.build_text_objects()
+        first_start = self.question_groups[0]['start'] if self.question_groups else len(self.df)
+        next_group = self.question_groups[0] if self.question_groups else None
+        if first_start > 0:
+            yield None, list(range(first_start)), next_group, None
+        
+        for i, group in enumerate(self.question_groups):
+            turn_range = self.turn_ranges[i]
+            next_group = self.question_groups[i + 1] if i + 1 < len(self.question_groups) else None
+            yield group, list(range(turn_range[0], turn_range[1] + 1)), next_group, turn_range
+    
+    def turn_fingerprint(self, question_group, turn_indices, next_question_group, turn_range=None):
+        """SHA-256 over the turn's input rows: its question group, its rows and the next group it appends.
+        
+        Row positions are not included, so a turn moved by edits elsewhere keeps its fingerprint.
+        """
+        digest = hashlib.sha256()
+        sections = (
+            question_group['indices'] if question_group else [],
+            turn_indices,
+            next_question_group['indices'] if next_question_group else []
+        )
+        for indices in sections:
+            for idx in indices:
+                row = self.row_at(idx)
+                digest.update('\x1f'.join(f"{col}={row.get(col)!r}" for col in ROW_COLUMNS).encode('utf-8'))
+                digest.update(b'\x1e')
+            digest.update(b'\x1d')
+        return digest.hexdigest()
+    
+    def process_turn(self, question_group, turn_indices, next_question_group, turn_range):
+        """Yield the output rows of one turn: its question row, then its intent rows"""
+        if question_group:
+            yield self.process_question_group(question_group['indices'])
+        
+        # Max loop per intent over the whole turn, then consecutive same-intent runs
+        if turn_range:
+            turn_intent_loops = defaultdict(list)
+            for idx in turn_indices:
+                row = self.row_at(idx)
+                if pd.notna(row.get('Intent')) and pd.notna(row.get('Loop')):
+                    turn_intent_loops[row['Intent']].append(row['Loop'])
+            self.turn_intent_max_loops[turn_range] = {
+                intent: max(loops) for intent, loops in turn_intent_loops.items()
+            }
+        
+        intent_name = None
+        intent_indices = []
+        for idx in turn_indices + [None]:
+            row = self.row_at(idx) if idx is not None else None
+            if intent_indices and (row is None or row.get('Section') != 'Intent_Response'
+                                   or row.get('Intent') != intent_name):
+                yield from self.process_intent_group(
+                    intent_name, intent_indices, next_question_group, turn_range
+                )
+                intent_indices = []
+            if row is not None and row.get('Section') == 'Intent_Response':
+                if pd.isna(row.get('Intent')):
+                    raise ValueError(f"Intent_Response row {idx} has no Intent")
+                if not intent_indices:
+                    intent_name = row['Intent']
+                intent_indices.append(idx)
+        
+        if self.engine == 'streaming':
+            # Only the current turn is kept for streaming
+            self.turn_intent_max_loops.pop(turn_range, None)
+    
+    def materialize_rows(self):
+        """Row dicts for the columns the row builders read; values keep their iloc types"""
+        columns = [col for col in ROW_COLUMNS if col in self.df.columns]
+        values = [self.df[col].to_numpy() for col in columns]
+        self._rows = [dict(zip(columns, row_values)) for row_values in zip(*values)]
+    
+    def iter_vectorized_rows(self):
+        """Emit output rows from the precomputed labels without per-row DataFrame access"""
+        labels = self._labels
+        self.materialize_rows()
+        
+        # Loop groups: (intent run, Loop) pairs in order of first appearance. Rows with a
+        # missing Loop each form their own group, as NaN dict keys never compare equal.
+        intent_idx = np.flatnonzero(labels['intent_run'] >= 0)
+        loop_codes, _ = pd.factorize(self.df['Loop'].to_numpy()[intent_idx])
+        missing = loop_codes < 0
+        loop_codes[missing] = loop_codes.max(initial=-1) + 1 + np.arange(missing.sum())
+        loop_frame = pd.DataFrame({'run': labels['intent_run'][intent_idx], 'loop': loop_codes})
+        loop_group_no = loop_frame.groupby(['run', 'loop'], sort=False).ngroup().to_numpy()
+        
+        order = np.argsort(loop_group_no, kind='stable')
+        boundaries = np.flatnonzero(np.diff(loop_group_no[order])) + 1
+        run_loop_groups = defaultdict(list)
+        for members in np.split(intent_idx[order], boundaries):
+            if len(members):
+                first = self._rows[members[0]]
+                run_loop_groups[labels['intent_run'][members[0]]].append((first['Loop'], members.tolist()))
+        
+        intent_run = labels['intent_run']
+        prev_run = np.concatenate(([-1], intent_run[:-1]))
+        next_run = np.concatenate((intent_run[1:], [-1]))
+        run_starts = np.flatnonzero((intent_run >= 0) & (intent_run != prev_run))
+        run_ends = np.flatnonzero((intent_run >= 0) & (intent_run != next_run))
+        group_starts = labels['group_starts']
+        
+        # Merge question groups and intent runs in sheet order
+        events = sorted(
+            [(start, 'question', i) for i, start in enumerate(group_starts)] +
+            [(start, 'intent', i) for i, start in enumerate(run_starts)]
+        )
+        for start, kind, i in events:
+            if kind == 'question':
+                yield self.process_question_group(self.question_groups[i]['indices'])
+                continue
+            
+            next_question_group = self.find_next_question_group(run_ends[i])
+            current_turn_range = self.turn_range_at(start)
+            
+            yield from self.process_intent_loop_groups(
+                self._rows[start]['Intent'], run_loop_groups.pop(i), next_question_group, current_turn_range
+            )
+    
+    def iter_legacy_rows(self):
+        """Row-by-row transformation walking the sheet with iloc"""
         current_idx = 0
         
         while current_idx < len(self.df):
@@ -288,16 +803,13 @@ class PRDTableTransformer:
             
             if row['Section'] == 'Question':
                 # Find current question group
-                current_question_group = None
-                for group in self.question_groups:
-                    if current_idx in group['indices']:
-                        current_question_group = group
-                        break
+                group_no = self.row_question_group[current_idx]
+                current_question_group = self.question_groups[group_no] if group_no >= 0 else None
                 
                 if current_question_group:
                     # Process question group
                     question_row = self.process_question_group(current_question_group['indices'])
-                    self.output_rows.append(question_row)
+                    yield question_row
                     
                     # Skip to end of question group
                     current_idx = current_question_group['end'] + 1
@@ -307,83 +819,171 @@ class PRDTableTransformer:
             elif row['Section'] == 'Intent_Response':
                 # Find all consecutive intent rows with same intent
                 intent_name = row['Intent']
-                intent_rows = []
+                intent_indices = []
                 
                 while (current_idx < len(self.df) and 
                        self.df.iloc[current_idx]['Section'] == 'Intent_Response' and
                        self.df.iloc[current_idx]['Intent'] == intent_name):
-                    intent_rows.append(self.df.iloc[current_idx])
+                    intent_indices.append(current_idx)
                     current_idx += 1
                 
                 # Find next question group for appending (critical logic)
                 next_question_group = self.find_next_question_group(current_idx - 1)
                 
                 # Find current turn range for max loop calculation
-                current_turn_range = None
-                intent_start_position = intent_rows[0].name if intent_rows else current_idx - 1
-                for turn_range in self.turn_intent_max_loops.keys():
-                    turn_start, turn_end = turn_range
-                    if turn_start <= intent_start_position <= turn_end:
-                        current_turn_range = turn_range
-                        break
+                intent_start_position = intent_indices[0] if intent_indices else current_idx - 1
+                current_turn_range = self.turn_range_at(intent_start_position)
                 
                 # Process intent group
                 intent_output_rows = self.process_intent_group(
-                    intent_name, intent_rows, next_question_group, current_turn_range
+                    intent_name, intent_indices, next_question_group, current_turn_range
                 )
-                self.output_rows.extend(intent_output_rows)
+                yield from intent_output_rows
             else:
                 current_idx += 1
-        
-        return self.output_rows
     
-    def save_output(self, output_file):
-        """Save transformed data to Excel"""
+    def save_output(self, output_file, output_format=None):
+        """Save transformed data to Excel, a JSON bundle (.json) or NDJSON (.ndjson/.jsonl)"""
         if not self.output_rows:
             print("No output data to save")
             return
-            
-        output_df = pd.DataFrame(self.output_rows)
-        output_df.to_excel(output_file, index=False)
+        
+        stats = write_output_stream(self.output_rows, output_file, output_format, self.export_meta())
+        self.report_output(output_file, stats)
+    
+    def save_output_stream(self, output_file, output_format=None):
+        """Transform and write rows as they are produced, without keeping output_rows"""
+        stats = write_output_stream(self.transform_iter(), output_file, output_format, self.export_meta())
+        if not stats.total_rows:
+            print("No output data to save")
+            return stats
+        
+        self.report_output(output_file, stats)
+        return stats
+    
+    def export_meta(self):
+        """Header fields of a JSON bundle export"""
+        return {
+            'source': os.path.basename(self.source_name),
+            'transformer_version': TRANSFORMER_VERSION
+        }
+    
+    def report_output(self, output_file, stats):
+        """Print output summary and validation from writer stats"""
         print(f"Saved output to {output_file}")
-        print(f"Output shape: {output_df.shape}")
+        print(f"Output shape: ({stats.total_rows}, {len(OUTPUT_COLUMNS)})")
         
         # Validation
         print("\n=== VALIDATION ===")
-        question_rows = output_df[output_df['QUESTION'].notna()]
-        intent_rows = output_df[output_df['INTENT_NAME'].notna()]
-        print(f"Question rows: {len(question_rows)}")
-        print(f"Intent rows: {len(intent_rows)}")
-        print(f"Total rows: {len(output_df)}")
+        print(f"Question rows: {stats.question_rows}")
+        print(f"Intent rows: {stats.intent_rows}")
+        print(f"Total rows: {stats.total_rows}")
         
         # Check unique descriptions
-        descriptions = intent_rows['INTENT_DESCRIPTION'].dropna().tolist()
-        unique_descriptions = set(descriptions)
-        if len(descriptions) != len(unique_descriptions):
+        duplicates = stats.duplicate_descriptions
+        if duplicates:
             print("WARNING: Duplicate intent descriptions found!")
-            duplicates = [desc for desc in descriptions if descriptions.count(desc) > 1]
-            print(f"Duplicates: {set(duplicates)}")
+            print(f"Duplicates: {duplicates}")
         else:
             print("✓ All intent descriptions are unique")
+        
+        # Excel cell limit (long turns that append the next question group)
+        for cell in stats.long_cells:
+            where = f"Row {cell['row']} {cell['column']}: {cell['length']} characters"
+            if cell['fits']:
+                print(f"NOTE: {where}, written without whitespace ({cell['written_length']}) to fit Excel's {EXCEL_MAX_CELL_CHARS} limit")
+            else:
+                print(f"WARNING: {where} ({cell['written_length']} compact) exceeds Excel's {EXCEL_MAX_CELL_CHARS} limit and is truncated in the .xlsx (use --format json/ndjson for the full value)")
+
+def run_check(input_file):
+    """--check: lint the input sheet and print its error report. Returns the exit code."""
+    from utils_validate import lint_workbook
+    print(f"=== PRD QC TABLE CHECK ===")
+    print(f"Input: {input_file}")
+    try:
+        report = lint_workbook(input_file)
+    except Exception as e:
+        print(f"Error reading {input_file}: {e}")
+        return 2
+    
+    print(f"Rows: {report['rows']}, question groups: {report['total_questions']}")
+    for error in report['errors']:
+        print(f"  {error}")
+    print(f"Checked in {sum(report['seconds'].values()):.3f}s")
+    if not report['valid']:
+        print(f"✗ {len(report['errors'])} validation errors")
+        return 1
+    print("✓ Sheet is valid")
+    return 0
 
 def main():
     """Main function for command line usage"""
-    if len(sys.argv) < 2:
-        print("Usage: python3 transform_prd_to_template.py input_file.xlsx [output_file.xlsx]")
-        print("Example: python3 transform_prd_to_template.py prd_qc_table.xlsx template_output.xlsx")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Transform a PRD QC table into the template output format",
+        epilog="Example: python3 transform_prd_to_template.py prd_qc_table.xlsx template_output.xlsx"
+    )
+    parser.add_argument('input_file', help="Input PRD QC table (.xlsx)")
+    parser.add_argument('output_file', nargs='?',
+                        help="Output file, .xlsx, .json (bundle) or .ndjson/.jsonl (default: transformed_<input_file>)")
+    parser.add_argument('--format', dest='output_format', choices=OUTPUT_FORMATS,
+                        help="Output format (default: from the output file extension). json/ndjson hold "
+                             "QUESTION/RESPONSE_1 as arrays, skipping Excel entirely")
+    parser.add_argument('--engine', choices=ENGINES, default=DEFAULT_ENGINE,
+                        help=f"Grouping engine (default: {DEFAULT_ENGINE})")
+    parser.add_argument('--json-profile', choices=JSON_PROFILES,
+                        help=f"Layout of QUESTION/RESPONSE_1 JSON: indented or without whitespace "
+                             f"(default: {DEFAULT_JSON_PROFILE} for xlsx, compact for json/ndjson)")
+    parser.add_argument('--turn-index', metavar='DIR',
+                        help="Incremental mode: reuse unchanged turns from the per-document index in DIR")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Convert one large sheet on N processes, sharded at question-group boundaries "
+                             "(0 = CPU count; default: 1, sequential)")
+    parser.add_argument('--check', action='store_true',
+                        help="Only validate the sheet (image names, fallback/silence per question group) "
+                             "without converting it or writing output; exit code 1 if it has errors")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(run_check(args.input_file))
+    if args.workers != 1 and args.turn_index:
+        parser.error("--workers cannot be combined with --turn-index")
+    if args.workers != 1 and args.engine == 'streaming':
+        parser.error("--workers needs the legacy or vectorized engine")
     
-    input_file = sys.argv[1]
-    output_file = sys.argv[2] if len(sys.argv) > 2 else f"transformed_{input_file}"
+    input_file = args.input_file
+    output_file = args.output_file
+    if not output_file:
+        output_file = f"transformed_{input_file}"
+        if args.output_format in ('json', 'ndjson'):
+            output_file = f"{os.path.splitext(output_file)[0]}.{args.output_format}"
+    output_format = args.output_format or output_format_for(output_file)
+    # Structured exports embed the arrays: compact cells are used without re-encoding
+    json_profile = args.json_profile or ('compact' if output_format != 'xlsx' else DEFAULT_JSON_PROFILE)
     
     print(f"=== PRD QC TABLE TRANSFORMER ===")
     print(f"Input: {input_file}")
     print(f"Output: {output_file}")
+    print(f"Engine: {args.engine}")
+    print(f"Format: {output_format}")
+    print(f"JSON profile: {json_profile}")
+    if args.workers != 1:
+        print(f"Workers: {args.workers or os.cpu_count()}")
     
     try:
-        transformer = PRDTableTransformer(input_file)
-        transformer.transform()
-        transformer.save_output(output_file)
+        transformer = PRDTableTransformer(input_file, engine=args.engine, json_profile=json_profile)
+        if args.turn_index:
+            from turn_index import TurnIndexStore, convert_incremental, print_turn_report
+            store = TurnIndexStore(args.turn_index)
+            document_id = os.path.abspath(input_file)
+            _, turns, report = convert_incremental(transformer, store.load(document_id, json_profile))
+            store.save(document_id, turns, json_profile)
+            transformer.save_output(output_file, output_format)
+            print_turn_report(report)
+        elif args.workers != 1:
+            from sharded_convert import transform_sharded
+            transform_sharded(transformer, args.workers or None)
+            transformer.save_output(output_file, output_format)
+        else:
+            transformer.save_output_stream(output_file, output_format)
         
         print("\n=== TRANSFORMATION COMPLETE ===")
         print(f"✓ Successfully transformed {input_file} to {output_file}")
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Incremental re-conversion at question-turn granularity
+Keeps a persisted per-document index of turn fingerprints -> output rows. On the next
+conversion of the same document only turns whose fingerprint changed are recomputed;
+every other turn reuses its stored output rows.
+
+A turn is a question group, the rows up to the next question group, and the next
+question group itself (max-loop intents append it to their RESPONSE_1).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from output_writers import json_default
+from text_objects import DEFAULT_JSON_PROFILE
+from transform_prd_to_template import TRANSFORMER_VERSION
+
+# Seconds between scans for expired index files
+PRUNE_INTERVAL = 3600
+
+
+class TurnIndexStore:
+    """One JSON index file per document under index_dir. With a retention (seconds), indexes of
+    documents not converted for that long are dropped by prune(), run from save() at most once
+    per PRUNE_INTERVAL."""
+
+    def __init__(self, index_dir, version=TRANSFORMER_VERSION, retention=None):
+        self.index_dir = index_dir
+        self.version = version
+        self.retention = retention
+        self._pruned = 0.0
+        os.makedirs(index_dir, exist_ok=True)
+
+    def path_for(self, document_id):
+        name = hashlib.sha256(str(document_id).encode('utf-8')).hexdigest()
+        return os.path.join(self.index_dir, f"{name}.json")
+
+    def load(self, document_id, json_profile=DEFAULT_JSON_PROFILE):
+        """Stored turns of the document ([] if none, unreadable or from another transformer version or JSON profile)"""
+        try:
+            with open(self.path_for(document_id), encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return []
+        if index.get('version') != self.version or index.get('json_profile', DEFAULT_JSON_PROFILE) != json_profile:
+            return []
+        return index.get('turns', [])
+
+    def save(self, document_id, turns, json_profile=DEFAULT_JSON_PROFILE):
+        """Atomically replace the document's index"""
+        path = self.path_for(document_id)
+        fd, staging = tempfile.mkstemp(prefix='.staging-', dir=self.index_dir)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({
+                'document': str(document_id),
+                'version': self.version,
+                'json_profile': json_profile,
+                'turns': turns
+            }, f, ensure_ascii=False, default=json_default)
+        os.replace(staging, path)
+        if self.retention is not None and time.time() - self._pruned > PRUNE_INTERVAL:
+            self.prune()
+
+    def prune(self):
+        """Drop indexes saved longer than retention ago (and staging files left by a crash).
+        Returns how many were removed."""
+        now = self._pruned = time.time()
+        return self._remove(lambda name, path: now - os.path.getmtime(path) > self.retention)
+
+    def clear(self):
+        """Drop every index (not staging files of saves in progress). Returns how many were removed."""
+        return self._remove(lambda name, path: not name.startswith('.staging-'))
+
+    def _remove(self, expired):
+        removed = 0
+        for name in os.listdir(self.index_dir):
+            path = os.path.join(self.index_dir, name)
+            try:
+                if expired(name, path):
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+
+def convert_incremental(transformer, previous_turns):
+    """Transform, reusing output rows of unchanged turns from previous_turns.
+
+    Returns (output_rows, turns, report): turns is the new index content to save,
+    report lists which turns were recomputed.
+    """
+    cached_rows = {turn['fingerprint']: turn['rows'] for turn in previous_turns}
+    previous_fingerprints = [turn['fingerprint'] for turn in previous_turns]
+
+    output_rows = []
+    turns = []
+    changed_turns = []
+    for number, turn in enumerate(transformer.iter_turns()):
+        question_group = turn[0]
+        fingerprint = transformer.turn_fingerprint(*turn)
+        rows = cached_rows.get(fingerprint)
+        if rows is not None:
+            # Reused rows skip the row builders; hooks still see them in output order
+            for row in rows:
+                transformer.run_row_hooks(row)
+        else:
+            rows = list(transformer.process_turn(*turn))
+            if number < len(previous_fingerprints):
+                status = 'changed'
+            else:
+                status = 'added'
+            changed_turns.append({
+                'turn': number,
+                'status': status,
+                'start_row': question_group['start'] if question_group else 0,
+                'output_rows': len(rows)
+            })
+        output_rows.extend(rows)
+        turns.append({'fingerprint': fingerprint, 'rows': rows})
+
+    new_fingerprints = {turn['fingerprint'] for turn in turns}
+    report = {
+        'turns': len(turns),
+        'reused': len(turns) - len(changed_turns),
+        'recomputed': len(changed_turns),
+        'removed': sum(1 for fp in previous_fingerprints if fp not in new_fingerprints),
+        'changed_turns': changed_turns
+    }
+    transformer.output_rows = output_rows
+    return output_rows, turns, report
+
+
+def print_turn_report(report):
+    """Print the turn diff report"""
+    print("\n=== TURN DIFF ===")
+    print(f"Turns: {report['turns']} (reused: {report['reused']}, recomputed: {report['recomputed']}, removed: {report['removed']})")
+    for turn in report['changed_turns']:
+        print(f"  {turn['status']}: turn {turn['turn']} (input row {turn['start_row'] + 2}, {turn['output_rows']} output rows)")
@@ -1,37 +1,52 @@
 import json
+import time
 
-def validate_image_jpg(output_rows):
-    errors = []
-    for i, row in enumerate(output_rows):
-        # Kiểm tra cột QUESTION (nếu có)
-        question_json = row.get('QUESTION')
-        if question_json:
-            try:
-                question_objs = json.loads(question_json)
-                for idx, obj in enumerate(question_objs):
-                    image_name = obj.get('image', '')
-                    if image_name:
-                        if ' ' in image_name:
-                            errors.append(f"Row {i+1} (QUESTION, item {idx+1}): Image name must not contain spaces: {image_name}")
-                        elif not (image_name.lower().endswith('.jpg') or image_name.lower().endswith('.gif')):
-                            errors.append(f"Row {i+1} (QUESTION, item {idx+1}): Image name must end with .jpg or .gif: {image_name}")
-            except Exception:
-                pass
-        # Kiểm tra cột RESPONSE_1 (nếu có)
-        response_json = row.get('RESPONSE_1')
-        if response_json:
+import pandas as pd
+
+from validation_rules import (TEXT_OBJECT_COLUMNS, QUESTION_KEYS, INTENT_KEYS, SHEET_COLUMNS, ValidationFrame,
+                              evaluate, cell_images, text_object_images)
+from sheet_columns import iter_sheet_columns
+
+def check_image_names(text_objects, row_number, column, errors):
+    """Kiểm tra tên image của các text object trong một cell (QUESTION / RESPONSE_1)"""
+    try:
+        for idx, obj in enumerate(text_objects):
+            image_name = obj.get('image', '')
+            if image_name:
+                if ' ' in image_name:
+                    errors.append(f"Row {row_number} ({column}, item {idx+1}): Image name must not contain spaces: {image_name}")
+                elif not (image_name.lower().endswith('.jpg') or image_name.lower().endswith('.gif')):
+                    errors.append(f"Row {row_number} ({column}, item {idx+1}): Image name must end with .jpg or .gif: {image_name}")
+    except Exception:
+        pass
+
+def check_row_images(row, row_number, errors, text_objects=None):
+    """Kiểm tra image của một output row.
+
+    text_objects: {column: list text object} do transformer vừa tạo; cột nào không có
+    thì parse lại chuỗi JSON trong row.
+    """
+    for column in TEXT_OBJECT_COLUMNS:
+        if text_objects and column in text_objects:
+            check_image_names(text_objects[column], row_number, column, errors)
+            continue
+        value = row.get(column)
+        if value:
             try:
-                response_objs = json.loads(response_json)
-                for idx, obj in enumerate(response_objs):
-                    image_name = obj.get('image', '')
-                    if image_name:
-                        if ' ' in image_name:
-                            errors.append(f"Row {i+1} (RESPONSE_1, item {idx+1}): Image name must not contain spaces: {image_name}")
-                        elif not (image_name.lower().endswith('.jpg') or image_name.lower().endswith('.gif')):
-                            errors.append(f"Row {i+1} (RESPONSE_1, item {idx+1}): Image name must end with .jpg or .gif: {image_name}")
+                objs = json.loads(value)
             except Exception:
-                pass
-    return errors 
+                continue
+            check_image_names(objs, row_number, column, errors)
+
+def validation_frame(output_rows):
+    """ValidationFrame của output rows (list dict) hoặc DataFrame"""
+    if isinstance(output_rows, pd.DataFrame):
+        return ValidationFrame(output_rows)
+    return ValidationFrame.from_rows(output_rows)
+
+def validate_image_jpg(output_rows):
+    # Kiểm tra cột QUESTION và RESPONSE_1 (nếu có), rule 'images' của validation_rules
+    return evaluate(validation_frame(output_rows), ['images'])['images']['errors']
 
 def validate_question_intent_pattern(output_rows, debug=False):
     """
@@ -39,7 +54,7 @@ def validate_question_intent_pattern(output_rows, debug=False):
     - Mỗi nhóm Question-Intent_Response phải có đủ cả 'fallback' và 'silence'
     
     Args:
-        output_rows (list): Danh sách các dòng dữ liệu (dict hoặc list)
+        output_rows (list | DataFrame): Danh sách các dòng dữ liệu (dict hoặc list) hoặc DataFrame
         debug (bool): Có in thông tin debug không
     
     Returns:
@@ -60,173 +75,267 @@ def validate_question_intent_pattern(output_rows, debug=False):
         ❌ Question → fast_response → silence (thiếu fallback)
         ❌ Question → fast_response (thiếu cả fallback và silence)
     """
-    errors = []
-    question_details = []
-    n = len(output_rows)
+    list_rows = not isinstance(output_rows, pd.DataFrame) and len(output_rows) and isinstance(output_rows[0], list)
+    if debug or list_rows:
+        # Dòng dạng list và chế độ debug (in từng bước) dùng validator từng dòng
+        validator = QuestionIntentPatternValidator(debug=debug)
+        if debug:
+            print(f"🔍 Bắt đầu validation với {len(output_rows)} dòng dữ liệu")
+        for row in output_rows:
+            validator.add(row)
+        return validator.result()
+    # Dict rows / DataFrame: rule 'pattern' chạy theo cột (mask + groupby theo turn)
+    return evaluate(validation_frame(output_rows), ['pattern'])['pattern']
+
+def question_of(row):
+    """(question_content, question_type) nếu row là Question/Section, ngược lại None"""
+    if isinstance(row, dict):
+        # Kiểm tra nhiều key có thể có
+        for key in QUESTION_KEYS:
+            if row.get(key) is not None and str(row.get(key)).strip():
+                return str(row.get(key)).strip(), key.lower()
+    elif isinstance(row, list) and len(row) > 0:
+        first_col = str(row[0]).strip().lower()
+        if first_col in ['question', 'section']:
+            return (str(row[1]).strip() if len(row) > 1 else 'Unknown'), first_col
+    return None
+
+def intent_of(row):
+    """Intent name nếu row là Intent_Response, ngược lại None"""
+    intent_name = None
+    if isinstance(row, dict):
+        keys = list(row.keys())
+        if len(keys) > 0:
+            first_col_value = str(row.get(keys[0], '')).strip().lower()
+            # Kiểm tra nhiều pattern có thể có
+            if any(pattern in first_col_value for pattern in ['intent_response', 'intent', 'response']):
+                # Tìm intent name trong các cột/key có thể
+                if len(keys) > 1:
+                    intent_name = row.get(keys[1])
+                if not intent_name:
+                    for intent_key in INTENT_KEYS:
+                        if row.get(intent_key):
+                            intent_name = row.get(intent_key)
+                            break
+    elif isinstance(row, list) and len(row) > 0:
+        first_col_value = str(row[0]).strip().lower()
+        if any(pattern in first_col_value for pattern in ['intent_response', 'intent', 'response']):
+            if len(row) > 1:
+                intent_name = row[1]
+    return intent_name
+
+class QuestionIntentPatternValidator:
+    """
+    validate_question_intent_pattern dạng incremental: nhận từng dòng qua add(row)
+    (ví dụ hook của PRDTableTransformer khi build row), kết quả lấy bằng result().
+    """
     
-    if debug:
-        print(f"🔍 Bắt đầu validation với {n} dòng dữ liệu")
+    def __init__(self, debug=False):
+        self.debug = debug
+        self.errors = []
+        self.question_details = []
+        self.rows = 0
+        self._current = None  # question đang thu thập intent
     
-    i = 0
-    while i < n:
-        row = output_rows[i]
+    def add(self, row):
+        self.rows += 1
+        i = self.rows - 1
         
         # ===== BƯỚC 1: Nhận dạng Question/Section =====
-        is_question = False
-        question_content = None
-        question_type = None
-        
-        if isinstance(row, dict):
-            # Kiểm tra nhiều key có thể có
-            for key in ['QUESTION', 'Question', 'question', 'SECTION', 'Section', 'section']:
-                if row.get(key) is not None and str(row.get(key)).strip():
-                    is_question = True
-                    question_content = str(row.get(key)).strip()
-                    question_type = key.lower()
-                    break
-                    
-        elif isinstance(row, list) and len(row) > 0:
-            first_col = str(row[0]).strip().lower()
-            if first_col in ['question', 'section']:
-                is_question = True
-                question_content = str(row[1]).strip() if len(row) > 1 else 'Unknown'
-                question_type = first_col
-        
-        if is_question:
-            if debug:
+        question = question_of(row)
+        if question:
+            self._close()
+            question_content, question_type = question
+            if self.debug:
                 print(f"\n📋 Tìm thấy {question_type} tại dòng {i+1}: '{question_content}'")
-            
-            # ===== BƯỚC 2: Thu thập Intent_Response =====
-            j = i + 1
-            intent_group = []
-            intent_details = []
-            
-            while j < n:
-                next_row = output_rows[j]
-                
-                # Kiểm tra có phải question/section mới không
-                is_next_question = False
-                if isinstance(next_row, dict):
-                    for key in ['QUESTION', 'Question', 'question', 'SECTION', 'Section', 'section']:
-                        if next_row.get(key) is not None and str(next_row.get(key)).strip():
-                            is_next_question = True
-                            break
-                elif isinstance(next_row, list) and len(next_row) > 0:
-                    first_col = str(next_row[0]).strip().lower()
-                    if first_col in ['question', 'section']:
-                        is_next_question = True
-                
-                if is_next_question:
-                    break  # Gặp question/section mới thì dừng
-                
-                # Lấy intent name
-                intent_name = None
-                is_intent_response = False
-                
-                if isinstance(next_row, dict):
-                    keys = list(next_row.keys())
-                    if len(keys) > 0:
-                        first_col_value = str(next_row.get(keys[0], '')).strip().lower()
-                        # Kiểm tra nhiều pattern có thể có
-                        if any(pattern in first_col_value for pattern in ['intent_response', 'intent', 'response']):
-                            is_intent_response = True
-                            # Tìm intent name trong các cột/key có thể
-                            if len(keys) > 1:
-                                intent_name = next_row.get(keys[1])
-                            if not intent_name:
-                                for intent_key in ['Intent', 'INTENT', 'intent', 'Intent_Name', 'INTENT_NAME']:
-                                    if next_row.get(intent_key):
-                                        intent_name = next_row.get(intent_key)
-                                        break
-                                        
-                elif isinstance(next_row, list) and len(next_row) > 0:
-                    first_col_value = str(next_row[0]).strip().lower()
-                    if any(pattern in first_col_value for pattern in ['intent_response', 'intent', 'response']):
-                        is_intent_response = True
-                        if len(next_row) > 1:
-                            intent_name = next_row[1]
-                
-                if is_intent_response and intent_name and str(intent_name).strip():
-                    clean_intent = str(intent_name).strip().lower()
-                    intent_group.append(clean_intent)
-                    intent_details.append({
-                        'row': j + 1,
-                        'intent': clean_intent,
-                        'raw_value': str(intent_name).strip()
-                    })
-                    if debug:
-                        print(f"  ✓ Intent tại dòng {j+1}: '{clean_intent}'")
-                
-                j += 1
-            
-            # ===== BƯỚC 3: Validation =====
-            question_detail = {
+            self._current = {
                 'row': i + 1,
                 'question': question_content,
                 'type': question_type,
-                'intents': intent_group.copy(),
-                'intent_details': intent_details.copy(),
-                'is_valid': True,
-                'missing': [],
-                'has_intents': len(intent_group) > 0
+                'intents': [],
+                'intent_details': []
             }
+            return
+        
+        if self._current is None:
+            return
+        
+        # ===== BƯỚC 2: Thu thập Intent_Response =====
+        intent_name = intent_of(row)
+        if intent_name and str(intent_name).strip():
+            clean_intent = str(intent_name).strip().lower()
+            self._current['intents'].append(clean_intent)
+            self._current['intent_details'].append({
+                'row': i + 1,
+                'intent': clean_intent,
+                'raw_value': str(intent_name).strip()
+            })
+            if self.debug:
+                print(f"  ✓ Intent tại dòng {i+1}: '{clean_intent}'")
+    
+    def _close(self):
+        """BƯỚC 3: Validation của question đang mở"""
+        current, self._current = self._current, None
+        if current is None:
+            return
+        intent_group = current['intents']
+        question_type = current['type']
+        question_detail = {
+            'row': current['row'],
+            'question': current['question'],
+            'type': question_type,
+            'intents': intent_group.copy(),
+            'intent_details': current['intent_details'].copy(),
+            'is_valid': True,
+            'missing': [],
+            'has_intents': len(intent_group) > 0
+        }
+        
+        # Chỉ kiểm tra khi có ít nhất 1 intent
+        if intent_group:
+            intent_set = set(intent_group)
             
-            # Chỉ kiểm tra khi có ít nhất 1 intent
-            if intent_group:
-                intent_set = set(intent_group)
+            # Kiểm tra thiếu fallback và silence
+            missing = []
+            if 'fallback' not in intent_set:
+                missing.append('fallback')
+            if 'silence' not in intent_set:
+                missing.append('silence')
+            
+            if missing:
+                question_detail['is_valid'] = False
+                question_detail['missing'] = missing
                 
-                # Kiểm tra thiếu fallback và silence
-                missing = []
-                if 'fallback' not in intent_set:
-                    missing.append('fallback')
-                if 'silence' not in intent_set:
-                    missing.append('silence')
+                # Tạo thông báo lỗi chi tiết
+                error_msg = (
+                    f"❌ {question_type.title()} '{current['question']}' tại dòng {current['row']} "
+                    f"thiếu: {', '.join(missing)} "
+                    f"(có: {', '.join(sorted(intent_group))})"
+                )
+                self.errors.append(error_msg)
                 
-                if missing:
-                    question_detail['is_valid'] = False
-                    question_detail['missing'] = missing
-                    
-                    # Tạo thông báo lỗi chi tiết
-                    error_msg = (
-                        f"❌ {question_type.title()} '{question_content}' tại dòng {i+1} "
-                        f"thiếu: {', '.join(missing)} "
-                        f"(có: {', '.join(sorted(intent_group))})"
-                    )
-                    errors.append(error_msg)
-                    
-                    if debug:
-                        print(f"  ❌ KHÔNG HỢP LỆ - Thiếu: {', '.join(missing)}")
-                else:
-                    if debug:
-                        print(f"  ✅ HỢP LỆ - Có đủ fallback và silence")
+                if self.debug:
+                    print(f"  ❌ KHÔNG HỢP LỆ - Thiếu: {', '.join(missing)}")
             else:
-                if debug:
-                    print(f"  ⚠️  Không có Intent nào - Bỏ qua kiểm tra")
-            
-            question_details.append(question_detail)
+                if self.debug:
+                    print(f"  ✅ HỢP LỆ - Có đủ fallback và silence")
+        else:
+            if self.debug:
+                print(f"  ⚠️  Không có Intent nào - Bỏ qua kiểm tra")
+        
+        self.question_details.append(question_detail)
+    
+    def result(self):
+        """Kết quả validation (giống validate_question_intent_pattern)"""
+        self._close()
+        errors = self.errors
+        question_details = self.question_details
+        
+        # ===== BƯỚC 4: Tổng kết =====
+        total_questions = len(question_details)
+        valid_questions = sum(1 for q in question_details if q['is_valid'])
+        
+        result = {
+            'errors': errors,
+            'total_questions': total_questions,
+            'valid_questions': valid_questions,
+            'invalid_questions': total_questions - valid_questions,
+            'question_details': question_details,
+            'success_rate': valid_questions / total_questions * 100 if total_questions > 0 else 100
+        }
         
-        i += 1
+        if self.debug:
+            print(f"\n📊 KẾT QUA TỔNG KẾT:")
+            print(f"   • Tổng questions: {total_questions}")
+            print(f"   • Hợp lệ: {valid_questions}")
+            print(f"   • Không hợp lệ: {total_questions - valid_questions}")
+            print(f"   • Tỷ lệ thành công: {result['success_rate']:.1f}%")
+            print(f"   • Tổng lỗi: {len(errors)}")
+        
+        return result
+
+class OutputRowValidator:
+    """
+    Hook cho PRDTableTransformer.row_hooks: gom output row và image của text object có sẵn
+    (không json.loads lại) khi mỗi row được build; các rule của validation_rules chạy một
+    lần trên toàn bộ cột khi lấy kết quả. Dòng question/intent được nhận theo layout row của
+    transformer (ValidationFrame.from_output_rows): key đầu tiên QUESTION là None ở dòng intent,
+    nên không nhận dạng theo key đầu tiên như validate_question_intent_pattern.
+    """
     
-    # ===== BƯỚC 4: Tổng kết =====
-    total_questions = len(question_details)
-    valid_questions = sum(1 for q in question_details if q['is_valid'])
+    def __init__(self):
+        self.rows = []
+        self.images = []
+        # Thời gian (giây) của từng validator, cho metrics
+        self.seconds = {'validate_images': 0.0, 'validate_pattern': 0.0}
+        self._frame = None
+        self._results = {}
     
-    result = {
-        'errors': errors,
-        'total_questions': total_questions,
-        'valid_questions': valid_questions,
-        'invalid_questions': total_questions - valid_questions,
-        'question_details': question_details,
-        'success_rate': valid_questions / total_questions * 100 if total_questions > 0 else 100
-    }
+    def __call__(self, row, text_objects=None):
+        started = time.perf_counter()
+        self.rows.append(row)
+        row_number = len(self.rows)
+        for column in TEXT_OBJECT_COLUMNS:
+            if text_objects and column in text_objects:
+                self.images.extend(text_object_images(text_objects[column], row_number, column))
+            elif row.get(column):
+                self.images.extend(cell_images(row[column], row_number, column))
+        self.seconds['validate_images'] += time.perf_counter() - started
+    
+    def _result(self, name):
+        if name not in self._results:
+            if self._frame is None:
+                started = time.perf_counter()
+                self._frame = ValidationFrame.from_output_rows(self.rows, self.images)
+                self.seconds[f'validate_{name}'] += time.perf_counter() - started
+            self._results.update(evaluate(self._frame, [name], self.seconds))
+        return self._results[name]
     
-    if debug:
-        print(f"\n📊 KẾT QUA TỔNG KẾT:")
-        print(f"   • Tổng questions: {total_questions}")
-        print(f"   • Hợp lệ: {valid_questions}")
-        print(f"   • Không hợp lệ: {total_questions - valid_questions}")
-        print(f"   • Tỷ lệ thành công: {result['success_rate']:.1f}%")
-        print(f"   • Tổng lỗi: {len(errors)}")
+    @property
+    def image_errors(self):
+        return self._result('images')['errors']
     
-    return result
+    def pattern_result(self):
+        return self._result('pattern')
 
+def lint_workbook(input_file):
+    """
+    Kiểm tra nhanh file input (path hoặc file object .xlsx) mà không convert và không tạo file output:
+    chỉ đọc các cột SHEET_COLUMNS (Section, Intent, Image) rồi chạy rule 'images' (tên ảnh) và
+    'pattern' (mỗi question group phải có fallback và silence). Số dòng trong lỗi là số dòng của sheet.
+    
+    Returns:
+        dict: {'valid', 'errors', 'structure_errors', 'image_errors', 'pattern_errors',
+               'invalid_questions', 'rows', 'total_questions', 'success_rate', 'seconds'}
+    """
+    seconds = {}
+    started = time.perf_counter()
+    sheet_rows = list(iter_sheet_columns(input_file, SHEET_COLUMNS))
+    # Dòng Intent_Response không có Intent làm transformer báo lỗi
+    structure_errors = [
+        f"Row {number}: Intent_Response row has no Intent"
+        for number, row in sheet_rows
+        if row.get('Section') == 'Intent_Response' and pd.isna(row.get('Intent'))
+    ]
+    frame = ValidationFrame.from_sheet_rows(sheet_rows)
+    seconds['read'] = time.perf_counter() - started
+    
+    results = evaluate(frame, seconds=seconds)
+    image_errors = results['images']['errors']
+    pattern = results['pattern']
+    errors = structure_errors + image_errors + pattern['errors']
+    return {
+        'valid': not errors,
+        'errors': errors,
+        'structure_errors': structure_errors,
+        'image_errors': image_errors,
+        'pattern_errors': pattern['errors'],
+        'invalid_questions': [
+            {'row': q['row'], 'question': q['question'], 'missing': q['missing']}
+            for q in pattern['question_details'] if not q['is_valid']
+        ],
+        'rows': len(sheet_rows),
+        'total_questions': pattern['total_questions'],
+        'success_rate': pattern['success_rate'],
+        'seconds': seconds
+    }
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Rule-based validation of output rows, evaluated column-wise
+The values the rules look at are extracted once into a ValidationFrame: question and
+intent of every row with a turn id (a turn starts at each Question row), and one row per
+image of the QUESTION/RESPONSE_1 text objects. Rules are registered once with
+@register_rule and evaluated with pandas masks and groupby over turn ids, instead of
+probing several candidate keys of every row dict.
+
+Rows are recognized like utils_validate.question_of/intent_of recognize dict rows, so the
+results (errors, question_details, success_rate) are the same.
+"""
+
+import json
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+TEXT_OBJECT_COLUMNS = ('QUESTION', 'RESPONSE_1')
+# Input sheet columns the rules need when linting a workbook (ValidationFrame.from_sheet_rows)
+SHEET_COLUMNS = ['Section', 'Intent', 'Image']
+QUESTION_KEYS = ['QUESTION', 'Question', 'question', 'SECTION', 'Section', 'section']
+INTENT_KEYS = ['Intent', 'INTENT', 'intent', 'Intent_Name', 'INTENT_NAME']
+# Transformer output columns the rules need (ValidationFrame.from_output_rows)
+OUTPUT_ROW_COLUMNS = ['QUESTION', 'INTENT_NAME', 'RESPONSE_1']
+
+# Every question with intents needs both of these
+REQUIRED_INTENTS = ('fallback', 'silence')
+IMAGE_EXTENSIONS = ('.jpg', '.gif')
+# A row is an Intent_Response row if its first column contains one of these
+INTENT_ROW_PATTERNS = ('intent_response', 'intent', 'response')
+
+IMAGE_COLUMNS = ['row', 'column', 'position', 'item', 'image']
+# Only cells with an image that may fail the rule need to be parsed: a non-empty "image"
+# string with a space or an escape in it, or without a .jpg/.gif ending
+SUSPECT_IMAGE_PATTERN = re.compile(r'"image"\s*:\s*"(?:[^"\\]*[ \\]|(?!")(?![^"\\]*\.(?:jpg|gif)"))', re.IGNORECASE)
+
+
+class Rule:
+    """A registered validation rule: check(frame) returns a dict with at least 'errors'"""
+
+    def __init__(self, name, description, check):
+        self.name = name
+        self.description = description
+        self.check = check
+
+    def __call__(self, frame):
+        return self.check(frame)
+
+
+# name -> Rule, in registration order
+RULES = {}
+
+
+def register_rule(name, description):
+    """Decorator registering check(frame) as the rule `name`"""
+    def decorator(check):
+        RULES[name] = Rule(name, description, check)
+        return check
+    return decorator
+
+
+def _truthy(values):
+    """Element-wise bool(value), with None/NaN as False"""
+    return values.notna() & values.astype(bool)
+
+
+def _empty(index):
+    return pd.Series(None, index=index, dtype=object)
+
+
+def cell_images(value, row, column):
+    """(row, column, position, item, image) for each text object image in a JSON cell,
+    read like check_image_names reads them (stops at the first item it cannot read)"""
+    if not value:
+        return []
+    try:
+        objects = json.loads(value)
+    except Exception:
+        return []
+    return text_object_images(objects, row, column)
+
+
+def text_object_images(objects, row, column):
+    """(row, column, position, item, image) for each non-empty image of a list of text objects"""
+    position = TEXT_OBJECT_COLUMNS.index(column)
+    images = []
+    try:
+        for item, obj in enumerate(objects, 1):
+            image = obj.get('image', '')
+            if image:
+                if not isinstance(image, str):
+                    break
+                images.append((row, column, position, item, image))
+    except Exception:
+        pass
+    return images
+
+
+class ValidationFrame:
+    """Columns the rules evaluate: rows (row, turn, question, question_type, intent, intent_raw)
+    and images (row, column, position, item, image)"""
+
+    def __init__(self, data, images=None, rows=None, kinds=None, names=None, nan_is_blank=True):
+        # Row numbers are positions (1-based)
+        self.data = data if data.index.equals(pd.RangeIndex(len(data))) else data.reset_index(drop=True)
+        self._images = images
+        self._rows = rows
+        # Each row's first and second value (row kind, intent name); the first two columns by default
+        self._kinds = kinds
+        self._names = names
+        # NaN is a blank cell in a DataFrame; in row dicts it is a value, as question_of/intent_of see it
+        # (a NaN question counts as 'nan', a NaN intent name is kept), and only None is blank
+        self._nan_is_blank = nan_is_blank
+
+    def _present(self, values):
+        """Values question_of takes as set (before stripping)"""
+        return values.notna() if self._nan_is_blank else pd.Series(values.to_numpy() != None, index=values.index)
+
+    def _true(self, values):
+        """Element-wise truth of values as intent_of tests them"""
+        return _truthy(values) if self._nan_is_blank else values.astype(bool)
+
+    @classmethod
+    def from_rows(cls, output_rows, images=None):
+        """From output row dicts, which need not share keys or key order: like intent_of, the row
+        kind and intent name are each row's own first and second values.
+        images: already collected (row, column, position, item, image) tuples, else read from the JSON cells."""
+        present = set().union(*output_rows)
+        wanted = [key for key in QUESTION_KEYS + INTENT_KEYS + list(TEXT_OBJECT_COLUMNS) if key in present]
+        index = pd.RangeIndex(len(output_rows))
+        data = pd.DataFrame({key: [row.get(key) for row in output_rows] for key in wanted}, index=index, dtype=object)
+        kinds, names = [], []
+        for row in output_rows:
+            values = iter(row.values())
+            kinds.append(next(values, None))
+            names.append(next(values, None))
+        return cls(data, images, kinds=pd.Series(kinds, index=index, dtype=object),
+                   names=pd.Series(names, index=index, dtype=object), nan_is_blank=False)
+
+    @classmethod
+    def from_output_rows(cls, output_rows, images=None):
+        """From PRDTableTransformer output rows. Their first value is QUESTION, which is None on
+        intent rows, so the row kind is taken from the transformer's row layout instead: a question
+        group's row has a QUESTION, an intent row has none and names its intent in INTENT_NAME."""
+        index = pd.RangeIndex(len(output_rows))
+        data = pd.DataFrame({key: [row.get(key) for row in output_rows] for key in OUTPUT_ROW_COLUMNS},
+                            index=index, dtype=object)
+        kinds = pd.Series(np.where(data['QUESTION'].isna(), 'Intent_Response', 'Question'), index=index, dtype=object)
+        return cls(data, images, kinds=kinds, names=data['INTENT_NAME'], nan_is_blank=False)
+
+    @classmethod
+    def from_sheet_rows(cls, sheet_rows):
+        """From (sheet row number, {column: value}) pairs of an input sheet (SHEET_COLUMNS), without
+        converting it: each question group stands for its output question row (named by its Intent),
+        each Intent_Response row for an intent row, and the Image cells for the text object images.
+        Row numbers in the results are sheet row numbers."""
+        numbers, sections, intents, images = [], [], [], []
+        for number, row in sheet_rows:
+            numbers.append(number)
+            sections.append(row.get('Section'))
+            intents.append(row.get('Intent'))
+            image = row.get('Image')
+            if isinstance(image, str) and image:
+                images.append((number, 'Image', 0, 1, image))
+
+        section = pd.Series(sections, dtype=object)
+        intent = pd.Series(intents, dtype=object)
+        names = intent.astype(str).str.strip()
+        named = (_truthy(intent) & (names != '')).to_numpy()
+        is_question = (section == 'Question').to_numpy()
+        group_start = is_question & ~np.concatenate(([False], is_question[:-1]))
+        is_intent = (section == 'Intent_Response').to_numpy() & named
+
+        rows = pd.DataFrame({
+            'row': np.array(numbers, dtype=np.int64),
+            'turn': np.cumsum(group_start),
+            'question': np.where(group_start, np.where(named, names, 'Question'), None),
+            'question_type': np.where(group_start, 'question', None),
+            'intent': np.where(is_intent, names.str.lower(), None),
+            'intent_raw': np.where(is_intent, names, None)
+        })
+        return cls(pd.DataFrame(index=pd.RangeIndex(len(rows))), images, rows)
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self._rows = self._build_rows()
+        return self._rows
+
+    @property
+    def images(self):
+        if not isinstance(self._images, pd.DataFrame):
+            if self._images is None:
+                self._images = self._read_images()
+            self._images = pd.DataFrame(self._images, columns=IMAGE_COLUMNS)
+        return self._images
+
+    def _read_images(self):
+        images = []
+        for column in TEXT_OBJECT_COLUMNS:
+            if column not in self.data.columns:
+                continue
+            cells = self.data[column]
+            cells = cells[_truthy(cells)]
+            cells = cells[cells.astype(str).str.contains(SUSPECT_IMAGE_PATTERN, regex=True)]
+            for row, value in zip(cells.index + 1, cells):
+                images.extend(cell_images(value, row, column))
+        # Row order, QUESTION before RESPONSE_1, then item order (like validate_image_jpg reports them)
+        images.sort(key=lambda image: (image[0], image[2], image[3]))
+        return images
+
+    def _build_rows(self):
+        data = self.data
+        index = data.index
+
+        # Question/Section rows: the first of QUESTION_KEYS with a non-blank value. Values are
+        # converted with str() like question_of/intent_of do (astype(str) keeps NaN missing)
+        question = _empty(index)
+        question_type = _empty(index)
+        for key in reversed([key for key in QUESTION_KEYS if key in data.columns]):
+            values = data[key]
+            text = values[self._present(values)].map(str).str.strip()
+            text = text[text != '']
+            question[text.index] = text
+            question_type[text.index] = key.lower()
+        is_question = question.notna()
+
+        # Intent_Response rows: the first column names the row kind, the second (or INTENT_KEYS) the intent
+        intent_raw = _empty(index)
+        kinds, names = self._kinds, self._names
+        if kinds is None and len(data.columns):
+            kinds = data.iloc[:, 0]
+            names = data.iloc[:, 1] if len(data.columns) > 1 else None
+        if kinds is not None:
+            kind = kinds[~is_question].map(str).str.strip().str.lower()
+            candidates = kind.index[kind.str.contains('|'.join(INTENT_ROW_PATTERNS), regex=True)]
+            names = names[candidates] if names is not None else _empty(candidates)
+            fallback = _empty(candidates)
+            for key in reversed([key for key in INTENT_KEYS if key in data.columns]):
+                values = data.loc[candidates, key]
+                fallback = fallback.mask(self._true(values), values)
+            names = names.where(self._true(names), fallback)
+            names = names[self._true(names)].map(str).str.strip()
+            names = names[names != '']
+            intent_raw[names.index] = names
+
+        return pd.DataFrame({
+            'row': np.arange(1, len(index) + 1),
+            'turn': is_question.cumsum().to_numpy(),
+            'question': question.to_numpy(),
+            'question_type': question_type.to_numpy(),
+            'intent': intent_raw.str.lower().to_numpy(),
+            'intent_raw': intent_raw.to_numpy()
+        })
+
+
+@register_rule('images', "Image names have no spaces and end with .jpg or .gif")
+def check_images(frame):
+    images = frame.images
+    if images.empty:
+        return {'errors': []}
+    image = images['image']
+    has_space = image.str.contains(' ', regex=False)
+    bad_extension = ~image.str.lower().str.endswith(IMAGE_EXTENSIONS)
+    failed = (has_space | bad_extension).to_numpy()
+    reason = np.where(has_space, 'Image name must not contain spaces: ', 'Image name must end with .jpg or .gif: ')
+    messages = ('Row ' + images['row'].astype(str) + ' (' + images['column'] + ', item '
+                + images['item'].astype(str) + '): ' + reason + image)
+    return {'errors': messages[failed].tolist()}
+
+
+@register_rule('pattern', "Every question with intents has fallback and silence")
+def check_question_intents(frame):
+    rows = frame.rows
+    questions = rows[rows['question'].notna()]
+    intents = rows[rows['intent'].notna() & (rows['turn'] > 0)]
+
+    by_turn = intents.groupby('turn', sort=False)
+    intent_lists = by_turn['intent'].agg(list).to_dict()
+    missing_masks = {
+        name: ~intents['intent'].eq(name).groupby(intents['turn']).any().reindex(questions['turn'], fill_value=False)
+        for name in REQUIRED_INTENTS
+    }
+    details_by_turn = {}
+    for turn, row, intent, raw in zip(intents['turn'], intents['row'], intents['intent'], intents['intent_raw']):
+        details_by_turn.setdefault(turn, []).append({'row': int(row), 'intent': intent, 'raw_value': raw})
+
+    errors = []
+    question_details = []
+    missing_rows = zip(*(missing_masks[name].to_numpy() for name in REQUIRED_INTENTS))
+    for turn, row, content, kind, missing_flags in zip(questions['turn'], questions['row'], questions['question'],
+                                                       questions['question_type'], missing_rows):
+        intent_group = intent_lists.get(turn, [])
+        # Only questions with at least one intent are checked
+        missing = [name for name, flag in zip(REQUIRED_INTENTS, missing_flags) if flag] if intent_group else []
+        question_details.append({
+            'row': int(row),
+            'question': content,
+            'type': kind,
+            'intents': list(intent_group),
+            'intent_details': details_by_turn.get(turn, []),
+            'is_valid': not missing,
+            'missing': missing,
+            'has_intents': len(intent_group) > 0
+        })
+        if missing:
+            errors.append(
+                f"❌ {kind.title()} '{content}' tại dòng {row} "
+                f"thiếu: {', '.join(missing)} "
+                f"(có: {', '.join(sorted(intent_group))})"
+            )
+
+    total_questions = len(question_details)
+    valid_questions = total_questions - sum(1 for q in question_details if not q['is_valid'])
+    return {
+        'errors': errors,
+        'total_questions': total_questions,
+        'valid_questions': valid_questions,
+        'invalid_questions': total_questions - valid_questions,
+        'question_details': question_details,
+        'success_rate': valid_questions / total_questions * 100 if total_questions > 0 else 100
+    }
+
+
+def evaluate(frame, names=None, seconds=None):
+    """Run the named rules (all registered rules by default). Returns {name: result}.
+    seconds: optional dict accumulating the time of each rule under 'validate_<name>'."""
+    results = {}
+    for name in names or list(RULES):
+        started = time.perf_counter()
+        results[name] = RULES[name](frame)
+        if seconds is not None:
+            stage = f'validate_{name}'
+            seconds[stage] = seconds.get(stage, 0.0) + time.perf_counter() - started
+    return results